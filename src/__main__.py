@@ -1,7 +1,9 @@
 import asyncio
 import logging
+import os
 
 from katunog.api import (
+    BatchQuery,
     InstrumentById,
     InstrumentDescriptions,
     InstrumentList,
@@ -10,6 +12,11 @@ from katunog.api import (
     ProvinceList,
     RegionAndIslandList,
 )
+from katunog.cache import ResponseCache
+from katunog.client import KatunogClient
+from katunog.metrics import MetricsRegistry
+from utils.audio import AudioAnalyzer
+from utils.sample_store import SampleStore
 from utils.unzipper import Unzipper
 
 # Configure logging
@@ -18,37 +25,69 @@ logger = logging.getLogger(__name__)
 
 
 async def main():
-    try:
-        instrument_list = await InstrumentList(ssl=False).get_data(page=1, limit=1)
-        df = InstrumentList().to_dataframe(instrument_list)
-        logger.info(f"Instrument List: {df}")
+    cache = ResponseCache(".katunog_cache.sqlite")
+    metrics = MetricsRegistry()
+    async with KatunogClient(ssl=False, cache=cache, metrics=metrics) as client:
+        try:
+            # One round-trip for every endpoint, the three queries over the same page share one selection
+            batch = BatchQuery(ssl=False, client=client)
+            batch.add(InstrumentList(), page=1, limit=1)
+            batch.add(InstrumentLocation(), page=1, limit=1)
+            batch.add(InstrumentDescriptions(), page=1, limit=1)
+            batch.add(InstrumentMediaFiles(), page=1, limit=1)
+            batch.add(InstrumentById(), instrument_id="SW5zdHJ1bWVudFR5cGU6MjY1MA==")
+            batch.add(RegionAndIslandList())
+            batch.add(ProvinceList())
+            (
+                instrument_list,
+                instrument_location,
+                instrument_descriptions,
+                instrument_media_files,
+                instrument_by_id,
+                region_and_island_list,
+                province_list,
+            ) = await batch.get_data()
 
-        instrument_location = await InstrumentLocation(ssl=False).get_data(page=1, limit=1)
-        logger.info(f"Instrument Location: {instrument_location}")
+            df = InstrumentList().to_dataframe(instrument_list)
+            logger.info(f"Instrument List: {df}")
+            logger.info(f"Instrument Location: {instrument_location}")
+            logger.info(f"Instrument Descriptions: {instrument_descriptions}")
+            logger.info(f"Instrument Media Files: {instrument_media_files}")
+            logger.info(f"Instrument By ID: {instrument_by_id}")
+            logger.info(f"Region and Island List: {region_and_island_list}")
+            logger.info(f"Province List: {province_list}")
 
-        instrument_descriptions = await InstrumentDescriptions(ssl=False).get_data(page=1, limit=1)
-        logger.info(f"Instrument Descriptions: {instrument_descriptions}")
+        except Exception as e:
+            logger.error(f"An error occurred: {e}")
 
-        instrument_media_files = await InstrumentMediaFiles(ssl=False).get_data(page=1, limit=1)
-        logger.info(f"Instrument Media Files: {instrument_media_files}")
+        # Download samples as the page streams in, each archive is unzipped as soon as it lands while the others
+        # keep downloading
+        with Unzipper("samples", "unzipped", num_workers=os.cpu_count() or 1, metrics=metrics) as unzipper:
+            await InstrumentMediaFiles(ssl=False, client=client).download_files(
+                page=1,
+                limit=1000,
+                folder="samples",
+                on_downloaded=lambda job, data: unzipper.submit(job.file_path, data),
+                stream=True,
+            )
 
-        instrument_by_id = await InstrumentById(ssl=False).get_data(instrument_id="SW5zdHJ1bWVudFR5cGU6MjY1MA==")
-        logger.info(f"Instrument By ID: {instrument_by_id}")
+        # localName -> ID of every instrument, projected down to the two fields to join the audio features on
+        instrument_ids = {
+            instrument["localName"]: instrument["id"]
+            async for instrument in InstrumentList(ssl=False, client=client).iter_all(fields=("id", "localName"))
+            if instrument.get("localName")
+        }
 
-        region_and_island_list = await RegionAndIslandList(ssl=False).get_data()
-        logger.info(f"Region and Island List: {region_and_island_list}")
+    cache.close()
 
-        province_list = await ProvinceList(ssl=False).get_data()
-        logger.info(f"Province List: {province_list}")
-
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-
-    # Download samples
-    await InstrumentMediaFiles(ssl=False).download_files(page=1, limit=1000)
-
-    # Unzip samples
-    Unzipper("samples", "unzipped").unzip_files()
+    # Catch up on archives from earlier runs, the ledger skips everything already extracted
+    Unzipper("samples", "unzipped", num_workers=os.cpu_count() or 1, metrics=metrics).unzip_files()
+    # Profile the recordings on every core, only new or changed files are decoded
+    features = AudioAnalyzer("unzipped", instrument_ids=instrument_ids, metrics=metrics).analyze()
+    logger.info(f"Audio features: {features}")
+    # Consolidate the loose files into memory-mapped segments for random access, when anything was extracted
+    SampleStore.update("unzipped", "packed", instrument_ids=instrument_ids).close()
+    logger.info(f"Metrics:\n{metrics.to_prometheus()}")
 
 
 if __name__ == "__main__":
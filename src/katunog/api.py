@@ -1,305 +1,886 @@
 from abc import ABC, abstractmethod
 import asyncio
+import concurrent.futures
+from contextlib import asynccontextmanager
+import hashlib
 import logging
 import os
 import re
-from typing import Any, Dict, Union
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import aiohttp
 import pandas as pd
 
+from .client import RETRYABLE_ERRORS, KatunogClient
+from .manifest import DownloadManifest, file_digest
+from .media import MediaStore
+from .query import BatchRoots, QueryPart, compile_aliased_query, compile_batch, compile_query, project, selection_tree
+from .scheduler import DownloadJob, DownloadScheduler, ProgressCallback
+from .stream import ObjectStream
+from .writer import AsyncFileWriter
+
+# May return a `concurrent.futures.Future`, e.g. `Unzipper.submit`'s, that fails when the archive was not consumed
+DownloadedCallback = Callable[[DownloadJob, Optional[bytes]], Any]
+PageResult = TypeVar("PageResult")
+
 
 class KatunogAPI(ABC):
     """Base class for Katunog API.
     This class is an abstract class that defines the basic structure of the API.
+    Endpoints that can be sent in a `BatchQuery` declare `query_part`, what `get_data` selects for the same arguments.
     """
 
     BASE_URL = "https://katunog.asti.dost.gov.ph"
     API_URL = f"{BASE_URL}/api/"
     HEADERS = {"Content-Type": "application/json"}
+    # Types of the GraphQL variables, non-null so they also fit arguments the schema declares nullable
+    VARIABLE_TYPES = {"page": "Int!", "limit": "Int!", "filter": "String!", "id": "ID!"}
 
-    def __init__(self, ssl: bool = True):
+    def __init__(self, ssl: bool = True, client: Optional[KatunogClient] = None):
         self.ssl = ssl
+        self.client = client
 
     @abstractmethod
     async def get_data(self, *args, **kwargs):
         pass
 
-    async def _post_request(self, query: str) -> Dict[Any, Any]:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.API_URL, headers=self.HEADERS, json={"query": query}, ssl=self.ssl
-            ) as response:
-                return await response.json()
+    def compile(self, part: QueryPart) -> str:
+        variables = tuple((name, self.VARIABLE_TYPES[name]) for name, _ in part.arguments)
+        return compile_query(type(self).__name__, part.field, part.fields, variables)
+
+    async def _fetch(self, part: QueryPart) -> Dict[Any, Any]:
+        return await self._post_request(self.compile(part), part.variables)
+
+    @asynccontextmanager
+    async def _client_context(self) -> AsyncIterator[KatunogClient]:
+        """Yield the shared client if one was given, otherwise a short-lived one for this call."""
+        if self.client is not None:
+            yield self.client
+        else:
+            async with KatunogClient(ssl=self.ssl) as client:
+                yield client
+
+    async def _post_request(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[Any, Any]:
+        cache = self.client.cache if self.client is not None else None
+        metrics = self.client.metrics if self.client is not None else None
+        endpoint = type(self).__name__
+        if cache is not None:
+            # SQLite and zlib block, so they run off the event loop
+            cached = await asyncio.to_thread(cache.get, endpoint, query, variables)
+            if cached is not None:
+                if metrics is not None:
+                    metrics.increment("katunog_cache_hits_total", endpoint=endpoint)
+                return cached
 
+        payload: Dict[str, Any] = {"query": query}
+        if variables:
+            payload["variables"] = variables
+        started = time.monotonic()
+        async with self._client_context() as client:
+            response = await client.post_json(self.API_URL, payload, self.HEADERS, ssl=self.ssl)
+        if metrics is not None:
+            metrics.observe("katunog_request_seconds", time.monotonic() - started, endpoint=endpoint)
 
-class InstrumentList(KatunogAPI):
+        if cache is not None and isinstance(response, dict) and not response.get("errors"):
+            await asyncio.to_thread(cache.set, endpoint, query, response, variables)
+        return response
+
+    async def _stream_request(
+        self, query: str, variables: Optional[Dict[str, Any]], stream: ObjectStream
+    ) -> AsyncIterator[Any]:
+        """Yield the elements of the array at `stream.path` while the response body is still arriving.
+        Streamed responses bypass the cache, `stream.envelope` holds the rest of the response afterwards.
+        """
+        metrics = self.client.metrics if self.client is not None else None
+        payload: Dict[str, Any] = {"query": query}
+        if variables:
+            payload["variables"] = variables
+        started = time.monotonic()
+        async with self._client_context() as client:
+            async with client.request("post", self.API_URL, headers=self.HEADERS, json=payload, ssl=self.ssl) as r:
+                r.raise_for_status()
+                async for chunk in r.content.iter_any():
+                    for element in stream.feed(chunk):
+                        yield element
+        stream.close()
+        if metrics is not None:
+            metrics.observe("katunog_request_seconds", time.monotonic() - started, endpoint=type(self).__name__)
+
+
+class PaginatedAPI(KatunogAPI):
+    """Base class for endpoints backed by the paginated `instruments(page:, limit:)` query.
+    Subclasses declare the instrument fields they select by default as dotted paths in `FIELDS`.
+    """
+
+    PAGE_FIELDS = ("page", "pages", "hasNext", "hasPrev")
+    FIELDS: Tuple[str, ...] = ("id",)
+
+    def query_part(
+        self, page: int = 1, limit: int = 10, *, fields: Optional[Sequence[str]] = None, **arguments
+    ) -> QueryPart:
+        objects = tuple(f"objects.{field}" for field in (fields or self.FIELDS))
+        return QueryPart(
+            "instruments", self.PAGE_FIELDS + objects, (("page", page), ("limit", limit), *arguments.items())
+        )
+
+    async def get_data(self, page: int = 1, limit: int = 10, *, fields: Optional[Sequence[str]] = None):
+        """Fetch one page, selecting only `fields` of every instrument when given."""
+        return await self._fetch(self.query_part(page, limit, fields=fields))
+
+    async def stream_data(
+        self, page: int = 1, limit: int = 10, stream: Optional[ObjectStream] = None, **kwargs
+    ) -> AsyncIterator[Dict[Any, Any]]:
+        """Yield the instruments of one page one by one as they are parsed, instead of decoding the page whole.
+        Pass an `ObjectStream` to read the page's other fields from its `envelope` once the iteration ends.
+        """
+        part = self.query_part(page=page, limit=limit, **kwargs)
+        async for instrument in self._stream_request(self.compile(part), part.variables, stream or ObjectStream()):
+            yield instrument
+
+    @staticmethod
+    def _instruments(data: Dict[Any, Any]) -> Dict[Any, Any]:
+        return (data.get("data") or {}).get("instruments") or {}
+
+    async def iter_pages(self, limit: int = 100, window: int = 4, **kwargs) -> AsyncIterator[Dict[Any, Any]]:
+        """Yield every page response, fetching up to `window` pages concurrently.
+        The number of pages is read from the first response, pages after it are yielded as they arrive.
+        """
+
+        async def fetch(page: int) -> Dict[Any, Any]:
+            return await self.get_data(page=page, limit=limit, **kwargs)
+
+        async for data in _windowed_pages(fetch, lambda first: self._instruments(first).get("pages") or 1, window):
+            yield data
+
+    async def iter_all(
+        self, limit: int = 100, window: int = 4, stream: bool = False, **kwargs
+    ) -> AsyncIterator[Dict[Any, Any]]:
+        """Yield every instrument object across all pages, in arrival order.
+        With `stream`, pages are parsed incrementally and instruments are yielded before their page has finished.
+        """
+        if stream:
+            async for instrument in self._stream_all(limit, window, **kwargs):
+                yield instrument
+            return
+        async for page in self.iter_pages(limit=limit, window=window, **kwargs):
+            for instrument in self._instruments(page).get("objects") or []:
+                yield instrument
+
+    async def _stream_all(self, limit: int, window: int, **kwargs) -> AsyncIterator[Dict[Any, Any]]:
+        first = ObjectStream()
+        async for instrument in self.stream_data(page=1, limit=limit, stream=first, **kwargs):
+            yield instrument
+
+        # The other pages stream through `window` workers into a bounded queue, which keeps memory flat
+        pages = iter(range(2, (self._instruments(first.envelope or {}).get("pages") or 1) + 1))
+        queue: asyncio.Queue = asyncio.Queue(maxsize=limit)
+        done = object()
+
+        async def worker():
+            try:
+                for page in pages:
+                    async for instrument in self.stream_data(page=page, limit=limit, **kwargs):
+                        await queue.put(instrument)
+            except Exception as e:
+                await queue.put(e)
+            await queue.put(done)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(window)]
+        try:
+            finished = 0
+            while finished < len(workers):
+                item = await queue.get()
+                if item is done:
+                    finished += 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in workers:
+                task.cancel()
+
+
+class InstrumentList(PaginatedAPI):
     """Get the list of musical instrument"""
 
-    async def get_data(self, page: int = 1, limit: int = 10, filter: str = "katunog"):
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}, filter: "{filter}") {{
-                page, pages, hasNext, hasPrev, objects {{
-                    id,
-                    controlNumber,
-                    localName,
-                    englishName,
-                    alternateName,
-                    thumbnail,
-                    province {{ name }},
-                    city {{ name }},
-                    ethnolinguistic {{ name }},
-                    hornbostel {{ name }},
-                    length,
-                    width,
-                    height,
-                    dimensionUnit,
-                    diameter,
-                    diameterUnit,
-                    english {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }},
-                    filipino {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }},
-                    lastUpdated,
-                    mediaUploadOngoing,
-                    isReported,
-                    fileSet {{
-                        edges {{
-                            node {{
-                                name,
-                                size,
-                                caption,
-                                fileType,
-                                isPublic,
-                                uploadDone,
-                                path,
-                                isBackground,
-                                number
-                            }}
-                        }}
-                    }}
-                }}
-            }}
-        }}
+    FIELDS = (
+        "id",
+        "controlNumber",
+        "localName",
+        "englishName",
+        "alternateName",
+        "thumbnail",
+        "province.name",
+        "city.name",
+        "ethnolinguistic.name",
+        "hornbostel.name",
+        "length",
+        "width",
+        "height",
+        "dimensionUnit",
+        "diameter",
+        "diameterUnit",
+        "english.generalDescription",
+        "english.materialAndMake",
+        "english.playingParts",
+        "english.otherDetails",
+        "filipino.generalDescription",
+        "filipino.materialAndMake",
+        "filipino.playingParts",
+        "filipino.otherDetails",
+        "lastUpdated",
+        "mediaUploadOngoing",
+        "isReported",
+        "fileSet.edges.node.name",
+        "fileSet.edges.node.size",
+        "fileSet.edges.node.caption",
+        "fileSet.edges.node.fileType",
+        "fileSet.edges.node.isPublic",
+        "fileSet.edges.node.uploadDone",
+        "fileSet.edges.node.path",
+        "fileSet.edges.node.isBackground",
+        "fileSet.edges.node.number",
+    )
+
+    def query_part(
+        self,
+        page: int = 1,
+        limit: int = 10,
+        filter: str = "katunog",
+        *,
+        fields: Optional[Sequence[str]] = None,
+        **arguments,
+    ) -> QueryPart:
+        return super().query_part(page, limit, fields=fields, filter=filter, **arguments)
+
+    async def get_data(
+        self, page: int = 1, limit: int = 10, filter: str = "katunog", *, fields: Optional[Sequence[str]] = None
+    ):
+        return await self._fetch(self.query_part(page, limit, filter, fields=fields))
+
+    # Dataframe column -> path of the value inside an instrument object
+    COLUMNS: Dict[str, Tuple[str, ...]] = {
+        "Instrument": ("localName",),
+        "Ethnolinguistic Group": ("ethnolinguistic", "name"),
+        "Location": (),
+        "English Name": ("englishName",),
+        "Materials and Make Classification": ("english", "materialAndMake"),
+        "Hornbostel": ("hornbostel", "name"),
+        "ID": ("id",),
+        "Control Number": ("controlNumber",),
+        "Alternate Name": ("alternateName",),
+        "City": ("city", "name"),
+        "Province": ("province", "name"),
+        "Last Updated": ("lastUpdated",),
+    }
+    DEFAULT_COLUMNS = (
+        "Instrument",
+        "Ethnolinguistic Group",
+        "Location",
+        "English Name",
+        "Materials and Make Classification",
+        "Hornbostel",
+    )
+    CATEGORICAL_COLUMNS = {"Ethnolinguistic Group", "Location", "Hornbostel", "City", "Province"}
+
+    @classmethod
+    def fields_for(cls, columns: Sequence[str]) -> Tuple[str, ...]:
+        """The fields `to_dataframe` reads for `columns`, to request nothing more than the dataframe needs."""
+        paths: List[Tuple[str, ...]] = []
+        for column in columns:
+            paths.extend([("city", "name"), ("province", "name")] if column == "Location" else [cls.COLUMNS[column]])
+        return tuple(dict.fromkeys(".".join(path) for path in paths))
+
+    def to_dataframe(
+        self,
+        instrument_data: Union[Dict[Any, Any], Iterable[Dict[Any, Any]]],
+        columns: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Build a dataframe from one page response or an iterable of page responses.
+        Values are collected column by column and repetitive columns are stored as categoricals.
         """
-        return await self._post_request(query)
+        pages = [instrument_data] if isinstance(instrument_data, dict) else instrument_data
+        builder = _ColumnBuilder(self.COLUMNS, columns or self.DEFAULT_COLUMNS)
+        for page in pages:
+            builder.add(self._instruments(page).get("objects") or [])
+        return builder.build(self.CATEGORICAL_COLUMNS)
 
-    def to_dataframe(self, instrument_data: Dict[Any, Any]):
-        items = instrument_data.get("data", {}).get("instruments", {}).get("objects", [])
-        instruments_list = []
+    async def fetch_dataframe(
+        self, limit: int = 100, window: int = 4, columns: Optional[Sequence[str]] = None, **kwargs
+    ) -> pd.DataFrame:
+        """Fetch every page and convert it as it arrives, without keeping the raw pages around.
+        Only the fields of the selected columns are requested unless `fields` is given.
+        """
+        builder = _ColumnBuilder(self.COLUMNS, columns or self.DEFAULT_COLUMNS)
+        kwargs.setdefault("fields", self.fields_for(builder.columns))
+        async for page in self.iter_pages(limit=limit, window=window, **kwargs):
+            builder.add(self._instruments(page).get("objects") or [])
+        return builder.build(self.CATEGORICAL_COLUMNS)
 
-        for item in items:
-            city = item.get("city", {})
-            province = item.get("province", {})
-            english = item.get("english", {})
-            hornbostel = item.get("hornbostel", {})
-
-            city_name = city.get("name", "") if city else ""
-            province_name = province.get("name", "") if province else ""
-            material_and_make = english.get("materialAndMake", "") if english else ""
-            hornbostel_name = hornbostel.get("name", "") if hornbostel else ""
-
-            instrument = {
-                "Instrument": item.get("localName", ""),
-                "Ethnolinguistic Group": item.get("ethnolinguistic", {}).get("name", ""),
-                "Location": f"{city_name}, {province_name}",
-                "English Name": item.get("englishName", ""),
-                "Materials and Make Classification": material_and_make,
-                "Hornbostel": hornbostel_name,
-            }
-            instruments_list.append(instrument)
-
-        df = pd.DataFrame(
-            instruments_list,
-            columns=[
-                "Instrument",
-                "Ethnolinguistic Group",
-                "Location",
-                "English Name",
-                "Materials and Make Classification",
-                "Horbostel",
-            ],
+
+class _ColumnBuilder:
+    """Accumulates instrument objects into one list per selected column."""
+
+    def __init__(self, paths: Dict[str, Tuple[str, ...]], columns: Sequence[str]):
+        unknown = [column for column in columns if column not in paths]
+        if unknown:
+            raise ValueError(f"Unknown columns: {unknown}, expected any of {list(paths)}")
+        self.columns = list(columns)
+        self.paths = {column: paths[column] for column in columns}
+        self.values: Dict[str, List[str]] = {column: [] for column in columns}
+
+    def add(self, objects: List[Dict[Any, Any]]):
+        for column, path in self.paths.items():
+            if column == "Location":
+                cities = _pluck(objects, ("city", "name"))
+                provinces = _pluck(objects, ("province", "name"))
+                self.values[column].extend(f"{city}, {province}" for city, province in zip(cities, provinces))
+            else:
+                self.values[column].extend(_pluck(objects, path))
+
+    def build(self, categorical: Set[str]) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                column: pd.Categorical(values) if column in categorical else values
+                for column, values in self.values.items()
+            },
+            columns=self.columns,
         )
 
-        return df
 
+def _pluck(objects: List[Dict[Any, Any]], path: Tuple[str, ...]) -> List[str]:
+    """Values at `path` for every object, with missing or null values as empty strings."""
+    values: List[Any] = objects
+    for key in path:
+        values = [value.get(key) if value else None for value in values]
+    return ["" if value is None else value for value in values]
 
-class InstrumentLocation(KatunogAPI):
+
+class InstrumentLocation(PaginatedAPI):
     """Get the location of instrument like island, region, province, city."""
 
-    async def get_data(self, page: int = 1, limit: int = 10):
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}) {{
-                page,
-                pages,
-                hasNext,
-                hasPrev,
-                objects {{
-                    id,
-                    province {{
-                        name,
-                        region {{
-                            name,
-                            island {{ name }}
-                        }}
-                    }}
-                }}
-            }}
-        }}
-        """
-        return await self._post_request(query)
+    FIELDS = ("id", "province.name", "province.region.name", "province.region.island.name")
 
 
-class InstrumentDescriptions(KatunogAPI):
+class InstrumentDescriptions(PaginatedAPI):
     """Get the description of musical instrument in English and Filipino"""
 
-    async def get_data(self, page: int = 1, limit: int = 10):
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}) {{
-                page,
-                pages,
-                hasNext,
-                hasPrev,
-                objects {{
-                    id,
-                    english {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }},
-                    filipino {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }}
-                }}
-            }}
-        }}
-        """
-        return await self._post_request(query)
+    FIELDS = (
+        "id",
+        "english.generalDescription",
+        "english.materialAndMake",
+        "english.playingParts",
+        "english.otherDetails",
+        "filipino.generalDescription",
+        "filipino.materialAndMake",
+        "filipino.playingParts",
+        "filipino.otherDetails",
+    )
 
 
-class InstrumentMediaFiles(KatunogAPI):
+class InstrumentMediaFiles(PaginatedAPI):
     """Get the available files of the instrument like images, audios and videos"""
 
-    async def get_data(self, page: int = 1, limit: int = 10):
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}) {{
-                page,
-                pages,
-                hasNext,
-                hasPrev,
-                objects {{
-                    id,
-                    localName,
-                    fileSet {{
-                        edges {{
-                            node {{
-                                name,
-                                size,
-                                caption,
-                                fileType,
-                                isPublic,
-                                uploadDone,
-                                path,
-                                isBackground,
-                                number
-                            }}
-                        }}
-                    }}
-                }}
-            }}
-        }}
-        """
-        return await self._post_request(query)
+    _resolver: Optional["InstrumentResolver"] = None
+
+    @property
+    def resolver(self) -> "InstrumentResolver":
+        if self._resolver is None:
+            self._resolver = InstrumentResolver(ssl=self.ssl, client=self.client)
+        return self._resolver
+
+    FIELDS = (
+        "id",
+        "localName",
+        "fileSet.edges.node.name",
+        "fileSet.edges.node.size",
+        "fileSet.edges.node.caption",
+        "fileSet.edges.node.fileType",
+        "fileSet.edges.node.isPublic",
+        "fileSet.edges.node.uploadDone",
+        "fileSet.edges.node.path",
+        "fileSet.edges.node.isBackground",
+        "fileSet.edges.node.number",
+    )
 
     async def download_files(
-        self, page: int = 1, limit: int = 10, folder: str = "downloads", file_type: str = "audio", num_threads: int = 5
+        self,
+        page: int = 1,
+        limit: int = 10,
+        folder: str = "downloads",
+        file_type: Union[str, Sequence[str]] = "audio",
+        num_threads: int = 5,
+        on_progress: Optional[ProgressCallback] = None,
+        on_downloaded: Optional[DownloadedCallback] = None,
+        keep_archives: bool = True,
+        stream: bool = False,
+        media_store: Optional[MediaStore] = None,
     ):
+        """Download the archives of one page of instruments, of one or several file types.
+        With `stream`, downloads are queued as each instrument is parsed instead of after the whole page arrived.
+        """
+        instruments: Union[List[Dict[Any, Any]], AsyncIterator[Dict[Any, Any]]]
+        if stream:
+            instruments = self.stream_data(page, limit)
+        else:
+            data = await self.get_data(page, limit)
+            instruments = data.get("data", {}).get("instruments", {}).get("objects", [])
+        await self.download_instruments(
+            instruments,
+            folder,
+            file_type,
+            num_threads,
+            on_progress,
+            on_downloaded=on_downloaded,
+            keep_archives=keep_archives,
+            media_store=media_store,
+        )
+
+    async def download_instruments(
+        self,
+        instruments: Union[List[Dict[Any, Any]], AsyncIterator[Dict[Any, Any]]],
+        folder: str = "downloads",
+        file_type: Union[str, Sequence[str]] = "audio",
+        num_threads: int = 5,
+        on_progress: Optional[ProgressCallback] = None,
+        refresh: bool = False,
+        on_downloaded: Optional[DownloadedCallback] = None,
+        keep_archives: bool = True,
+        media_store: Optional[MediaStore] = None,
+    ):
+        """Download the media archives of the given instruments through a pool of `num_threads` workers.
+        Instruments that already carry their localName start downloading while the others are still being resolved.
+        `instruments` may also be an async iterator, e.g. from `stream_data`, whose instruments are queued as they come.
+        With `refresh`, archives are fetched again even if the manifest has them complete.
+        `on_downloaded` is called with each finished job as soon as it lands, e.g. to hand it to an extraction pool
+        while the other downloads continue. Without `keep_archives` the archive is only kept in memory and passed to
+        `on_downloaded` as bytes instead of being written to the folder.
+        `file_type` may name several types, e.g. `("audio", "image", "video")`, to mirror them all in one run. Types
+        an instrument's `fileSet` does not list are skipped and smaller archives are downloaded first.
+        Archives are named `<localName>.<download ID>.<file type>.zip` so instruments sharing a local name do not
+        collide. With a `media_store`, every archive is added to it, and archives whose files it already holds are
+        not downloaded.
+        """
+        file_types = (file_type,) if isinstance(file_type, str) else tuple(dict.fromkeys(file_type))
         # Ensure the folder exists
         os.makedirs(folder, exist_ok=True)
 
-        # Get existing list of instruments in the folder
-        existing_files = os.listdir(folder)
+        # Archives that finished in a previous run are recorded in the folder's manifest
+        manifest = DownloadManifest(folder)
+        processed_instruments: Set[str] = set()
 
-        data = await self.get_data(page, limit)
-        instruments = data.get("data", {}).get("instruments", {}).get("objects", [])
+        # For a list, the missing names are resolved in the background right away. Those of a stream are only
+        # known once it ends and are resolved then
+        unnamed: List[Dict[Any, Any]] = []
+        unnamed_ids = _unnamed_ids(instruments) if isinstance(instruments, list) else []
 
-        processed_instruments = set()
+        async with self._client_context() as client:
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for instrument in instruments:
-                file_set = instrument.get("fileSet", {}).get("edges", [])
-                instrument_id = instrument.get("id")
-                instrument_name = (
-                    (await InstrumentById(ssl=self.ssl).get_data(instrument_id))
-                    .get("data", {})
-                    .get("instrument", {})
-                    .get("localName")
-                )
+            async def download(job: DownloadJob, progress: Callable[[int, Optional[int]], None]):
+                await self._download_job(client, job, progress, manifest, on_downloaded, keep_archives, media_store)
+
+            resolving = asyncio.ensure_future(self.resolver.resolve(unnamed_ids)) if unnamed_ids else None
+            # A stream holds its request open, and with it a concurrency slot the downloads may need, until it is
+            # read to the end, so its jobs go into an unbounded queue rather than wait for room
+            queue_size = None if isinstance(instruments, list) else 0
+            try:
+                async with DownloadScheduler(
+                    download,
+                    num_workers=num_threads,
+                    queue_size=queue_size,
+                    on_progress=on_progress,
+                    metrics=client.metrics,
+                ) as scheduler:
+                    # Jobs known together, those of a list or of the resolved instruments, are submitted smallest
+                    # first once all are known. Those of a stream are submitted as they come
+                    known: List[DownloadJob] = []
 
-                for file_info in file_set:
-                    node = file_info.get("node", {})
-                    file_path = node.get("path")
-
-                    # Extract instrument download ID from the file path
-                    instrument_download_id = self.extract_instrument_download_id(file_path)
-                    if not instrument_download_id:
-                        logging.error(f"Failed to extract instrument ID from path: {file_path}")
-                        continue
-
-                    # Skip if this instrument has already been processed
-                    if instrument_download_id in processed_instruments:
-                        continue
-                    logging.info(f"Extracted ID: {instrument_download_id} for {instrument_name}")
-                    processed_instruments.add(instrument_download_id)
-
-                    download_url = f"{self.BASE_URL}/instruments/download_all_files?instrument_id={instrument_download_id}&file_type={file_type}"  # noqa: E501
-                    logging.info(f"Downloading {instrument_name} from {download_url}")
-
-                    # Create a task for downloading the file
-                    file_name = f"{instrument_name}.zip"
-                    exists = file_name in existing_files
-                    if not exists:
-                        tasks.append(
-                            self.download_file(session, download_url, os.path.join(folder, file_name), instrument_name)
+                    async def collect(job: DownloadJob):
+                        known.append(job)
+
+                    submit = collect if isinstance(instruments, list) else scheduler.submit
+                    async for instrument in _aiter(instruments):
+                        if not instrument.get("localName"):
+                            unnamed.append(instrument)
+                            continue
+                        await self._schedule_instrument(
+                            submit,
+                            instrument,
+                            instrument["localName"],
+                            folder,
+                            file_types,
+                            manifest,
+                            processed_instruments,
+                            refresh,
+                            media_store,
                         )
-                    else:
-                        logging.info(f"{instrument_name} already exists in {folder}")
-
-                    # Limit the number of concurrent tasks
-                    if len(tasks) >= num_threads:
-                        await asyncio.gather(*tasks)
-                        tasks = []
-
-            # Run any remaining tasks
-            if tasks:
-                await asyncio.gather(*tasks)
-
-    async def download_file(self, session: aiohttp.ClientSession, url: str, file_path: str, instrument_name: str):
-        async with session.get(url, ssl=self.ssl) as response:
-            if response.status == 200:
-                with open(file_path, "wb") as f:
-                    async for chunk in response.content.iter_chunked(1024):
-                        f.write(chunk)
-                logging.info(f"Downloaded {instrument_name} to {file_path}")
+
+                    await scheduler.submit_all(known)
+                    known.clear()
+
+                    if resolving is not None:
+                        await resolving
+                    resolved = await self.resolver.resolve(_unnamed_ids(unnamed)) if unnamed else {}
+                    for instrument in unnamed:
+                        instrument_id = instrument.get("id")
+                        if not instrument_id:
+                            logging.error("Skipping an instrument that has neither a localName nor an ID")
+                            continue
+                        instrument_name = (resolved.get(instrument_id) or {}).get("localName")
+                        await self._schedule_instrument(
+                            collect,
+                            instrument,
+                            instrument_name,
+                            folder,
+                            file_types,
+                            manifest,
+                            processed_instruments,
+                            refresh,
+                            media_store,
+                        )
+                    await scheduler.submit_all(known)
+            finally:
+                if resolving is not None and not resolving.done():
+                    resolving.cancel()
+
+    async def _download_job(
+        self,
+        client: KatunogClient,
+        job: DownloadJob,
+        progress: Callable[[int, Optional[int]], None],
+        manifest: DownloadManifest,
+        on_downloaded: Optional[DownloadedCallback],
+        keep_archives: bool,
+        media_store: Optional[MediaStore] = None,
+    ):
+        """Run one download, retrying transfers that break mid-body. Archives on disk resume from their part file."""
+        for attempt in range(1, client.retry.max_attempts + 1):
+            try:
+                if keep_archives:
+                    downloaded = await self.download_file(
+                        client, job.url, job.file_path, job.instrument_name, progress=progress, manifest=manifest
+                    )
+                    data = None
+                else:
+                    data = await self.download_to_buffer(
+                        client, job.url, job.file_path, job.instrument_name, progress=progress, manifest=manifest
+                    )
+                    downloaded = data is not None
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == client.retry.max_attempts:
+                    raise
+                delay = client.retry.delay(attempt)
+                logging.warning(f"Download of {job.instrument_name} broke off ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        # The scheduler counts the job as failed and reports the error in its progress
+        if not downloaded:
+            raise RuntimeError(f"Download of {job.instrument_name} from {job.url} did not complete")
+        if media_store is not None:
+            view = os.path.splitext(os.path.basename(job.file_path))[0]
+            await asyncio.to_thread(media_store.add_archive, view, data if data is not None else job.file_path)
+        consumed = on_downloaded(job, data) if on_downloaded is not None else None
+        if data is not None:
+            self._confirm_in_memory(manifest, job, consumed)
+
+    @staticmethod
+    def _confirm_in_memory(manifest: DownloadManifest, job: DownloadJob, consumed: Any):
+        """An archive kept only in memory is complete once its consumer has it. When `on_downloaded` returned a
+        future that is when the future succeeds, so an archive whose extraction failed is downloaded again.
+        """
+        file_name = os.path.basename(job.file_path)
+        if not isinstance(consumed, concurrent.futures.Future):
+            manifest.confirm(file_name)
+            return
+
+        def done(future: concurrent.futures.Future):
+            if not future.cancelled() and future.exception() is None:
+                manifest.confirm(file_name)
+            else:
+                logging.error(f"{job.instrument_name} was downloaded but not consumed, it will be downloaded again")
+
+        consumed.add_done_callback(done)
+
+    async def _schedule_instrument(
+        self,
+        submit: Callable[[DownloadJob], Awaitable[None]],
+        instrument: Dict[Any, Any],
+        instrument_name: Optional[str],
+        folder: str,
+        file_types: Sequence[str],
+        manifest: DownloadManifest,
+        processed_instruments: Set[str],
+        refresh: bool = False,
+        media_store: Optional[MediaStore] = None,
+    ):
+        file_set = instrument.get("fileSet", {}).get("edges", [])
+        for file_info in file_set:
+            node = file_info.get("node", {})
+            file_path = node.get("path")
+
+            # Extract instrument download ID from the file path
+            instrument_download_id = self.extract_instrument_download_id(file_path)
+            if not instrument_download_id:
+                logging.error(f"Failed to extract instrument ID from path: {file_path}")
+                continue
+
+            # Skip if this instrument has already been processed
+            if instrument_download_id in processed_instruments:
+                continue
+            logging.info(f"Extracted ID: {instrument_download_id} for {instrument_name}")
+            processed_instruments.add(instrument_download_id)
+
+            for file_type in file_types:
+                nodes = self._archive_nodes(file_set, instrument_download_id, file_type)
+                if nodes:
+                    await self._schedule_archive(
+                        submit,
+                        str(instrument_name),
+                        instrument_download_id,
+                        file_type,
+                        nodes,
+                        folder,
+                        manifest,
+                        refresh,
+                        media_store,
+                    )
+
+    async def _schedule_archive(
+        self,
+        submit: Callable[[DownloadJob], Awaitable[None]],
+        instrument_name: str,
+        instrument_download_id: str,
+        file_type: str,
+        nodes: List[Dict[Any, Any]],
+        folder: str,
+        manifest: DownloadManifest,
+        refresh: bool,
+        media_store: Optional[MediaStore],
+    ):
+        download_url = f"{self.BASE_URL}/instruments/download_all_files?instrument_id={instrument_download_id}&file_type={file_type}"  # noqa: E501
+
+        # The download ID keeps instruments that share a local name from overwriting each other
+        view = self.archive_view(instrument_name, instrument_download_id, file_type)
+        file_name = f"{view}.zip"
+        if not refresh and media_store is not None:
+            if await asyncio.to_thread(media_store.materialize, view, nodes):
+                logging.info(f"Every {file_type} file of {instrument_name} is already in {media_store.folder}")
+                return
+
+        # Queue the download, workers pick it up as soon as one is free, smallest first
+        if refresh or not manifest.is_complete(file_name):
+            sizes = [size for size in (node.get("size") for node in nodes) if isinstance(size, int)]
+            size = sum(sizes) if len(sizes) == len(nodes) else None
+            logging.info(f"Queueing {file_type} of {instrument_name} from {download_url}")
+            await submit(DownloadJob(download_url, os.path.join(folder, file_name), instrument_name, file_type, size))
+        else:
+            logging.info(f"{file_type} of {instrument_name} already exists in {folder}")
+            archive_path = os.path.join(folder, file_name)
+            if media_store is not None and view not in media_store.views and os.path.exists(archive_path):
+                await asyncio.to_thread(media_store.add_archive, view, archive_path)
+
+    @staticmethod
+    def archive_view(instrument_name: str, instrument_download_id: str, file_type: str) -> str:
+        """Name of an archive without its `.zip` extension, also the name of its view in a `MediaStore`."""
+        return f"{instrument_name}.{instrument_download_id}.{file_type}"
+
+    def archive_names(self, instrument: Dict[Any, Any], file_types: Sequence[str]) -> List[str]:
+        """File names of the archives `download_instruments` saves for an instrument, one for each download ID and
+        file type its `fileSet` lists.
+        """
+        file_set = instrument.get("fileSet", {}).get("edges", [])
+        paths = ((edge.get("node") or {}).get("path") or "" for edge in file_set)
+        download_ids = dict.fromkeys(filter(None, map(self.extract_instrument_download_id, paths)))
+        return [
+            f"{self.archive_view(str(instrument.get('localName')), download_id, file_type)}.zip"
+            for download_id in download_ids
+            for file_type in file_types
+            if self._archive_nodes(file_set, download_id, file_type)
+        ]
+
+    def _archive_nodes(
+        self, file_set: List[Dict[Any, Any]], instrument_download_id: str, file_type: str
+    ) -> List[Dict[Any, Any]]:
+        """The `fileSet` nodes an archive holds, those of its download ID and file type.
+        Nodes that do not say their type are counted for every type.
+        """
+        nodes = ((edge.get("node") or {}) for edge in file_set)
+        return [
+            node
+            for node in nodes
+            if str(node.get("fileType") or file_type).lower() == file_type.lower()
+            and self.extract_instrument_download_id(node.get("path") or "") == instrument_download_id
+        ]
+
+    async def download_file(
+        self,
+        session: Union[aiohttp.ClientSession, KatunogClient],
+        url: str,
+        file_path: str,
+        instrument_name: str,
+        progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        manifest: Optional[DownloadManifest] = None,
+    ) -> bool:
+        """Download into `<file_path>.part` and atomically rename it once complete.
+        A leftover part file is resumed with a Range request, guarded by If-Range so a changed archive restarts.
+        """
+        file_name = os.path.basename(file_path)
+        part_path = f"{file_path}.part"
+        offset, headers = self._resume_request(
+            part_path, (manifest.get(file_name) if manifest is not None else None) or {}, instrument_name
+        )
+
+        metrics = session.metrics if isinstance(session, KatunogClient) else None
+        started = time.monotonic()
+        async with _get(session, url, ssl=self.ssl, headers=headers) as response:
+            if metrics is not None:
+                metrics.observe("katunog_download_ttfb_seconds", time.monotonic() - started)
+            if response.status == 416:
+                # The part file does not match the remote archive anymore, start over on the next run
+                os.remove(part_path)
+                logging.error(f"Discarded stale partial download of {instrument_name} at {part_path}")
+                return False
+            if response.status not in (200, 206):
+                logging.error(f"Failed to download {instrument_name} from {url}")
+                return False
+
+            if response.status == 206:
+                logging.info(f"Resuming {instrument_name} from byte {offset}")
+                digest = await asyncio.to_thread(file_digest, part_path)
             else:
+                offset = 0
+                digest = hashlib.sha256()
+
+            last_modified = response.headers.get("Last-Modified")
+            etag = response.headers.get("ETag")
+            total = offset + response.content_length if response.content_length is not None else None
+            if manifest is not None:
+                manifest.record(
+                    file_name,
+                    offset,
+                    None,
+                    last_modified,
+                    etag,
+                    complete=False,
+                    preallocated=bool(response.content_length),
+                )
+
+            # Disk writes and hashing happen on a background thread, preallocated from Content-Length when known
+            bytes_done = offset
+            writer = AsyncFileWriter(
+                part_path,
+                append=bool(offset),
+                preallocate=response.content_length,
+                digest=digest,
+                on_flushed=(
+                    _record_progress(manifest, file_name, offset, last_modified, etag)
+                    if manifest is not None and response.content_length
+                    else None
+                ),
+            )
+            try:
+                async with writer:
+                    async for chunk in response.content.iter_any():
+                        await writer.write(chunk)
+                        bytes_done += len(chunk)
+                        if progress is not None:
+                            progress(bytes_done, total)
+            finally:
+                if manifest is not None and response.content_length:
+                    # The writer trimmed the preallocated part file to what was written, so it can be resumed
+                    manifest.record(file_name, offset + writer.bytes_written, None, last_modified, etag, complete=False)
+
+        if total is not None and bytes_done != total:
+            logging.error(f"Incomplete download of {instrument_name}: {bytes_done} of {total} bytes")
+            return False
+
+        os.replace(part_path, file_path)
+        if manifest is not None:
+            manifest.record(file_name, bytes_done, digest.hexdigest(), last_modified, etag)
+        if metrics is not None:
+            transferred = bytes_done - offset
+            metrics.increment("katunog_download_bytes_total", transferred)
+            metrics.observe("katunog_download_bytes_per_second", transferred / max(time.monotonic() - started, 1e-6))
+        logging.info(f"Downloaded {instrument_name} to {file_path}")
+        return True
+
+    def _resume_request(
+        self, part_path: str, partial: Dict[str, Any], instrument_name: str
+    ) -> Tuple[int, Dict[str, str]]:
+        """Offset to resume a part file from and the Range/If-Range headers to ask for the rest."""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and partial.get("preallocated"):
+            # The process died before trimming the preallocated space, resume from the bytes recorded as written
+            written = min(partial.get("size") or 0, offset)
+            logging.info(f"Resuming {instrument_name} from its last recorded byte {written}, it was not closed cleanly")
+            os.truncate(part_path, written)
+            offset = written
+
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            validator = partial.get("etag") or partial.get("last_modified")
+            if validator:
+                headers["If-Range"] = validator
+        return offset, headers
+
+    async def download_to_buffer(
+        self,
+        session: Union[aiohttp.ClientSession, KatunogClient],
+        url: str,
+        file_path: str,
+        instrument_name: str,
+        progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        manifest: Optional[DownloadManifest] = None,
+    ) -> Optional[bytes]:
+        """Download the archive into memory only, for callers that extract it straight from the buffer.
+        The manifest records it incomplete until `DownloadManifest.confirm` is called for it.
+        """
+        async with _get(session, url, ssl=self.ssl) as response:
+            if response.status != 200:
                 logging.error(f"Failed to download {instrument_name} from {url}")
+                return None
+            total = response.content_length
+            buffer = bytearray()
+            async for chunk in response.content.iter_any():
+                buffer.extend(chunk)
+                if progress is not None:
+                    progress(len(buffer), total)
+
+        if total is not None and len(buffer) != total:
+            logging.error(f"Incomplete download of {instrument_name}: {len(buffer)} of {total} bytes")
+            return None
+
+        data = bytes(buffer)
+        if manifest is not None:
+            manifest.record(
+                os.path.basename(file_path),
+                len(data),
+                hashlib.sha256(data).hexdigest(),
+                response.headers.get("Last-Modified"),
+                response.headers.get("ETag"),
+                complete=False,
+                stored=False,
+            )
+        logging.info(f"Downloaded {instrument_name} into memory")
+        return data
 
     def extract_instrument_download_id(self, path: str) -> Union[str, None]:
         instrument = re.compile(r"PIISD0(\d+)/")
@@ -309,58 +890,221 @@ class InstrumentMediaFiles(KatunogAPI):
         return None
 
 
+async def _aiter(items: Union[Iterable[Any], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+    if isinstance(items, AsyncIterator):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+def _record_progress(
+    manifest: DownloadManifest, file_name: str, offset: int, last_modified: Optional[str], etag: Optional[str]
+) -> Callable[[int], None]:
+    """Record the bytes written to a preallocated part file, whose size says nothing about what arrived."""
+
+    def record(written: int):
+        manifest.record(file_name, offset + written, None, last_modified, etag, complete=False, preallocated=True)
+
+    return record
+
+
+async def _windowed_pages(
+    fetch: Callable[[int], Awaitable[PageResult]], count_pages: Callable[[PageResult], int], window: int
+) -> AsyncIterator[PageResult]:
+    """Yield `fetch(1)`, then every other page up to the count read from it, keeping up to `window` in flight.
+    Pages after the first are yielded as they arrive.
+    """
+    first = await fetch(1)
+    yield first
+
+    pages = count_pages(first)
+    next_page = 2
+    pending: Set[asyncio.Future] = set()
+    try:
+        while next_page <= pages or pending:
+            while next_page <= pages and len(pending) < window:
+                pending.add(asyncio.ensure_future(fetch(next_page)))
+                next_page += 1
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _unnamed_ids(instruments: List[Dict[Any, Any]]) -> List[str]:
+    return [instrument["id"] for instrument in instruments if not instrument.get("localName") and instrument.get("id")]
+
+
+def _get(session: Union[aiohttp.ClientSession, KatunogClient], url: str, **kwargs):
+    """GET through the client's rate limiting and retries when given one, or straight through a plain session."""
+    if isinstance(session, KatunogClient):
+        return session.request("get", url, **kwargs)
+    return session.get(url, **kwargs)
+
+
+class InstrumentVersions(PaginatedAPI):
+    """Get the last update of every instrument, used to detect what changed since the last sync"""
+
+    FIELDS = ("id", "lastUpdated", "mediaUploadOngoing")
+
+
 class InstrumentById(KatunogAPI):
     """Get the specific instrument"""
 
-    async def get_data(self, instrument_id: str):
-        query = f"""
-        {{
-            instrument(id: "{instrument_id}") {{
-                controlNumber,
-                localName,
-                englishName,
-                alternateName,
-                fileSet {{
-                    edges {{
-                        node {{
-                            name,
-                            path
-                        }}
-                    }}
-                }}
-            }}
-        }}
-        """
-        return await self._post_request(query)
+    FIELDS = (
+        "controlNumber",
+        "localName",
+        "englishName",
+        "alternateName",
+        "fileSet.edges.node.name",
+        "fileSet.edges.node.path",
+    )
+
+    def query_part(self, instrument_id: str, fields: Optional[Sequence[str]] = None) -> QueryPart:
+        return QueryPart("instrument", tuple(fields or self.FIELDS), (("id", instrument_id),))
+
+    async def get_data(self, instrument_id: str, fields: Optional[Sequence[str]] = None):
+        return await self._fetch(self.query_part(instrument_id, fields))
+
+
+class InstrumentResolver(KatunogAPI):
+    """Resolve many instruments by ID in batched, aliased queries and memoize the results"""
+
+    FIELDS = ("controlNumber", "localName", "englishName", "alternateName")
+
+    def __init__(
+        self,
+        ssl: bool = True,
+        client: Optional[KatunogClient] = None,
+        batch_size: int = 50,
+        fields: Optional[Iterable[str]] = None,
+    ):
+        super().__init__(ssl=ssl, client=client)
+        self.batch_size = batch_size
+        self.fields = tuple(fields or self.FIELDS)
+        self._memo: Dict[str, Optional[Dict[Any, Any]]] = {}
+
+    def build_query(self, count: int) -> str:
+        """Document resolving `count` instruments, one per `$i<n>` variable."""
+        return compile_aliased_query(
+            type(self).__name__, "instrument", self.fields, "id", self.VARIABLE_TYPES["id"], count
+        )
+
+    async def get_data(self, instrument_ids: List[str]):
+        variables = {f"i{index}": instrument_id for index, instrument_id in enumerate(instrument_ids)}
+        data = (await self._post_request(self.build_query(len(instrument_ids)), variables)).get("data") or {}
+        return {instrument_id: data.get(f"i{index}") for index, instrument_id in enumerate(instrument_ids)}
+
+    async def resolve(self, instrument_ids: Iterable[str]) -> Dict[str, Optional[Dict[Any, Any]]]:
+        """Return the instruments for the given IDs, only querying the ones not seen before."""
+        instrument_ids = list(dict.fromkeys(instrument_ids))
+        missing = [instrument_id for instrument_id in instrument_ids if instrument_id not in self._memo]
+        starts = range(0, len(missing), self.batch_size)
+        batches = (missing[start:end] for start, end in zip(starts, [*starts[1:], len(missing)]))
+        for result in await asyncio.gather(*(self.get_data(batch) for batch in batches)):
+            self._memo.update(result)
+        return {instrument_id: self._memo.get(instrument_id) for instrument_id in instrument_ids}
 
 
 class RegionAndIslandList(KatunogAPI):
     """This endpoint allows users to get the list of the region and island"""
 
-    async def get_data(self):
-        query = """
-        {
-            regions {
-                name
-                island {
-                    name
-                }
-            }
-        }
-        """
-        return await self._post_request(query)
+    FIELDS = ("name", "island.name")
+
+    def query_part(self, fields: Optional[Sequence[str]] = None) -> QueryPart:
+        return QueryPart("regions", tuple(fields or self.FIELDS))
+
+    async def get_data(self, fields: Optional[Sequence[str]] = None):
+        return await self._fetch(self.query_part(fields))
 
 
 class ProvinceList(KatunogAPI):
     """This endpoint will show all the province available in database"""
 
-    async def get_data(self):
-        query = """
-        {
-            provinces {
-                id,
-                name
-            }
-        }
+    FIELDS = ("id", "name")
+
+    def query_part(self, fields: Optional[Sequence[str]] = None) -> QueryPart:
+        return QueryPart("provinces", tuple(fields or self.FIELDS))
+
+    async def get_data(self, fields: Optional[Sequence[str]] = None):
+        return await self._fetch(self.query_part(fields))
+
+
+class BatchQuery(KatunogAPI):
+    """Send the queries of several endpoints as one aliased GraphQL document.
+    Endpoints selecting the same root field with the same arguments, e.g. the same `instruments` page, share one
+    alias with the union of their fields. The response is split back into one result per endpoint, shaped exactly
+    like that endpoint's own `get_data` output.
+    """
+
+    def __init__(self, ssl: bool = True, client: Optional[KatunogClient] = None):
+        super().__init__(ssl=ssl, client=client)
+        self.parts: List[QueryPart] = []
+
+    def add(self, endpoint: KatunogAPI, *args, **kwargs) -> int:
+        """Queue `endpoint.get_data(*args, **kwargs)`, returning the index of its result."""
+        query_part = getattr(endpoint, "query_part", None)
+        if query_part is None:
+            raise TypeError(f"{type(endpoint).__name__} cannot be batched, it does not declare query_part")
+        self.parts.append(query_part(*args, **kwargs))
+        return len(self.parts) - 1
+
+    def build_query(self) -> Tuple[str, Dict[str, Any], List[str]]:
+        """The merged document, its variables and the alias each queued part is answered under."""
+        groups: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], Dict[str, None]] = {}
+        for part in self.parts:
+            groups.setdefault((part.field, part.arguments), {}).update(dict.fromkeys(part.fields))
+
+        aliases = {key: f"q{index}" for index, key in enumerate(groups)}
+        roots: BatchRoots = tuple(
+            (
+                aliases[key],
+                key[0],
+                tuple(fields),
+                tuple((name, f"{aliases[key]}_{name}", self.VARIABLE_TYPES[name]) for name, _ in key[1]),
+            )
+            for key, fields in groups.items()
+        )
+        variables = {f"{aliases[key]}_{name}": value for key in groups for name, value in key[1]}
+        parts = [aliases[(part.field, part.arguments)] for part in self.parts]
+        return compile_batch(type(self).__name__, roots), variables, parts
+
+    async def iter_pages(
+        self, endpoints: Sequence[PaginatedAPI], limit: int = 100, window: int = 4
+    ) -> AsyncIterator[List[Dict[Any, Any]]]:
+        """Walk several paginated endpoints together, one request per page for all of them.
+        Yields, page by page in arrival order, the list of that page's results in the order of `endpoints`.
         """
-        return await self._post_request(query)
+
+        async def fetch(page: int) -> List[Dict[Any, Any]]:
+            batch = BatchQuery(ssl=self.ssl, client=self.client)
+            for endpoint in endpoints:
+                batch.add(endpoint, page=page, limit=limit)
+            return await batch.get_data()
+
+        def count_pages(first: List[Dict[Any, Any]]) -> int:
+            return (PaginatedAPI._instruments(first[0]).get("pages") or 1) if first else 1
+
+        async for results in _windowed_pages(fetch, count_pages, window):
+            yield results
+
+    async def get_data(self) -> List[Dict[Any, Any]]:
+        """Send every queued query in one request and return one result per `add`, in the same order."""
+        if not self.parts:
+            return []
+        query, variables, aliases = self.build_query()
+        response = await self._post_request(query, variables)
+        data = response.get("data") or {}
+        errors = response.get("errors") or []
+        results = []
+        for part, alias in zip(self.parts, aliases):
+            result: Dict[Any, Any] = {"data": {part.field: project(data.get(alias), selection_tree(part.fields))}}
+            part_errors = [error for error in errors if (error.get("path") or [alias])[0] == alias]
+            if part_errors:
+                result["errors"] = part_errors
+            results.append(result)
+        return results
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import zlib
+
+_STRING = re.compile(r'("(?:\\.|[^"\\])*")')
+_WHITESPACE = re.compile(r"\s+")
+_PUNCTUATION = re.compile(r" ?([{}()\[\]:,!=@$]) ?")
+
+
+def normalize_query(query: str) -> str:
+    """Collapse insignificant whitespace so formatting differences map to the same cache key.
+    String literals are kept verbatim.
+    """
+    parts = _STRING.split(query)
+    return "".join(
+        part if index % 2 else _PUNCTUATION.sub(r"\1", _WHITESPACE.sub(" ", part)) for index, part in enumerate(parts)
+    ).strip()
+
+
+class ResponseCache:
+    """SQLite-backed cache of GraphQL responses keyed by the normalized query.
+    Entries are zlib-compressed, expire after a per-endpoint TTL and the least recently used ones are evicted
+    once the store grows past `max_bytes`. Endpoints with a TTL of 0 are not cached.
+    """
+
+    DAY = 24 * 60 * 60
+    # InstrumentVersions is what syncs compare against, so it is never served from the cache
+    DEFAULT_TTLS = {"ProvinceList": 7 * DAY, "RegionAndIslandList": 7 * DAY, "InstrumentVersions": 0}
+
+    def __init__(
+        self,
+        path: str = ".katunog_cache.sqlite",
+        default_ttl: float = 60 * 60,
+        ttls: Optional[Dict[str, float]] = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        compression_level: int = 6,
+    ):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                value BLOB NOT NULL
+            )
+            """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    @staticmethod
+    def key(query: str, variables: Optional[Dict[str, Any]] = None) -> str:
+        payload = normalize_query(query)
+        if variables:
+            payload += json.dumps(variables, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def ttl(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, endpoint: str, query: str, variables: Optional[Dict[str, Any]] = None) -> Optional[Dict[Any, Any]]:
+        if self.ttl(endpoint) <= 0:
+            return None
+        key = self.key(query, variables)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        try:
+            return json.loads(zlib.decompress(row[0]))
+        except (zlib.error, ValueError) as e:
+            logging.error(f"Dropping corrupt cache entry for {endpoint}: {e}")
+            self.invalidate(query, variables)
+            return None
+
+    def set(self, endpoint: str, query: str, response: Dict[Any, Any], variables: Optional[Dict[str, Any]] = None):
+        if self.ttl(endpoint) <= 0:
+            return
+        value = zlib.compress(json.dumps(response, separators=(",", ":")).encode(), self.compression_level)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, expires_at, accessed_at, size, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(query, variables), endpoint, now + self.ttl(endpoint), now, len(value), value),
+            )
+            self._evict(now)
+
+    def invalidate(self, query: str, variables: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (self.key(query, variables),))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self, now: float):
+        self._connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk from the least recently used entry until enough space is freed
+        excess = total - self.max_bytes
+        stale = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+
+class RecentResponses:
+    """Bounded in-process LRU of decoded responses that expire `ttl` seconds after they were stored.
+    It answers bursts of identical lookups without touching the network or the SQLite cache. Values are shared
+    between callers, so they must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
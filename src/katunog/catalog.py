@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from .api import (
+    BatchQuery,
+    InstrumentLocation,
+    InstrumentResolver,
+    InstrumentVersions,
+    ProvinceList,
+    RegionAndIslandList,
+)
+from .client import KatunogClient
+
+Filter = Union[str, Iterable[str]]
+
+
+class InstrumentCatalog:
+    """In-memory catalog of the instruments joined with their province, region and island.
+    Text columns are interned and every indexed dimension maps each value to a bitmap of catalog rows, so a lookup
+    is a dict access and a filtered query is a few integer ANDs however large the catalog is.
+    """
+
+    FIELDS = (
+        "id",
+        "controlNumber",
+        "localName",
+        "englishName",
+        "alternateName",
+        "lastUpdated",
+        "city.name",
+        "province.name",
+        "province.region.name",
+        "province.region.island.name",
+        "ethnolinguistic.name",
+        "hornbostel.name",
+        "fileSet.edges.node.fileType",
+    )
+    TEXT_COLUMNS = ("control_number", "local_name", "english_name", "alternate_name", "city", "last_updated")
+    INDEXES = ("province", "region", "island", "ethnolinguistic", "hornbostel", "file_type")
+    FORMAT_VERSION = 1
+
+    def __init__(self, ssl: bool = True, client: Optional[KatunogClient] = None):
+        self.ssl = ssl
+        self.client = client
+        # Region -> island and every province name, including those without instruments
+        self.regions: Dict[str, Optional[str]] = {}
+        self.provinces: List[str] = []
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._text: Dict[str, List[Optional[str]]] = {column: [] for column in self.TEXT_COLUMNS}
+        self._dimensions: Dict[str, List[Tuple[str, ...]]] = {name: [] for name in self.INDEXES}
+        self._indexes: Dict[str, Dict[str, int]] = {name: {} for name in self.INDEXES}
+        self._live = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, instrument_id: object) -> bool:
+        return instrument_id in self._rows
+
+    async def load(self, limit: int = 100, window: int = 4) -> "InstrumentCatalog":
+        """Fetch the whole catalog and the region and province lists, replacing what was loaded before."""
+        batch = BatchQuery(ssl=self.ssl, client=self.client)
+        batch.add(RegionAndIslandList())
+        batch.add(ProvinceList())
+        regions, provinces = await batch.get_data()
+        self.regions = {
+            region["name"]: (region.get("island") or {}).get("name")
+            for region in (regions.get("data") or {}).get("regions") or []
+            if region.get("name")
+        }
+        self.provinces = [p["name"] for p in (provinces.get("data") or {}).get("provinces") or [] if p.get("name")]
+
+        self._clear()
+        async for instrument in InstrumentLocation(ssl=self.ssl, client=self.client).iter_all(
+            limit=limit, window=window, fields=self.FIELDS
+        ):
+            self.upsert(instrument)
+        logging.info(f"Loaded {len(self)} instruments into the catalog")
+        return self
+
+    async def refresh(self, limit: int = 100, window: int = 4) -> Tuple[List[str], List[str]]:
+        """Re-fetch only the instruments whose `lastUpdated` changed and drop the ones that are gone.
+        Returns the IDs that were updated and the IDs that were removed.
+        """
+        current: Dict[str, Optional[str]] = {}
+        async for instrument in InstrumentVersions(ssl=self.ssl, client=self.client).iter_all(
+            limit=limit, window=window
+        ):
+            current[instrument["id"]] = instrument.get("lastUpdated")
+
+        stale = [
+            instrument_id
+            for instrument_id, last_updated in current.items()
+            if instrument_id not in self._rows or self._text["last_updated"][self._rows[instrument_id]] != last_updated
+        ]
+        removed = [instrument_id for instrument_id in self._rows if instrument_id not in current]
+        resolver = InstrumentResolver(ssl=self.ssl, client=self.client, fields=self.FIELDS[1:])
+        details = await resolver.resolve(stale) if stale else {}
+        for instrument_id, detail in details.items():
+            if detail:
+                self.upsert({**detail, "id": instrument_id})
+        for instrument_id in removed:
+            self.remove(instrument_id)
+        return stale, removed
+
+    def upsert(self, instrument: Dict[Any, Any]):
+        """Add an instrument object, or replace the one with the same ID."""
+        instrument_id = instrument["id"]
+        self.remove(instrument_id)
+
+        province = instrument.get("province") or {}
+        region = province.get("region") or {}
+        island = (region.get("island") or {}).get("name") or self.regions.get(region.get("name") or "")
+        file_types = ((edge.get("node") or {}).get("fileType") for edge in _edges(instrument))
+        text = {
+            "control_number": instrument.get("controlNumber"),
+            "local_name": instrument.get("localName"),
+            "english_name": instrument.get("englishName"),
+            "alternate_name": instrument.get("alternateName"),
+            "city": (instrument.get("city") or {}).get("name"),
+            "last_updated": instrument.get("lastUpdated"),
+        }
+        dimensions = {
+            "province": (province.get("name"),),
+            "region": (region.get("name"),),
+            "island": (island,),
+            "ethnolinguistic": ((instrument.get("ethnolinguistic") or {}).get("name"),),
+            "hornbostel": ((instrument.get("hornbostel") or {}).get("name"),),
+            "file_type": tuple(dict.fromkeys(file_types)),
+        }
+        self._append(instrument_id, text, dimensions)
+
+    def remove(self, instrument_id: str) -> bool:
+        row = self._rows.pop(instrument_id, None)
+        if row is None:
+            return False
+        mask = ~(1 << row)
+        for name in self.INDEXES:
+            index = self._indexes[name]
+            for key in self._dimensions[name][row]:
+                index[key] &= mask
+                if not index[key]:
+                    del index[key]
+        self._live &= mask
+        self._ids[row] = ""
+        return True
+
+    def get(self, instrument_id: str) -> Optional[Dict[str, Any]]:
+        row = self._rows.get(instrument_id)
+        return self._record(row) if row is not None else None
+
+    def values(self, dimension: str) -> List[str]:
+        """Distinct values of an indexed dimension, e.g. every island that has instruments."""
+        return sorted(self._index(dimension))
+
+    def ids(self, **filters: Filter) -> List[str]:
+        """IDs of the instruments matching every filter, each given as one value or any of several values."""
+        return [self._ids[row] for row in _set_bits(self._match(filters))]
+
+    def find(self, **filters: Filter) -> List[Dict[str, Any]]:
+        """Instruments matching the filters, e.g. `find(island="Mindanao", hornbostel="Idiophone")`."""
+        return [self._record(row) for row in _set_bits(self._match(filters))]
+
+    def count(self, **filters: Filter) -> int:
+        return self._match(filters).bit_count()
+
+    def group_by(self, dimension: str, **filters: Filter) -> Dict[str, int]:
+        """Number of matching instruments for each value of `dimension`."""
+        bitmap = self._match(filters)
+        counts = {key: (rows & bitmap).bit_count() for key, rows in self._index(dimension).items()}
+        return {key: count for key, count in sorted(counts.items()) if count}
+
+    def save(self, path: str):
+        """Write the catalog to `path` atomically, leaving out removed rows."""
+        rows = list(_set_bits(self._live))
+        data = {
+            "version": self.FORMAT_VERSION,
+            "regions": self.regions,
+            "provinces": self.provinces,
+            "ids": [self._ids[row] for row in rows],
+            "text": {column: [values[row] for row in rows] for column, values in self._text.items()},
+            "dimensions": {name: [list(values[row]) for row in rows] for name, values in self._dimensions.items()},
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path: str, ssl: bool = True, client: Optional[KatunogClient] = None) -> "InstrumentCatalog":
+        """Load a catalog written by `save`, rebuilding its indexes."""
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported catalog format {data.get('version')} in {path}")
+
+        catalog = cls(ssl=ssl, client=client)
+        catalog.regions = data["regions"]
+        catalog.provinces = data["provinces"]
+        for row, instrument_id in enumerate(data["ids"]):
+            catalog._append(
+                instrument_id,
+                {column: values[row] for column, values in data["text"].items()},
+                {name: values[row] for name, values in data["dimensions"].items()},
+            )
+        return catalog
+
+    def _append(
+        self, instrument_id: str, text: Dict[str, Optional[str]], dimensions: Mapping[str, Iterable[Optional[str]]]
+    ):
+        row = len(self._ids)
+        bit = 1 << row
+        self._ids.append(instrument_id)
+        self._rows[instrument_id] = row
+        for column in self.TEXT_COLUMNS:
+            self._text[column].append(_intern(text.get(column)))
+        for name in self.INDEXES:
+            keys = tuple(sys.intern(key) for key in dimensions.get(name, ()) if key)
+            self._dimensions[name].append(keys)
+            index = self._indexes[name]
+            for key in keys:
+                index[key] = index.get(key, 0) | bit
+        self._live |= bit
+
+    def _clear(self):
+        self._ids.clear()
+        self._rows.clear()
+        self._live = 0
+        for values in self._text.values():
+            values.clear()
+        for name in self.INDEXES:
+            self._dimensions[name].clear()
+            self._indexes[name].clear()
+
+    def _index(self, dimension: str) -> Dict[str, int]:
+        if dimension not in self._indexes:
+            raise ValueError(f"Unknown dimension {dimension!r}, expected any of {list(self.INDEXES)}")
+        return self._indexes[dimension]
+
+    def _match(self, filters: Dict[str, Filter]) -> int:
+        bitmap = self._live
+        for dimension, wanted in filters.items():
+            index = self._index(dimension)
+            keys: Sequence[str] = (wanted,) if isinstance(wanted, str) else tuple(wanted)
+            matched = 0
+            for key in keys:
+                matched |= index.get(key, 0)
+            bitmap &= matched
+            if not bitmap:
+                break
+        return bitmap
+
+    def _record(self, row: int) -> Dict[str, Any]:
+        record: Dict[str, Any] = {"id": self._ids[row]}
+        record.update({column: values[row] for column, values in self._text.items()})
+        for name in self.INDEXES:
+            keys = self._dimensions[name][row]
+            record[name] = list(keys) if name == "file_type" else (keys[0] if keys else None)
+        return record
+
+
+def _set_bits(bitmap: int) -> Iterator[int]:
+    """Row numbers of the set bits, lowest first."""
+    return (row for row, bit in enumerate(bin(bitmap)[:1:-1]) if bit == "1")
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _edges(instrument: Dict[Any, Any]) -> List[Dict[Any, Any]]:
+    return ((instrument.get("fileSet") or {}).get("edges")) or []
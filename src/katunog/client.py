@@ -0,0 +1,200 @@
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+import aiohttp
+
+from .cache import RecentResponses, ResponseCache
+from .metrics import MetricsRegistry
+from .stream import loads
+from .throttle import AdaptiveConcurrency, RetryPolicy, TokenBucket
+
+RETRYABLE_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+
+class KatunogClient:
+    """Shared HTTP client for the Katunog API.
+    Owns a single pooled aiohttp session so that every endpoint reuses kept-alive connections.
+    Requests go through an optional token bucket and adaptive concurrency limit, and failed or throttled requests
+    are retried with jittered exponential backoff.
+    Identical queries that are already in flight share that request, whichever endpoint instance sends them, and
+    with `recent` the responses of the last seconds are answered from memory.
+    """
+
+    def __init__(
+        self,
+        ssl: bool = True,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        ttl_dns_cache: int = 300,
+        keepalive_timeout: float = 60,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        retry: Optional[RetryPolicy] = None,
+        request_timeout: float = 30,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        recent: Optional[RecentResponses] = None,
+        coalesce: bool = True,
+    ):
+        self.ssl = ssl
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.retry = retry or RetryPolicy()
+        self.request_timeout = request_timeout
+        # No total timeout so large downloads can take their time, but a stalled connection or read fails fast
+        self.timeout = timeout or aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+        self.metrics = metrics
+        self.recent = recent
+        self.coalesce = coalesce
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Request key -> the request serving every caller of that query until it completes
+        self._in_flight: Dict[str, "asyncio.Task[Dict[Any, Any]]"] = {}
+
+    async def __aenter__(self) -> "KatunogClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("KatunogClient is not open, use it as an async context manager or call open()")
+        return self._session
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None or self._session.closed
+
+    async def open(self):
+        if self.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            trace_configs = [self.metrics.trace_config()] if self.metrics is not None else None
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout, trace_configs=trace_configs
+            )
+            logging.debug(f"Opened Katunog session (limit={self.limit}, limit_per_host={self.limit_per_host})")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Send a request through the rate limiter and concurrency limit and yield its response.
+        Connection errors, timeouts and retryable statuses are retried until `retry.max_attempts` is reached, after
+        which the last response or error is handed to the caller.
+        """
+        for attempt in range(1, self.retry.max_attempts + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            generation = await self.concurrency.acquire() if self.concurrency is not None else None
+
+            stack = AsyncExitStack()
+            started = time.monotonic()
+            try:
+                async with asyncio.timeout(self.request_timeout):
+                    response = await stack.enter_async_context(getattr(self.session, method)(url, **kwargs))
+            except RETRYABLE_ERRORS as e:
+                await stack.aclose()
+                await self._release(None, generation, failed=True)
+                if attempt == self.retry.max_attempts:
+                    raise
+                delay = self.retry.delay(attempt)
+                self._count_retry(type(e).__name__)
+                logging.warning(f"{method.upper()} {url} failed ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException as e:
+                # Cancelled or failed for good before the response arrived, the slot must not leak
+                await stack.aclose()
+                await self._release(None, generation, failed=not isinstance(e, asyncio.CancelledError))
+                raise
+
+            latency = time.monotonic() - started
+            if self.retry.should_retry(response.status) and attempt < self.retry.max_attempts:
+                delay = self.retry.delay(attempt, response.headers.get("Retry-After"))
+                await stack.aclose()
+                await self._release(latency, generation, failed=True)
+                self._count_retry(str(response.status))
+                logging.warning(f"{method.upper()} {url} returned {response.status}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            try:
+                yield response
+            finally:
+                await stack.aclose()
+                await self._release(latency, generation, failed=self.retry.should_retry(response.status))
+            return
+
+    async def post_json(
+        self, url: str, payload: Dict[str, Any], headers: Dict[str, str], ssl: Union[bool, None] = None
+    ) -> Dict[Any, Any]:
+        """POST a query and decode its JSON response, sharing it with identical queries sent meanwhile."""
+        if not self.coalesce and self.recent is None:
+            return await self._post_json(url, payload, headers, ssl)
+
+        key = f"{url} {ResponseCache.key(payload.get('query', ''), payload.get('variables'))}"
+        if self.recent is not None:
+            response = self.recent.get(key)
+            if response is not None:
+                self._count("katunog_recent_hits_total")
+                return response
+
+        task = self._in_flight.get(key) if self.coalesce else None
+        if task is not None:
+            self._count("katunog_coalesced_requests_total")
+        else:
+            task = asyncio.ensure_future(self._post_json(url, payload, headers, ssl))
+            if self.coalesce:
+                self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._settle(key, done))
+        # A caller giving up does not cancel the request for the others waiting on it
+        return await asyncio.shield(task)
+
+    def _settle(self, key: str, task: "asyncio.Task[Dict[Any, Any]]"):
+        """Forget a finished request and keep its response in `recent` if it succeeded without errors."""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None or self.recent is None:
+            return
+        response = task.result()
+        if isinstance(response, dict) and not response.get("errors"):
+            self.recent.set(key, response)
+
+    async def _post_json(
+        self, url: str, payload: Dict[str, Any], headers: Dict[str, str], ssl: Union[bool, None] = None
+    ) -> Dict[Any, Any]:
+        async with self.request(
+            "post", url, headers=headers, json=payload, ssl=self.ssl if ssl is None else ssl
+        ) as response:
+            return await response.json(loads=loads)
+
+    def _count_retry(self, reason: str):
+        self._count("katunog_retries_total", reason=reason)
+
+    def _count(self, name: str, value: float = 1, **labels: str):
+        if self.metrics is not None:
+            self.metrics.increment(name, value, **labels)
+
+    async def _release(self, latency: Optional[float], generation: Optional[int], failed: bool):
+        if self.concurrency is not None:
+            await self.concurrency.release(latency, failed, generation)
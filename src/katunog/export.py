@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .api import InstrumentList, InstrumentLocation
+from .client import KatunogClient
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+else:
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:  # pragma: no cover
+        pa = None
+        ds = None
+
+# Parquet column -> (path inside the instrument object, arrow type name)
+INSTRUMENT_COLUMNS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "id": (("id",), "string"),
+    "control_number": (("controlNumber",), "string"),
+    "local_name": (("localName",), "string"),
+    "english_name": (("englishName",), "string"),
+    "alternate_name": (("alternateName",), "string"),
+    "city": (("city", "name"), "category"),
+    "province": (("province", "name"), "category"),
+    "ethnolinguistic": (("ethnolinguistic", "name"), "category"),
+    "hornbostel": (("hornbostel", "name"), "category"),
+    "length": (("length",), "float"),
+    "width": (("width",), "float"),
+    "height": (("height",), "float"),
+    "dimension_unit": (("dimensionUnit",), "category"),
+    "diameter": (("diameter",), "float"),
+    "diameter_unit": (("diameterUnit",), "category"),
+    "english_general_description": (("english", "generalDescription"), "string"),
+    "english_material_and_make": (("english", "materialAndMake"), "string"),
+    "english_playing_parts": (("english", "playingParts"), "string"),
+    "english_other_details": (("english", "otherDetails"), "string"),
+    "filipino_general_description": (("filipino", "generalDescription"), "string"),
+    "filipino_material_and_make": (("filipino", "materialAndMake"), "string"),
+    "filipino_playing_parts": (("filipino", "playingParts"), "string"),
+    "filipino_other_details": (("filipino", "otherDetails"), "string"),
+    "last_updated": (("lastUpdated",), "timestamp"),
+    "media_upload_ongoing": (("mediaUploadOngoing",), "bool"),
+    "is_reported": (("isReported",), "bool"),
+}
+
+MEDIA_COLUMNS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "name": (("name",), "string"),
+    "size": (("size",), "int"),
+    "caption": (("caption",), "string"),
+    "file_type": (("fileType",), "category"),
+    "is_public": (("isPublic",), "bool"),
+    "upload_done": (("uploadDone",), "bool"),
+    "path": (("path",), "string"),
+    "is_background": (("isBackground",), "bool"),
+    "number": (("number",), "int"),
+}
+
+
+class CatalogExporter:
+    """Export the instrument catalog and its media listings to Parquet datasets.
+    Instruments are joined with their region and island and partitioned by region, media files are written to
+    their own dataset partitioned by file type.
+    """
+
+    def __init__(self, ssl: bool = True, client: Optional[KatunogClient] = None, limit: int = 100, window: int = 4):
+        if pa is None:
+            raise ImportError("Parquet export requires pyarrow, install it with `poetry install --extras parquet`")
+        self.ssl = ssl
+        self.client = client
+        self.limit = limit
+        self.window = window
+
+    async def export(self, folder: str = "catalog", compression: str = "zstd") -> Dict[str, str]:
+        """Crawl the catalog and write `<folder>/instruments` and `<folder>/media_files`."""
+        locations = await self._fetch_locations()
+
+        instrument_batches = []
+        media_batches = []
+        instrument_list = InstrumentList(ssl=self.ssl, client=self.client)
+        async for page in instrument_list.iter_pages(limit=self.limit, window=self.window):
+            objects = instrument_list._instruments(page).get("objects") or []
+            instrument_batches.append(self.instrument_batch(objects, locations))
+            media_batches.append(self.media_batch(objects))
+
+        paths = {"instruments": os.path.join(folder, "instruments"), "media_files": os.path.join(folder, "media_files")}
+        await asyncio.to_thread(
+            self._write, instrument_batches, paths["instruments"], ["region"], compression, instrument_schema()
+        )
+        await asyncio.to_thread(
+            self._write, media_batches, paths["media_files"], ["file_type"], compression, media_schema()
+        )
+        logging.info(f"Exported {sum(batch.num_rows for batch in instrument_batches)} instruments to {folder}")
+        return paths
+
+    async def _fetch_locations(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        locations = {}
+        async for instrument in InstrumentLocation(ssl=self.ssl, client=self.client).iter_all(
+            limit=self.limit, window=self.window
+        ):
+            region = ((instrument.get("province") or {}).get("region")) or {}
+            locations[instrument["id"]] = (region.get("name"), (region.get("island") or {}).get("name"))
+        return locations
+
+    @staticmethod
+    def instrument_batch(
+        objects: List[Dict[Any, Any]], locations: Dict[str, Tuple[Optional[str], Optional[str]]]
+    ) -> "pa.RecordBatch":
+        columns = {name: _column(objects, path, kind) for name, (path, kind) in INSTRUMENT_COLUMNS.items()}
+        columns["file_count"] = pa.array([len(_edges(obj)) for obj in objects], pa.int32())
+        regions_islands = [locations.get(obj.get("id", ""), (None, None)) for obj in objects]
+        columns["island"] = pa.array([island for _, island in regions_islands], pa.string()).dictionary_encode()
+        columns["region"] = pa.array([region for region, _ in regions_islands], pa.string()).dictionary_encode()
+        return pa.RecordBatch.from_pydict(columns, schema=instrument_schema())
+
+    @staticmethod
+    def media_batch(objects: List[Dict[Any, Any]]) -> "pa.RecordBatch":
+        nodes = []
+        instrument_ids = []
+        for obj in objects:
+            for edge in _edges(obj):
+                nodes.append(edge.get("node") or {})
+                instrument_ids.append(obj.get("id"))
+        columns = {"instrument_id": pa.array(instrument_ids, pa.string())}
+        columns.update({name: _column(nodes, path, kind) for name, (path, kind) in MEDIA_COLUMNS.items()})
+        return pa.RecordBatch.from_pydict(columns, schema=media_schema())
+
+    @staticmethod
+    def _write(batches: List["pa.RecordBatch"], path: str, partitions: List[str], compression: str, schema):
+        partitioning = ds.partitioning(pa.schema([schema.field(name) for name in partitions]), flavor="hive")
+        ds.write_dataset(
+            pa.Table.from_batches(batches, schema=schema).unify_dictionaries(),
+            path,
+            format="parquet",
+            partitioning=partitioning,
+            existing_data_behavior="delete_matching",
+            file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+        )
+
+
+_ARROW_TYPES = {
+    "string": lambda: pa.string(),
+    "category": lambda: pa.dictionary(pa.int32(), pa.string()),
+    "float": lambda: pa.float64(),
+    "int": lambda: pa.int64(),
+    "bool": lambda: pa.bool_(),
+    "timestamp": lambda: pa.timestamp("us", tz="UTC"),
+}
+
+
+def instrument_schema() -> "pa.Schema":
+    fields = [pa.field(name, _ARROW_TYPES[kind]()) for name, (_, kind) in INSTRUMENT_COLUMNS.items()]
+    fields.append(pa.field("file_count", pa.int32()))
+    fields.append(pa.field("island", _ARROW_TYPES["category"]()))
+    fields.append(pa.field("region", _ARROW_TYPES["category"]()))
+    return pa.schema(fields)
+
+
+def media_schema() -> "pa.Schema":
+    fields = [pa.field("instrument_id", pa.string())]
+    fields.extend(pa.field(name, _ARROW_TYPES[kind]()) for name, (_, kind) in MEDIA_COLUMNS.items())
+    return pa.schema(fields)
+
+
+def _edges(obj: Dict[Any, Any]) -> List[Dict[Any, Any]]:
+    return (obj.get("fileSet") or {}).get("edges") or []
+
+
+def _column(objects: List[Dict[Any, Any]], path: Tuple[str, ...], kind: str) -> "pa.Array":
+    values: List[Any] = objects
+    for key in path:
+        values = [value.get(key) if value else None for value in values]
+
+    if kind == "float":
+        return pa.array(pd.to_numeric(pd.Series(values, dtype=object), errors="coerce"), pa.float64())
+    if kind == "int":
+        return pa.array(pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").astype("Int64"), pa.int64())
+    if kind == "timestamp":
+        return pa.array(
+            pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", utc=True), _ARROW_TYPES[kind]()
+        )
+    if kind == "bool":
+        return pa.array([None if value is None else bool(value) for value in values], pa.bool_())
+    array = pa.array([None if value is None else str(value) for value in values], pa.string())
+    return array.dictionary_encode() if kind == "category" else array
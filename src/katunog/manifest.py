@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+import zipfile
+
+
+class DownloadManifest:
+    """Record of the archives downloaded into a folder.
+    Each entry keeps the size, sha256 and the server's Last-Modified/ETag so a re-run can tell a finished
+    archive from a truncated one. Partial transfers keep their validators so they can be resumed safely.
+    Archives that were extracted straight from memory are recorded with `stored` set to False, and only count as
+    complete once `confirm` says their consumer has them. `confirm` may be called from another thread.
+    """
+
+    FILE_NAME = ".manifest.json"
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, self.FILE_NAME)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Ignoring unreadable manifest {self.path}: {e}")
+        self._lock = threading.Lock()
+
+    def get(self, file_name: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(file_name)
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def record(
+        self,
+        file_name: str,
+        size: int,
+        sha256: Optional[str],
+        last_modified: Optional[str] = None,
+        etag: Optional[str] = None,
+        complete: bool = True,
+        stored: bool = True,
+        preallocated: bool = False,
+    ):
+        entry = {
+            "size": size,
+            "sha256": sha256,
+            "last_modified": last_modified,
+            "etag": etag,
+            "complete": complete,
+            "stored": stored,
+            "preallocated": preallocated,
+        }
+        with self._lock:
+            self.entries[file_name] = entry
+            self._save()
+
+    def discard(self, file_name: str):
+        with self._lock:
+            if self.entries.pop(file_name, None) is not None:
+                self._save()
+
+    def confirm(self, file_name: str):
+        """Mark a recorded archive complete, e.g. an in-memory one once it was extracted."""
+        with self._lock:
+            entry = self.entries.get(file_name)
+            if entry is not None and not entry.get("complete"):
+                entry["complete"] = True
+                self._save()
+
+    def is_complete(self, file_name: str) -> bool:
+        """Whether the archive is present with the size recorded when it finished downloading.
+        Valid archives from before the manifest existed are adopted into it.
+        """
+        file_path = os.path.join(self.folder, file_name)
+        entry = self.get(file_name)
+        if entry is not None and entry.get("stored") is False:
+            return bool(entry.get("complete"))
+        if not os.path.exists(file_path):
+            return False
+
+        if entry is None:
+            if not zipfile.is_zipfile(file_path):
+                return False
+            self.record(file_name, os.path.getsize(file_path), file_sha256(file_path))
+            return True
+        return bool(entry.get("complete")) and entry.get("size") == os.path.getsize(file_path)
+
+    def verify(self, file_name: str) -> bool:
+        """Full check of the archive against its recorded checksum."""
+        if not self.is_complete(file_name):
+            return False
+        entry = self.get(file_name) or {}
+        if entry.get("stored") is False:
+            return True
+        return entry.get("sha256") == file_sha256(os.path.join(self.folder, file_name))
+
+
+def file_digest(file_path: str) -> "hashlib._Hash":
+    """sha256 of a file, which can go on hashing whatever is appended to it."""
+    with open(file_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256")
+
+
+def file_sha256(file_path: str) -> str:
+    return file_digest(file_path).hexdigest()
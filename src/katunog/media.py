@@ -0,0 +1,135 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import IO, Any, Dict, Iterable, Optional, Tuple, Union
+import uuid
+import zipfile
+
+
+class MediaStore:
+    """Content-addressed store of the media files inside the downloaded archives.
+    Every distinct file is kept once under `objects/` named by its sha256, and each instrument gets a view folder
+    under `instruments/` whose files are hardlinks to those objects (copies where the filesystem cannot link).
+    The `name` and `size` of every stored file are remembered, so an instrument whose `fileSet` lists only files
+    already in the store gets its view without its archive being downloaded again.
+    """
+
+    INDEX_FILE_NAME = ".media_index.json"
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.objects_folder = os.path.join(folder, "objects")
+        self.views_folder = os.path.join(folder, "instruments")
+        os.makedirs(self.objects_folder, exist_ok=True)
+        os.makedirs(self.views_folder, exist_ok=True)
+        self.path = os.path.join(folder, self.INDEX_FILE_NAME)
+        # "<name>:<size>" -> sha256 of every stored file, and view -> file name -> sha256
+        self.files: Dict[str, str] = {}
+        self.views: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self.files, self.views = data["files"], data["views"]
+            except (OSError, ValueError, KeyError) as e:
+                logging.error(f"Ignoring unreadable media index {self.path}: {e}")
+        self._lock = threading.Lock()
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_folder, sha256[:2], sha256)
+
+    def view_path(self, view: str) -> str:
+        return os.path.join(self.views_folder, view)
+
+    def lookup(self, name: str, size: int) -> Optional[str]:
+        """sha256 of a stored file with this name and size, if there is one."""
+        sha256 = self.files.get(f"{name}:{size}")
+        return sha256 if sha256 is not None and os.path.exists(self.object_path(sha256)) else None
+
+    def materialize(self, view: str, nodes: Iterable[Dict[Any, Any]]) -> bool:
+        """Build `view` from `fileSet` nodes when the store already holds all of their files.
+        Returns False, leaving the view alone, when any file is unknown and the archive has to be downloaded.
+        """
+        files: Dict[str, str] = {}
+        for node in nodes:
+            name, size = node.get("name"), node.get("size")
+            if not name or size is None:
+                return False
+            file_name = os.path.basename(name)
+            sha256 = self.lookup(file_name, size)
+            if sha256 is None:
+                return False
+            files[file_name] = sha256
+        if not files:
+            return False
+        self._link(view, files)
+        return True
+
+    def add_archive(self, view: str, source: Union[str, bytes]) -> int:
+        """Store the members of an archive, given as a path or its bytes, and link them into `view`.
+        Returns the number of files that were not in the store yet.
+        """
+        files: Dict[str, str] = {}
+        added = 0
+        with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source, "r") as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = os.path.basename(info.filename)
+                with archive.open(info) as member:
+                    sha256, stored = self._store(member)
+                files[name] = sha256
+                added += stored
+                with self._lock:
+                    self.files[f"{name}:{info.file_size}"] = sha256
+        self._link(view, files)
+        logging.info(f"Stored {len(files)} file(s) of {view}, {len(files) - added} already in {self.folder}")
+        return added
+
+    def _store(self, member: IO[bytes], chunk_size: int = 1024 * 1024) -> Tuple[str, bool]:
+        """Copy a file into the objects while hashing it, dropping the copy when the object exists."""
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.objects_folder, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: member.read(chunk_size), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        sha256 = digest.hexdigest()
+        target = self.object_path(sha256)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+            return sha256, False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        return sha256, True
+
+    def _link(self, view: str, files: Dict[str, str]):
+        """Point the files of `view` at their objects, removing the ones it does not list anymore."""
+        folder = self.view_path(view)
+        os.makedirs(folder, exist_ok=True)
+        for name in os.listdir(folder):
+            if name not in files:
+                os.remove(os.path.join(folder, name))
+        for name, sha256 in files.items():
+            source, target = self.object_path(sha256), os.path.join(folder, name)
+            if os.path.exists(target):
+                if os.path.samefile(source, target):
+                    continue
+                os.remove(target)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+        with self._lock:
+            self.views[view] = dict(files)
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files, "views": self.views}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
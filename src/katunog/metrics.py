@@ -0,0 +1,152 @@
+from bisect import bisect_left
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+Labels = Tuple[Tuple[str, str], ...]
+Hook = Callable[[str, str, float, Dict[str, str]], None]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+THROUGHPUT_BUCKETS = tuple(float(2**power) for power in range(10, 31, 2))
+
+
+class Histogram:
+    """Fixed-bucket histogram, cumulative on export like Prometheus expects."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip([*map(_format_number, self.buckets), "+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms for the client's hot paths.
+    Recording is a dict lookup and an increment, so it can stay on in production. Hooks receive every recorded
+    value for forwarding elsewhere, and the registry itself exports Prometheus text or JSON.
+    """
+
+    def __init__(self, buckets: Optional[Dict[str, Sequence[float]]] = None):
+        self.buckets = {"katunog_download_bytes_per_second": THROUGHPUT_BUCKETS, **(buckets or {})}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.hooks: List[Hook] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Hook):
+        """Register `hook(kind, name, value, labels)`, called for every counter, gauge and histogram update."""
+        self.hooks.append(hook)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        self._notify("counter", name, value, labels)
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = value
+        self._notify("gauge", name, value, labels)
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = _labels(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(self.buckets.get(name, DEFAULT_BUCKETS))
+            series[key].observe(value)
+        self._notify("histogram", name, value, labels)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp tracing that counts new versus reused pooled connections."""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, context, params):
+            self.increment("katunog_connections_created_total")
+
+        async def on_connection_reuseconn(session, context, params):
+            self.increment("katunog_connections_reused_total")
+
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {name: _series(series) for name, series in self.counters.items()},
+                "gauges": {name: _series(series) for name, series in self.gauges.items()},
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(key),
+                            "count": histogram.count,
+                            "sum": histogram.sum,
+                            "buckets": dict(histogram.cumulative()),
+                        }
+                        for key, histogram in series.items()
+                    ]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines.extend(
+                        f"{name}{_format_labels(key)} {_format_number(value)}" for key, value in series.items()
+                    )
+            for name, histograms in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in histograms.items():
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dumps(self) -> str:
+        return json.dumps(self.to_json(), indent=2, sort_keys=True)
+
+    def _notify(self, kind: str, name: str, value: float, labels: Dict[str, str]):
+        for hook in self.hooks:
+            hook(kind, name, value, labels)
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _series(series: Dict[Labels, float]) -> List[Dict[str, Any]]:
+    return [{"labels": dict(key), "value": value} for key, value in series.items()]
+
+
+def _format_labels(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from functools import lru_cache
+import re
+from typing import Any, Dict, Iterable, Tuple
+
+# Nested selection set, field name -> sub-selection (empty for leaf fields)
+Selection = Dict[str, "Selection"]
+# (variable name, GraphQL type) pairs, e.g. (("page", "Int!"), ("limit", "Int!"))
+Variables = Tuple[Tuple[str, str], ...]
+
+# (alias, field, fields, ((argument, variable name, GraphQL type), ...)) for every root of a batched document
+BatchRoots = Tuple[Tuple[str, str, Tuple[str, ...], Tuple[Tuple[str, str, str], ...]], ...]
+
+NAME_PATTERN = re.compile(r"^[_A-Za-z][_0-9A-Za-z]*$")
+
+
+@dataclass(frozen=True)
+class QueryPart:
+    """One root field of a query: what an endpoint's `get_data` selects, with the argument values it passes."""
+
+    field: str
+    fields: Tuple[str, ...]
+    arguments: Tuple[Tuple[str, Any], ...] = ()
+
+    @property
+    def variables(self) -> Dict[str, Any]:
+        return dict(self.arguments)
+
+
+def selection_tree(fields: Iterable[str]) -> Selection:
+    """Turn dotted field paths like `province.region.name` into a nested selection, keeping first-seen order."""
+    tree: Selection = {}
+    for field in fields:
+        node = tree
+        for name in field.split("."):
+            if not NAME_PATTERN.match(name):
+                raise ValueError(f"Invalid GraphQL field {field!r}")
+            node = node.setdefault(name, {})
+    return tree
+
+
+def render_selection(tree: Selection) -> str:
+    return ", ".join(f"{name} {{ {render_selection(child)} }}" if child else name for name, child in tree.items())
+
+
+@lru_cache(maxsize=256)
+def compile_query(operation: str, field: str, fields: Tuple[str, ...], variables: Variables = ()) -> str:
+    """GraphQL document selecting `fields` from `field`, whose arguments are passed as same-named variables.
+    Documents are cached, so a page request only renders its query the first time a projection is used.
+    """
+    selection = render_selection(selection_tree(fields))
+    if not variables:
+        return f"query {operation} {{ {field} {{ {selection} }} }}"
+    declarations = ", ".join(f"${name}: {kind}" for name, kind in variables)
+    arguments = ", ".join(f"{name}: ${name}" for name, _ in variables)
+    return f"query {operation}({declarations}) {{ {field}({arguments}) {{ {selection} }} }}"
+
+
+@lru_cache(maxsize=256)
+def compile_aliased_query(
+    operation: str, field: str, fields: Tuple[str, ...], argument: str, kind: str, count: int
+) -> str:
+    """Document fetching `field` `count` times under the aliases `i0`, `i1`, ..., each with its own variable."""
+    selection = render_selection(selection_tree(fields))
+    declarations = ", ".join(f"$i{index}: {kind}" for index in range(count))
+    aliases = " ".join(f"i{index}: {field}({argument}: $i{index}) {{ {selection} }}" for index in range(count))
+    return f"query {operation}({declarations}) {{ {aliases} }}"
+
+
+@lru_cache(maxsize=256)
+def compile_batch(operation: str, roots: BatchRoots) -> str:
+    """Document selecting several aliased root fields at once, each argument bound to its own variable."""
+    declarations = ", ".join(f"${variable}: {kind}" for *_, arguments in roots for _, variable, kind in arguments)
+    selections = []
+    for alias, field, fields, arguments in roots:
+        call = f"({', '.join(f'{name}: ${variable}' for name, variable, _ in arguments)})" if arguments else ""
+        selections.append(f"{alias}: {field}{call} {{ {render_selection(selection_tree(fields))} }}")
+    header = f"query {operation}({declarations})" if declarations else f"query {operation}"
+    return f"{header} {{ {' '.join(selections)} }}"
+
+
+def project(value: Any, tree: Selection) -> Any:
+    """Keep only the fields of `tree` in a response value, in the order `tree` selects them."""
+    if not tree or value is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {name: project(value[name], child) for name, child in tree.items() if name in value}
+    return value
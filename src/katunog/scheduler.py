@@ -0,0 +1,136 @@
+import asyncio
+from dataclasses import dataclass
+import itertools
+import logging
+import math
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from .metrics import MetricsRegistry
+
+
+@dataclass
+class DownloadJob:
+    url: str
+    file_path: str
+    instrument_name: str
+    file_type: str = "audio"
+    # Expected size in bytes, smaller jobs are started first
+    size: Optional[int] = None
+
+
+@dataclass
+class DownloadProgress:
+    job: DownloadJob
+    bytes_done: int = 0
+    total: Optional[int] = None
+    done: bool = False
+    error: Optional[BaseException] = None
+
+
+ProgressCallback = Callable[[DownloadProgress], None]
+DownloadFunc = Callable[[DownloadJob, Callable[[int, Optional[int]], None]], Awaitable[None]]
+
+
+class DownloadScheduler:
+    """Bounded work queue drained by a fixed pool of download workers.
+    A new transfer starts as soon as any worker frees up, so one slow file never stalls the others.
+    Queued jobs are taken smallest first, e.g. images before videos, jobs of unknown size last in submission order.
+    """
+
+    def __init__(
+        self,
+        download: DownloadFunc,
+        num_workers: int = 5,
+        queue_size: Optional[int] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.download = download
+        self.num_workers = num_workers
+        self.on_progress = on_progress
+        self.metrics = metrics
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue(
+            maxsize=queue_size if queue_size is not None else num_workers * 2
+        )
+        self._order = itertools.count()
+        self.completed = 0
+        self.failed = 0
+        self._workers: List[asyncio.Task] = []
+
+    async def __aenter__(self) -> "DownloadScheduler":
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.join()
+        else:
+            await self.stop()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def submit(self, job: DownloadJob):
+        """Enqueue a job, waiting for room when the queue is full."""
+        await self.queue.put((self._priority(job), next(self._order), job))
+        self._report_queue_depth()
+
+    async def submit_all(self, jobs: Iterable[DownloadJob]):
+        """Enqueue jobs known together smallest first, so a larger one cannot start while the queue is full."""
+        for job in sorted(jobs, key=self._priority):
+            await self.submit(job)
+
+    async def join(self):
+        """Wait until every submitted job is processed, then shut the workers down."""
+        await self.queue.join()
+        await self.stop()
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        while True:
+            *_, job = await self.queue.get()
+            self._report_queue_depth()
+            progress = DownloadProgress(job)
+            try:
+                await self.download(job, lambda bytes_done, total: self._report(progress, bytes_done, total))
+                self.completed += 1
+                self._count("completed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                self._count("failed")
+                progress.error = e
+                logging.error(f"Failed to download {job.instrument_name} from {job.url}: {e}")
+            finally:
+                progress.done = True
+                self._report(progress, progress.bytes_done, progress.total)
+                self.queue.task_done()
+
+    @staticmethod
+    def _priority(job: DownloadJob) -> float:
+        return job.size if job.size is not None else math.inf
+
+    def _report(self, progress: DownloadProgress, bytes_done: int, total: Optional[int]):
+        progress.bytes_done = bytes_done
+        progress.total = total
+        if self.on_progress is not None:
+            self.on_progress(progress)
+
+    def _report_queue_depth(self):
+        if self.metrics is not None:
+            self.metrics.set_gauge("katunog_download_queue_depth", self.queue.qsize())
+
+    def _count(self, outcome: str):
+        if self.metrics is not None:
+            self.metrics.increment("katunog_downloads_total", outcome=outcome)
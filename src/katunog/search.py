@@ -0,0 +1,396 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+import math
+import mmap
+import os
+import re
+import struct
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import unicodedata
+
+from .api import InstrumentList, InstrumentResolver
+from .client import KatunogClient
+
+WORD = re.compile(r"\w+")
+ENGLISH_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were which with".split()
+)
+FILIPINO_STOPWORDS = frozenset(
+    "ang ay at ng mga sa na nang si ni kay ito iyan iyon nito niyan niyon isang may para kung o din rin lamang "
+    "lang pa po dito doon siya sila kanila kaniya ka ko mo".split()
+)
+
+Analyzer = Callable[[str], List[str]]
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, so `Kudyápi` and `kudyapi` index the same."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def english_stem(token: str) -> str:
+    """Light suffix stripping, enough to match plurals and common verb forms."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(token) - len(suffix) >= 3 and token.endswith(suffix) and not token.endswith("ss"):
+            return token.removesuffix(suffix)
+    return token
+
+
+def analyze_english(text: str) -> List[str]:
+    return [english_stem(token) for token in WORD.findall(fold(text)) if token not in ENGLISH_STOPWORDS]
+
+
+def analyze_filipino(text: str) -> List[str]:
+    return [token for token in WORD.findall(fold(text)) if token not in FILIPINO_STOPWORDS]
+
+
+def analyze_name(text: str) -> List[str]:
+    return WORD.findall(fold(text))
+
+
+class _BM25(ABC):
+    """BM25 ranking shared by the in-memory and the memory-mapped index."""
+
+    K1 = 1.2
+    B = 0.75
+
+    # Field path -> (analyzer, weight), term frequencies are summed with these weights
+    FIELDS: Dict[str, Tuple[Analyzer, float]] = {
+        "localName": (analyze_name, 3.0),
+        "englishName": (analyze_name, 2.0),
+        "alternateName": (analyze_name, 2.0),
+        **{
+            f"english.{field}": (analyze_english, 1.0)
+            for field in ("generalDescription", "materialAndMake", "playingParts", "otherDetails")
+        },
+        **{
+            f"filipino.{field}": (analyze_filipino, 1.0)
+            for field in ("generalDescription", "materialAndMake", "playingParts", "otherDetails")
+        },
+    }
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Instrument IDs ranked by BM25 against `query`, analyzed for every language the index holds."""
+        terms = set(analyze_english(query)) | set(analyze_filipino(query)) | set(analyze_name(query))
+        documents = self._document_count()
+        if not documents:
+            return []
+        average = self._average_length()
+        scores: Dict[int, float] = {}
+        for term in terms:
+            postings = self._postings(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for document, frequency in postings:
+                norm = self.K1 * (1 - self.B + self.B * self._length(document) / average)
+                scores[document] = scores.get(document, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self._document_id(document), score) for document, score in ranked]
+
+    @abstractmethod
+    def _document_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def _average_length(self) -> float:
+        pass
+
+    @abstractmethod
+    def _postings(self, term: str) -> Sequence[Tuple[int, float]]:
+        pass
+
+    @abstractmethod
+    def _length(self, document: int) -> float:
+        pass
+
+    @abstractmethod
+    def _document_id(self, document: int) -> str:
+        pass
+
+
+class SearchIndex(_BM25):
+    """Mutable inverted index over the names and bilingual descriptions of the instruments.
+    Instruments can be added, replaced or removed one by one, e.g. with what a `DeltaSync` fetched, and the index
+    saved in a format `MappedSearchIndex` searches without loading it.
+    """
+
+    MAGIC = b"KTSI"
+    VERSION = 1
+    HEADER = struct.Struct("<4sIIIIIId")
+
+    def __init__(self, ssl: bool = True, client: Optional[KatunogClient] = None):
+        self.ssl = ssl
+        self.client = client
+        self._documents: List[Optional[str]] = []
+        self._numbers: Dict[str, int] = {}
+        self._lengths: List[float] = []
+        self._terms: List[Dict[str, float]] = []
+        self._postings_by_term: Dict[str, Dict[int, float]] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __contains__(self, instrument_id: object) -> bool:
+        return instrument_id in self._numbers
+
+    @classmethod
+    def fetch_fields(cls) -> Tuple[str, ...]:
+        """The instrument fields to request for indexing."""
+        return ("id", *cls.FIELDS)
+
+    async def load(self, limit: int = 100, window: int = 4) -> "SearchIndex":
+        """Crawl the catalog and index every instrument."""
+        api = InstrumentList(ssl=self.ssl, client=self.client)
+        async for instrument in api.iter_all(limit=limit, window=window, fields=self.fetch_fields()):
+            self.add(instrument)
+        return self
+
+    async def refresh(self, instrument_ids: Iterable[str]):
+        """Re-index the given instruments, e.g. the new and changed ones a sync found. Missing ones are removed."""
+        resolver = InstrumentResolver(ssl=self.ssl, client=self.client, fields=self.fetch_fields()[1:])
+        for instrument_id, instrument in (await resolver.resolve(instrument_ids)).items():
+            if instrument:
+                self.add({**instrument, "id": instrument_id})
+            else:
+                self.remove(instrument_id)
+
+    def add(self, instrument: Dict[Any, Any]):
+        """Index an instrument object, replacing an earlier version of it."""
+        frequencies: Dict[str, float] = {}
+        for path, (analyzer, weight) in self.FIELDS.items():
+            value = _value(instrument, path)
+            if value:
+                for term in analyzer(str(value)):
+                    frequencies[term] = frequencies.get(term, 0.0) + weight
+        self._add(instrument["id"], frequencies)
+
+    def remove(self, instrument_id: str) -> bool:
+        document = self._numbers.pop(instrument_id, None)
+        if document is None:
+            return False
+        for term in self._terms[document]:
+            postings = self._postings_by_term[term]
+            del postings[document]
+            if not postings:
+                del self._postings_by_term[term]
+        self._total_length -= self._lengths[document]
+        self._documents[document] = None
+        self._terms[document] = {}
+        return True
+
+    def save(self, path: str):
+        """Write the memory-mappable index file atomically, renumbering the documents densely.
+        Layout after the header: document name offsets, document lengths, term offsets, posting starts, posting
+        documents and posting frequencies as little-endian 32-bit arrays, then the document IDs and sorted terms.
+        """
+        live = sorted(self._numbers.items())
+        renumbered = {old: new for new, (_, old) in enumerate(live)}
+        terms = sorted(self._postings_by_term)
+        document_blob, document_offsets = _blob(instrument_id for instrument_id, _ in live)
+        term_blob, term_offsets = _blob(terms)
+        starts = [0]
+        posting_documents: List[int] = []
+        posting_frequencies: List[float] = []
+        for term in terms:
+            for document, frequency in sorted((renumbered[d], f) for d, f in self._postings_by_term[term].items()):
+                posting_documents.append(document)
+                posting_frequencies.append(frequency)
+            starts.append(len(posting_documents))
+
+        header = self.HEADER.pack(
+            self.MAGIC,
+            self.VERSION,
+            len(live),
+            len(terms),
+            len(posting_documents),
+            len(document_blob),
+            len(term_blob),
+            self._average_length(),
+        )
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(struct.pack(f"<{len(document_offsets)}I", *document_offsets))
+            f.write(struct.pack(f"<{len(live)}f", *(self._lengths[old] for _, old in live)))
+            f.write(struct.pack(f"<{len(term_offsets)}I", *term_offsets))
+            f.write(struct.pack(f"<{len(starts)}I", *starts))
+            f.write(struct.pack(f"<{len(posting_documents)}I", *posting_documents))
+            f.write(struct.pack(f"<{len(posting_frequencies)}f", *posting_frequencies))
+            f.write(document_blob)
+            f.write(term_blob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path: str, ssl: bool = True, client: Optional[KatunogClient] = None) -> "SearchIndex":
+        """Load an index file back into a mutable index, to update it incrementally."""
+        index = cls(ssl=ssl, client=client)
+        with MappedSearchIndex(path) as mapped:
+            for document in range(mapped.documents):
+                instrument_id = mapped._document_id(document)
+                index._documents.append(instrument_id)
+                index._numbers[instrument_id] = document
+                index._lengths.append(mapped._length(document))
+                index._terms.append({})
+            for term_number in range(mapped.terms):
+                term = mapped._term(term_number)
+                postings = {document: frequency for document, frequency in mapped._postings_at(term_number)}
+                index._postings_by_term[term] = postings
+                for document, frequency in postings.items():
+                    index._terms[document][term] = frequency
+        index._total_length = sum(index._lengths)
+        return index
+
+    def _add(self, instrument_id: str, frequencies: Dict[str, float]):
+        self.remove(instrument_id)
+        document = len(self._documents)
+        self._documents.append(instrument_id)
+        self._numbers[instrument_id] = document
+        self._terms.append(frequencies)
+        length = sum(frequencies.values())
+        self._lengths.append(length)
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            self._postings_by_term.setdefault(term, {})[document] = frequency
+
+    def _document_count(self) -> int:
+        return len(self._numbers)
+
+    def _average_length(self) -> float:
+        return self._total_length / len(self._numbers) if self._numbers else 0.0
+
+    def _postings(self, term: str) -> Sequence[Tuple[int, float]]:
+        return list(self._postings_by_term.get(term, {}).items())
+
+    def _length(self, document: int) -> float:
+        return self._lengths[document]
+
+    def _document_id(self, document: int) -> str:
+        return self._documents[document] or ""
+
+
+class MappedSearchIndex(_BM25):
+    """Read-only view of an index file written by `SearchIndex.save`.
+    The file is memory-mapped and terms are binary searched in place, so opening it costs nothing however large
+    it is and only the pages a query touches are read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, version, documents, terms, postings, document_bytes, term_bytes, average = (
+            SearchIndex.HEADER.unpack_from(view)
+        )
+        if magic != SearchIndex.MAGIC or version != SearchIndex.VERSION:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{path} is not a katunog search index")
+        self.documents = documents
+        self.terms = terms
+        self._average = average
+
+        offset = SearchIndex.HEADER.size
+        sections: Dict[str, memoryview[Any]] = {}
+        for name, count, kind in (
+            ("document_offsets", documents + 1, "I"),
+            ("lengths", documents, "f"),
+            ("term_offsets", terms + 1, "I"),
+            ("starts", terms + 1, "I"),
+            ("posting_documents", postings, "I"),
+            ("posting_frequencies", postings, "f"),
+        ):
+            end = offset + count * 4
+            section = view[offset:end]
+            sections[name] = section.cast("f") if kind == "f" else section.cast("I")
+            offset = end
+        self._document_offsets = sections["document_offsets"]
+        self._lengths = sections["lengths"]
+        self._term_offsets = sections["term_offsets"]
+        self._starts = sections["starts"]
+        self._posting_documents = sections["posting_documents"]
+        self._posting_frequencies = sections["posting_frequencies"]
+        term_start = offset + document_bytes
+        term_end = term_start + term_bytes
+        self._document_blob = view[offset:term_start]
+        self._term_blob = view[term_start:term_end]
+        self._view = view
+
+    def __enter__(self) -> "MappedSearchIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.documents
+
+    def close(self):
+        for view in (
+            self._document_offsets,
+            self._lengths,
+            self._term_offsets,
+            self._starts,
+            self._posting_documents,
+            self._posting_frequencies,
+            self._document_blob,
+            self._term_blob,
+            self._view,
+        ):
+            view.release()
+        self._mmap.close()
+
+    def _term(self, number: int) -> str:
+        return bytes(self._term_blob[_span(self._term_offsets, number)]).decode()
+
+    def _find(self, term: str) -> Optional[int]:
+        key = term.encode()
+        number = bisect_left(range(self.terms), key, key=lambda n: bytes(self._term_blob[_span(self._term_offsets, n)]))
+        if number < self.terms and bytes(self._term_blob[_span(self._term_offsets, number)]) == key:
+            return number
+        return None
+
+    def _postings_at(self, number: int) -> List[Tuple[int, float]]:
+        span = _span(self._starts, number)
+        return list(zip(self._posting_documents[span], self._posting_frequencies[span]))
+
+    def _document_count(self) -> int:
+        return self.documents
+
+    def _average_length(self) -> float:
+        return self._average
+
+    def _postings(self, term: str) -> Sequence[Tuple[int, float]]:
+        number = self._find(term)
+        return self._postings_at(number) if number is not None else []
+
+    def _length(self, document: int) -> float:
+        return self._lengths[document]
+
+    def _document_id(self, document: int) -> str:
+        return bytes(self._document_blob[_span(self._document_offsets, document)]).decode()
+
+
+def _span(offsets: memoryview, number: int) -> slice:
+    return slice(offsets[number], offsets[number + 1])
+
+
+def _blob(values: Iterable[str]) -> Tuple[bytes, List[int]]:
+    """Concatenated UTF-8 values and the offset of each, plus the end offset."""
+    encoded = [value.encode() for value in values]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return b"".join(encoded), offsets
+
+
+def _value(instrument: Dict[Any, Any], path: str) -> Any:
+    value: Any = instrument
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
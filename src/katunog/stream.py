@@ -0,0 +1,124 @@
+import json
+import re
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+if TYPE_CHECKING:
+    import orjson
+else:
+    try:
+        import orjson
+    except ImportError:  # pragma: no cover
+        orjson = None
+
+# Fastest available decoder, orjson when installed
+loads: Callable[[Union[bytes, bytearray, str]], Any] = orjson.loads if orjson is not None else json.loads
+
+# A complete string, an unterminated one (more data needed), or a structural character
+TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|"|[{}\[\]:]')
+# Marks an array container on the path stack
+_ARRAY = object()
+
+
+class ObjectStream:
+    """Incremental parser yielding the elements of one array of a JSON document as soon as each is complete.
+    Only the element being parsed is buffered, so memory stays flat however long the array is. Everything outside
+    the array is kept and decoded into `envelope` once the document ends, with the array left empty.
+    """
+
+    def __init__(self, path: Sequence[str] = ("data", "instruments", "objects")):
+        self.path = tuple(path)
+        self.envelope: Optional[Dict[Any, Any]] = None
+        self._buffer = bytearray()
+        self._pos = 0
+        self._saved = 0
+        self._head = bytearray()
+        # Path of the containers around the scan position, the key being read for objects, _ARRAY for arrays
+        self._stack: List[Any] = []
+        self._key: Optional[bytes] = None
+        self._in_array = False
+        self._depth = 0
+        self._start = 0
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Consume the next chunk of the document, returning the array elements it completed."""
+        self._buffer += chunk
+        elements = list(self._scan())
+        self._compact()
+        return elements
+
+    def close(self) -> Dict[Any, Any]:
+        """Finish the document and decode everything around the array."""
+        saved = self._saved
+        self._head += self._buffer[saved:]
+        self._buffer = bytearray()
+        self._pos = self._saved = 0
+        self.envelope = loads(bytes(self._head)) if self._head.strip() else {}
+        return self.envelope
+
+    def _scan(self) -> Iterator[Any]:
+        while True:
+            match = TOKEN.search(self._buffer, self._pos)
+            if match is None:
+                self._pos = len(self._buffer)
+                return
+            token = match.group()
+            if token == b'"':
+                # The string continues in the next chunk
+                self._pos = match.start()
+                return
+            self._pos = match.end()
+            if self._in_array:
+                element = self._array_token(token, match.start(), match.end())
+                if element is not None:
+                    yield loads(element)
+            else:
+                self._envelope_token(token, match.end())
+
+    def _array_token(self, token: bytes, start: int, end: int) -> Optional[bytearray]:
+        if token in (b"{", b"["):
+            if self._depth == 0:
+                self._start = start
+            self._depth += 1
+        elif token in (b"}", b"]"):
+            if self._depth == 0:
+                # End of the array, what follows belongs to the envelope again
+                self._in_array = False
+                self._stack.pop()
+                self._saved = start
+                return None
+            self._depth -= 1
+            if self._depth == 0:
+                element_start = self._start
+                return self._buffer[element_start:end]
+        return None
+
+    def _envelope_token(self, token: bytes, end: int):
+        if token.startswith(b'"'):
+            self._key = token
+        elif token == b":":
+            if self._stack and self._key is not None:
+                self._stack[-1] = loads(self._key)
+        elif token == b"{":
+            self._stack.append(None)
+        elif token == b"[":
+            if tuple(self._stack) == self.path:
+                saved = self._saved
+                self._head += self._buffer[saved:end]
+                self._saved = end
+                self._in_array = True
+                self._depth = 0
+            self._stack.append(_ARRAY)
+        elif token in (b"}", b"]"):
+            self._stack.pop()
+
+    def _compact(self):
+        """Drop what was scanned already, keeping the envelope and a partly received element."""
+        saved, keep = self._saved, self._pos
+        if not self._in_array:
+            self._head += self._buffer[saved:keep]
+        else:
+            keep = self._start if self._depth else self._pos
+        del self._buffer[:keep]
+        self._pos -= keep
+        self._start = 0
+        self._saved = 0
@@ -0,0 +1,137 @@
+from dataclasses import dataclass, field
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .api import InstrumentMediaFiles, InstrumentResolver, InstrumentVersions
+from .client import KatunogClient
+
+Version = Tuple[Optional[str], bool]
+
+
+class SyncState:
+    """SQLite store of the `lastUpdated` and `mediaUploadOngoing` last synced for each instrument."""
+
+    def __init__(self, path: str = ".katunog_sync.sqlite"):
+        self.path = path
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS instruments (
+                id TEXT PRIMARY KEY,
+                last_updated TEXT,
+                media_upload_ongoing INTEGER NOT NULL,
+                synced_at REAL NOT NULL
+            )
+            """)
+
+    def versions(self) -> Dict[str, Version]:
+        rows = self._connection.execute("SELECT id, last_updated, media_upload_ongoing FROM instruments")
+        return {instrument_id: (last_updated, bool(ongoing)) for instrument_id, last_updated, ongoing in rows}
+
+    def update(self, versions: Dict[str, Version]):
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO instruments (id, last_updated, media_upload_ongoing, synced_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (instrument_id, last_updated, int(ongoing), now)
+                    for instrument_id, (last_updated, ongoing) in versions.items()
+                ],
+            )
+
+    def remove(self, instrument_ids: List[str]):
+        with self._connection:
+            self._connection.executemany("DELETE FROM instruments WHERE id = ?", [(i,) for i in instrument_ids])
+
+    def close(self):
+        self._connection.close()
+
+
+@dataclass
+class SyncResult:
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    instruments: List[Dict[Any, Any]] = field(default_factory=list)
+
+
+class DeltaSync:
+    """Incremental refresh of the catalog and its media driven by `lastUpdated`.
+    Only instruments that are new, changed, or were still uploading media are fetched in full and downloaded again.
+    """
+
+    DETAIL_FIELDS = (
+        "controlNumber",
+        "localName",
+        "englishName",
+        "alternateName",
+        "lastUpdated",
+        "mediaUploadOngoing",
+        "fileSet.edges.node.name",
+        "fileSet.edges.node.size",
+        "fileSet.edges.node.fileType",
+        "fileSet.edges.node.path",
+    )
+
+    def __init__(
+        self,
+        state: SyncState,
+        ssl: bool = True,
+        client: Optional[KatunogClient] = None,
+        folder: str = "downloads",
+        file_type: str = "audio",
+    ):
+        self.state = state
+        self.ssl = ssl
+        self.client = client
+        self.folder = folder
+        self.file_type = file_type
+
+    async def run(self, limit: int = 100, window: int = 4, download: bool = True, num_threads: int = 5) -> SyncResult:
+        previous = self.state.versions()
+        current: Dict[str, Version] = {}
+        result = SyncResult()
+
+        async for instrument in InstrumentVersions(ssl=self.ssl, client=self.client).iter_all(
+            limit=limit, window=window
+        ):
+            instrument_id = instrument["id"]
+            version = (instrument.get("lastUpdated"), bool(instrument.get("mediaUploadOngoing")))
+            current[instrument_id] = version
+            if instrument_id not in previous:
+                result.new.append(instrument_id)
+            elif previous[instrument_id][0] != version[0] or previous[instrument_id][1] or version[1]:
+                result.changed.append(instrument_id)
+        result.removed = [instrument_id for instrument_id in previous if instrument_id not in current]
+
+        stale = result.new + result.changed
+        logging.info(f"Sync found {len(result.new)} new, {len(result.changed)} changed, {len(result.removed)} removed")
+        resolver = InstrumentResolver(ssl=self.ssl, client=self.client, fields=self.DETAIL_FIELDS)
+        details = await resolver.resolve(stale) if stale else {}
+        result.instruments = [{**detail, "id": instrument_id} for instrument_id, detail in details.items() if detail]
+
+        synced = {instrument_id: current[instrument_id] for instrument_id in current if instrument_id not in details}
+        synced.update({instrument["id"]: current[instrument["id"]] for instrument in result.instruments})
+        if download and result.instruments:
+            media = InstrumentMediaFiles(ssl=self.ssl, client=self.client)
+            downloaded: Set[str] = set()
+            await media.download_instruments(
+                result.instruments,
+                self.folder,
+                self.file_type,
+                num_threads=num_threads,
+                refresh=True,
+                on_downloaded=lambda job, _: downloaded.add(os.path.basename(job.file_path)),
+            )
+            # Instruments with an archive that was not downloaded again in this run are left out of the state so
+            # the next run retries them, even when an older copy of the archive is still complete on disk
+            for instrument in result.instruments:
+                if not downloaded.issuperset(media.archive_names(instrument, (self.file_type,))):
+                    synced.pop(instrument["id"], None)
+
+        self.state.update(synced)
+        self.state.remove(result.removed)
+        return result
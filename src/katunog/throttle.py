@@ -0,0 +1,105 @@
+import asyncio
+from email.utils import parsedate_to_datetime
+import random
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Client-wide request rate limit: `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float = 10, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the number of requests in flight.
+    The limit grows by one per window of fast successes and is halved whenever a request fails, is throttled or
+    takes longer than `target_latency`, so it settles at what the server can sustain. Requests started before the
+    last decrease do not halve it again, so a burst of failures backs off once rather than once per request.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        target_latency: float = 2.0,
+        backoff_factor: float = 0.5,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff_factor = backoff_factor
+        self.in_flight = 0
+        self._generation = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Take a slot and return the current generation, to pass back to `release`."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return self._generation
+
+    async def release(self, latency: Optional[float] = None, failed: bool = False, generation: Optional[int] = None):
+        async with self._condition:
+            self.in_flight -= 1
+            if failed or (latency is not None and latency > self.target_latency):
+                if generation is None or generation >= self._generation:
+                    self.limit = max(self.minimum, self.limit * self.backoff_factor)
+                    self._generation += 1
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for failed or throttled requests, honoring `Retry-After`."""
+
+    RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, status: int) -> bool:
+        return status in self.RETRY_STATUSES
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before the next attempt, `attempt` being the number of attempts made so far."""
+        server_delay = parse_retry_after(retry_after)
+        if server_delay is not None:
+            return min(self.max_delay, server_delay)
+        # Full jitter keeps many clients that failed together from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from typing import IO, Any, Callable, Optional
+
+
+class AsyncFileWriter:
+    """Write-behind file writer for downloads.
+    Chunks are coalesced into buffers of `buffer_size` bytes and each buffer is written, and optionally hashed, on a
+    background thread while the next one fills up, so disk stalls never block the event loop.
+    `on_flushed` is called on that thread with `bytes_written` once each buffer reached the file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        append: bool = False,
+        buffer_size: int = 1024 * 1024,
+        preallocate: Optional[int] = None,
+        digest: Optional[Any] = None,
+        on_flushed: Optional[Callable[[int], None]] = None,
+    ):
+        self.path = path
+        self.append = append
+        self.buffer_size = buffer_size
+        self.preallocate = preallocate
+        self.digest = digest
+        self.on_flushed = on_flushed
+        self.bytes_written = 0
+        self._start = 0
+        self._file: Optional[IO[bytes]] = None
+        self._buffer = bytearray()
+        self._pending: Optional[asyncio.Future] = None
+
+    async def __aenter__(self) -> "AsyncFileWriter":
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        self._file, self._start = await asyncio.to_thread(self._open)
+
+    async def write(self, chunk: bytes):
+        self._buffer += chunk
+        if len(self._buffer) >= self.buffer_size:
+            await self._flush()
+
+    async def close(self):
+        if self._file is None:
+            return
+        try:
+            await self._flush()
+            if self._pending is not None:
+                await self._pending
+        finally:
+            await asyncio.to_thread(self._close)
+
+    def _open(self):
+        # Appending goes through r+b and a seek rather than O_APPEND, which would write past the preallocated space
+        f = open(self.path, "r+b" if self.append and os.path.exists(self.path) else "wb")
+        start = f.seek(0, os.SEEK_END)
+        if self.preallocate and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), start, self.preallocate)
+            except OSError as e:
+                logging.debug(f"Could not preallocate {self.path}: {e}")
+        return f, start
+
+    async def _flush(self):
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        if self._buffer:
+            data, self._buffer = self._buffer, bytearray()
+            self._pending = asyncio.ensure_future(asyncio.to_thread(self._write, data))
+
+    def _write(self, data: bytearray):
+        assert self._file is not None
+        self._file.write(data)
+        if self.digest is not None:
+            self.digest.update(data)
+        self.bytes_written += len(data)
+        if self.on_flushed is not None:
+            # Hand the buffer to the OS first, so what is reported survives the process dying
+            self._file.flush()
+            self.on_flushed(self.bytes_written)
+
+    def _close(self):
+        assert self._file is not None
+        try:
+            # Drop whatever preallocated space was not filled, e.g. when the transfer was interrupted
+            if self.preallocate:
+                self._file.truncate(self._start + self.bytes_written)
+        finally:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,252 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import math
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+import wave
+
+import numpy as np
+import pandas as pd
+
+from .unzipper import extracted_members
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+else:
+    try:
+        import pyarrow as pa
+    except ImportError:  # pragma: no cover
+        pa = None
+
+Features = Dict[str, Any]
+# Features (None when the file could not be decoded) and seconds spent
+AnalysisResult = Tuple[Optional[Features], float]
+
+COLUMNS = (
+    "instrument_id",
+    "local_name",
+    "file",
+    "checksum",
+    "sample_rate",
+    "channels",
+    "duration",
+    "rms",
+    "rms_dbfs",
+    "spectral_centroid",
+    "pitch",
+)
+
+
+class AudioAnalyzer:
+    """Profiles the recordings extracted by `Unzipper`: duration, sample rate, loudness, brightness and pitch.
+    Files are listed from the Unzipper ledger, whose archive names give each recording its instrument's localName
+    and whose member CRCs key a cache of features, so only new or changed recordings are decoded again.
+    """
+
+    CACHE_FILE_NAME = ".audio_features.json"
+    EXTENSIONS = (".wav",)
+
+    def __init__(
+        self,
+        output_folder: str,
+        num_workers: Optional[int] = None,
+        instrument_ids: Optional[Dict[str, str]] = None,
+        frame_size: int = 2048,
+        metrics: Optional[Any] = None,
+    ):
+        self.output_folder = output_folder
+        self.num_workers = num_workers or os.cpu_count() or 1
+        # localName -> instrument ID, used to join the features to the catalog
+        self.instrument_ids = instrument_ids or {}
+        self.frame_size = frame_size
+        # Anything with an `observe(name, value, **labels)` method, e.g. katunog's MetricsRegistry
+        self.metrics = metrics
+        self.cache_path = os.path.join(self.output_folder, self.CACHE_FILE_NAME)
+        self.cache: Dict[str, Features] = self._load_json(self.cache_path)
+
+    def recordings(self) -> Iterator[Tuple[str, str, str]]:
+        """(localName, member path, checksum) of every extracted recording, in ledger order."""
+        for local_name, member, crc in extracted_members(self.output_folder):
+            if not member.lower().endswith(self.EXTENSIONS):
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.output_folder, member))
+            except OSError:
+                continue
+            yield local_name, member, f"{crc:08x}-{size}"
+
+    def analyze(self, path: Optional[str] = None) -> pd.DataFrame:
+        """Feature table of every recording, decoding only those missing from the cache.
+        With `path` the table is also written there as Parquet.
+        """
+        if path is not None and pa is None:
+            raise ImportError("Parquet export requires pyarrow, install it with `poetry install --extras parquet`")
+        recordings = list(self.recordings())
+        pending = {checksum: member for _, member, checksum in recordings if checksum not in self.cache}
+        if pending:
+            logging.info(f"Analyzing {len(pending)} of {len(recordings)} recording(s) in {self.output_folder}")
+            for checksum, (features, seconds) in zip(pending, self._run(list(pending.values()))):
+                if self.metrics is not None:
+                    self.metrics.observe("katunog_analysis_seconds", seconds, decoded=str(features is not None).lower())
+                if features is not None:
+                    self.cache[checksum] = features
+        # Keep the cache to the recordings still on disk
+        self.cache = {checksum: self.cache[checksum] for *_, checksum in recordings if checksum in self.cache}
+        self._save_json(self.cache_path, self.cache)
+
+        rows = [
+            {
+                "instrument_id": self.instrument_ids.get(local_name),
+                "local_name": local_name,
+                "file": member,
+                "checksum": checksum,
+                **self.cache[checksum],
+            }
+            for local_name, member, checksum in recordings
+            if checksum in self.cache
+        ]
+        table = pd.DataFrame(rows, columns=list(COLUMNS))
+        if path is not None:
+            tmp_path = f"{path}.tmp"
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        return table
+
+    def _run(self, members: List[str]) -> List[AnalysisResult]:
+        paths = [os.path.join(self.output_folder, member) for member in members]
+        if self.num_workers <= 1 or len(paths) <= 1:
+            return [analyze_file(path, self.frame_size) for path in paths]
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            chunk_size = max(1, len(paths) // (self.num_workers * 4))
+            return list(executor.map(analyze_file, paths, [self.frame_size] * len(paths), chunksize=chunk_size))
+
+    @staticmethod
+    def _load_json(path: str) -> Dict[str, Any]:
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable {path}: {e}")
+            return {}
+
+    @staticmethod
+    def _save_json(path: str, data: Dict[str, Any]):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def analyze_file(path: str, frame_size: int = 2048, block_frames: int = 65536) -> AnalysisResult:
+    """Decode a PCM WAV file block by block and compute its features.
+    Module level so it can run in a process pool.
+    """
+    started = time.perf_counter()
+    try:
+        with wave.open(path, "rb") as reader:
+            features = _FeatureAccumulator(reader.getframerate(), reader.getnchannels(), frame_size)
+            sample_width = reader.getsampwidth()
+            while True:
+                data = reader.readframes(block_frames)
+                if not data:
+                    break
+                features.add(decode_pcm(data, sample_width, reader.getnchannels()))
+        return features.result(), time.perf_counter() - started
+    except (wave.Error, EOFError) as e:
+        logging.error(f"Cannot decode {path}: {e}")
+    except Exception as e:
+        logging.error(f"Failed to analyze {path}: {e}")
+    return None, time.perf_counter() - started
+
+
+def decode_pcm(data: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """Interleaved PCM frames as a mono float signal in [-1, 1]."""
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float64) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype="<i2") / 32768.0
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        # Shift the 24-bit value to the top of an int32 and back to extend its sign
+        samples = (((raw[:, 0] << 8) | (raw[:, 1] << 16) | (raw[:, 2] << 24)) >> 8) / 8388608.0
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype="<i4") / 2147483648.0
+    else:
+        raise wave.Error(f"Unsupported sample width {sample_width}")
+    usable = len(samples) - len(samples) % channels
+    return samples[:usable].reshape(-1, channels).mean(axis=1)
+
+
+class _FeatureAccumulator:
+    """Running sums over the blocks of one recording, spectra are taken over non-overlapping frames."""
+
+    def __init__(self, sample_rate: int, channels: int, frame_size: int, fmin: float = 50.0, fmax: float = 2000.0):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_size = frame_size
+        self.window = np.hanning(frame_size)
+        self.frequencies = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+        self.min_lag = max(2, int(sample_rate / fmax))
+        self.max_lag = min(frame_size - 2, int(math.ceil(sample_rate / fmin)))
+        self.samples = 0
+        self.squares = 0.0
+        self.weighted = 0.0
+        self.magnitude = 0.0
+        self.pitches: List[np.ndarray] = []
+        self.frames = 0
+        self._rest = np.zeros(0)
+
+    def add(self, block: np.ndarray):
+        self.samples += len(block)
+        self.squares += float(np.dot(block, block))
+        signal = np.concatenate((self._rest, block))
+        usable = len(signal) - len(signal) % self.frame_size
+        self._rest = signal[usable:]
+        if usable:
+            self._frames(signal[:usable].reshape(-1, self.frame_size))
+
+    def result(self) -> Features:
+        if not self.frames and len(self._rest):
+            # Recordings shorter than one frame are analyzed zero-padded
+            self._frames(np.pad(self._rest, (0, self.frame_size - len(self._rest)))[np.newaxis])
+        rms = math.sqrt(self.squares / self.samples) if self.samples else 0.0
+        pitches = np.concatenate(self.pitches) if self.pitches else np.zeros(0)
+        return {
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "duration": self.samples / self.sample_rate if self.sample_rate else 0.0,
+            "rms": rms,
+            "rms_dbfs": 20 * math.log10(rms) if rms > 0 else None,
+            "spectral_centroid": self.weighted / self.magnitude if self.magnitude > 0 else None,
+            "pitch": float(np.median(pitches)) if len(pitches) else None,
+        }
+
+    def _frames(self, frames: np.ndarray):
+        self.frames += len(frames)
+        magnitudes = np.abs(np.fft.rfft(frames * self.window, axis=1))
+        self.weighted += float((magnitudes @ self.frequencies).sum())
+        self.magnitude += float(magnitudes.sum())
+        self.pitches.append(self._pitch(frames))
+
+    def _pitch(self, frames: np.ndarray) -> np.ndarray:
+        """Autocorrelation pitch of the voiced frames, refined between lags by parabolic interpolation."""
+        min_lag, end = self.min_lag, self.max_lag + 1
+        centered = frames - frames.mean(axis=1, keepdims=True)
+        spectrum = np.fft.rfft(centered, n=2 * self.frame_size, axis=1)
+        correlation = np.fft.irfft(spectrum.real**2 + spectrum.imag**2, axis=1)[:, : end + 1]
+        energy = correlation[:, 0]
+        voiced = energy > 1e-6 * self.frame_size
+        if not voiced.any():
+            return np.zeros(0)
+        correlation = correlation[voiced] / energy[voiced, np.newaxis]
+        lags = min_lag + np.argmax(correlation[:, min_lag:end], axis=1)
+        rows = np.arange(len(lags))
+        before, peak, after = correlation[rows, lags - 1], correlation[rows, lags], correlation[rows, lags + 1]
+        periodic = peak > 0.5
+        curvature = before - 2 * peak + after
+        offset = np.divide(0.5 * (before - after), curvature, out=np.zeros_like(peak), where=curvature < 0)
+        return self.sample_rate / (lags[periodic] + offset[periodic])
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+import wave
+
+import numpy as np
+
+from .unzipper import extracted_members
+
+# NumPy dtype of the PCM samples for each sample width, 24-bit samples have none
+PCM_DTYPES: Dict[int, np.dtype] = {1: np.dtype(np.uint8), 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+COLUMNS = ("instrument_id", "local_name", "file", "segment", "offset", "length", "sample_rate", "channels", "width")
+
+
+class SampleStore:
+    """Extracted samples packed into a few large segment files that readers memory-map.
+    A columnar index gives every file its instrument, segment, offset, length and sample format. WAV files are stored
+    as their raw PCM frames so `samples` is a NumPy view straight onto the mapping, other files are stored as is.
+    Entries start on page boundaries, so reading a short sample touches a single page of one open mapping.
+    """
+
+    INDEX_FILE_NAME = "index.json"
+    FORMAT_VERSION = 1
+    ALIGNMENT = mmap.PAGESIZE
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        with open(os.path.join(folder, self.INDEX_FILE_NAME), "r") as f:
+            data = json.load(f)
+        if data.get("version") != self.FORMAT_VERSION:
+            raise ValueError(f"Unsupported sample store format {data.get('version')} in {folder}")
+        self.segments: List[str] = data["segments"]
+        # Fingerprint of the ledger and instrument IDs the store was packed from
+        self.source: Optional[str] = data.get("source")
+        self._columns: Dict[str, List[Any]] = data["columns"]
+        self._rows = {file: row for row, file in enumerate(self._columns["file"])}
+        self._instruments: Dict[str, List[int]] = {}
+        for row, instrument_id in enumerate(self._columns["instrument_id"]):
+            if instrument_id is not None:
+                self._instruments.setdefault(instrument_id, []).append(row)
+        self._mmaps: Dict[int, mmap.mmap] = {}
+
+    def __enter__(self) -> "SampleStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, file: object) -> bool:
+        return file in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def close(self):
+        """Unmap the segments, those still exported through a view are released once the view is."""
+        for segment in self._mmaps.values():
+            try:
+                segment.close()
+            except BufferError:
+                pass
+        self._mmaps.clear()
+
+    def entry(self, file: str) -> Dict[str, Any]:
+        row = self._row(file)
+        return {column: self._columns[column][row] for column in COLUMNS}
+
+    def files(self, instrument_id: str) -> List[str]:
+        """Files packed for an instrument, in index order."""
+        return [self._columns["file"][row] for row in self._instruments.get(instrument_id, [])]
+
+    def view(self, file: str) -> memoryview:
+        """Read-only bytes of a file, PCM frames for WAV files, without copying."""
+        row = self._row(file)
+        offset, length = self._columns["offset"][row], self._columns["length"][row]
+        if not length:
+            return memoryview(b"")
+        end = offset + length
+        return memoryview(self._segment(self._columns["segment"][row]))[offset:end]
+
+    def samples(self, file: str) -> np.ndarray:
+        """Read-only (frames, channels) array of a WAV file's samples, viewed straight from the mapping."""
+        row = self._row(file)
+        width, channels = self._columns["width"][row], self._columns["channels"][row]
+        if not width:
+            raise ValueError(f"{file} was not stored as PCM")
+        if width not in PCM_DTYPES:
+            raise ValueError(f"{file} has {width * 8}-bit samples, which NumPy cannot view, decode `view` instead")
+        return np.frombuffer(self.view(file), dtype=PCM_DTYPES[width]).reshape(-1, channels)
+
+    @classmethod
+    def pack(
+        cls,
+        output_folder: str,
+        folder: str,
+        instrument_ids: Optional[Dict[str, str]] = None,
+        segment_size: int = 1 << 30,
+    ) -> "SampleStore":
+        """Pack every member the Unzipper ledger of `output_folder` records into a store in `folder`.
+        `instrument_ids` maps localName to instrument ID. Segments are filled up to `segment_size` bytes, a file
+        larger than that gets a segment of its own. The previous store is replaced once the new one is complete.
+        """
+        instrument_ids = instrument_ids or {}
+        source = _source(output_folder, instrument_ids, segment_size)
+        os.makedirs(folder, exist_ok=True)
+        columns: Dict[str, List[Any]] = {column: [] for column in COLUMNS}
+        segments: List[str] = []
+        writer: Optional[BinaryIO] = None
+        try:
+            for local_name, member, _ in extracted_members(output_folder):
+                path = os.path.join(output_folder, member)
+                if not os.path.isfile(path):
+                    continue
+                sample_format, expected = _sample_format(path)
+                position = writer.tell() if writer is not None else 0
+                offset = (position + cls.ALIGNMENT - 1) // cls.ALIGNMENT * cls.ALIGNMENT
+                if writer is None or (position and offset + expected > segment_size):
+                    if writer is not None:
+                        writer.close()
+                    segments.append(f"segment-{len(segments):05d}.bin")
+                    writer = open(os.path.join(folder, f"{segments[-1]}.tmp"), "wb")
+                    offset = 0
+                writer.seek(offset)
+                _copy(path, writer, sample_format)
+                # What was actually written, a WAV header may promise more frames than the file holds
+                length = writer.tell() - offset
+                values = (instrument_ids.get(local_name), local_name, member, len(segments) - 1, offset, length)
+                for column, value in zip(COLUMNS, (*values, *sample_format)):
+                    columns[column].append(value)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        for segment in segments:
+            os.replace(os.path.join(folder, f"{segment}.tmp"), os.path.join(folder, segment))
+        index_path = os.path.join(folder, cls.INDEX_FILE_NAME)
+        with open(f"{index_path}.tmp", "w") as f:
+            json.dump({"version": cls.FORMAT_VERSION, "source": source, "segments": segments, "columns": columns}, f)
+        os.replace(f"{index_path}.tmp", index_path)
+        for file_name in os.listdir(folder):
+            if file_name.startswith("segment-") and file_name.endswith(".bin") and file_name not in segments:
+                os.remove(os.path.join(folder, file_name))
+        logging.info(f"Packed {len(columns['file'])} file(s) into {len(segments)} segment(s) in {folder}")
+        return cls(folder)
+
+    @classmethod
+    def update(
+        cls,
+        output_folder: str,
+        folder: str,
+        instrument_ids: Optional[Dict[str, str]] = None,
+        segment_size: int = 1 << 30,
+    ) -> "SampleStore":
+        """Open the store in `folder`, packing it again only when the Unzipper ledger of `output_folder` or
+        `instrument_ids` changed since it was packed.
+        """
+        try:
+            store = cls(folder)
+        except (OSError, ValueError, KeyError):
+            return cls.pack(output_folder, folder, instrument_ids, segment_size)
+        if store.source == _source(output_folder, instrument_ids or {}, segment_size):
+            return store
+        store.close()
+        return cls.pack(output_folder, folder, instrument_ids, segment_size)
+
+    def _row(self, file: str) -> int:
+        if file not in self._rows:
+            raise KeyError(file)
+        return self._rows[file]
+
+    def _segment(self, number: int) -> mmap.mmap:
+        if number not in self._mmaps:
+            with open(os.path.join(self.folder, self.segments[number]), "rb") as f:
+                self._mmaps[number] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmaps[number]
+
+
+def _source(output_folder: str, instrument_ids: Dict[str, str], segment_size: int) -> str:
+    members = list(extracted_members(output_folder))
+    data = json.dumps([members, sorted(instrument_ids.items()), segment_size])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _sample_format(path: str) -> Tuple[Tuple[int, int, int], int]:
+    """(sample rate, channels, sample width) and stored length of a file, zeros for anything but a PCM WAV file."""
+    if path.lower().endswith(".wav"):
+        try:
+            with wave.open(path, "rb") as reader:
+                channels, width = reader.getnchannels(), reader.getsampwidth()
+                return (reader.getframerate(), channels, width), reader.getnframes() * channels * width
+        except (wave.Error, EOFError) as e:
+            logging.error(f"Storing {path} as is, it cannot be decoded: {e}")
+    return (0, 0, 0), os.path.getsize(path)
+
+
+def _copy(path: str, writer: BinaryIO, sample_format: Tuple[int, int, int], block_frames: int = 65536):
+    if not sample_format[2]:
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, writer)
+        return
+    with wave.open(path, "rb") as reader:
+        for data in iter(lambda: reader.readframes(block_frames), b""):
+            writer.write(data)
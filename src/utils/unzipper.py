@@ -1,26 +1,273 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import hashlib
+import io
+import json
 import logging
 import os
+import re
+import threading
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple, Union
 import zipfile
 
+LedgerEntry = Dict[str, Any]
+# Ledger entry (None when the archive could not be read), number of members written and seconds spent
+ExtractResult = Tuple[Optional[LedgerEntry], int, float]
+# Suffix of the archives written by katunog's `download_files`, `<localName>.<download ID>.<file type>.zip`
+ARCHIVE_NAME = re.compile(r"(\.\d+(\.[a-z]+)?)?\.zip$", re.IGNORECASE)
+
 
 class Unzipper:
-    def __init__(self, zip_folder: str, output_folder: str):
+    """Extracts the downloaded instrument archives.
+    Each archive is extracted into a folder of its own named like the archive without `.zip`, the same name as its
+    view in katunog's `MediaStore`, so archives whose members share paths, e.g. two downloads of one instrument,
+    do not overwrite each other.
+    A ledger in the output folder remembers what every archive extracted to, so unchanged archives are skipped
+    and only members whose CRC changed are written again.
+    Used as a context manager it keeps a worker pool open so archives can be submitted one by one while they are
+    still being downloaded.
+    """
+
+    LEDGER_FILE_NAME = ".unzip_ledger.json"
+
+    def __init__(
+        self,
+        zip_folder: str,
+        output_folder: str,
+        num_workers: int = 1,
+        use_processes: bool = False,
+        metrics: Optional[Any] = None,
+    ):
         self.zip_folder = zip_folder
         self.output_folder = output_folder
+        self.num_workers = num_workers
+        self.use_processes = use_processes
+        # Anything with an `observe(name, value, **labels)` method, e.g. katunog's MetricsRegistry
+        self.metrics = metrics
         os.makedirs(self.output_folder, exist_ok=True)
+        self.ledger_path = os.path.join(self.output_folder, self.LEDGER_FILE_NAME)
+        self.ledger: Dict[str, LedgerEntry] = self._load_ledger()
+        self._ledger_lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._pending: List[Future] = []
+
+    def __enter__(self) -> "Unzipper":
+        self._executor = self._create_executor()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for future in self._pending:
+            if not future.cancelled() and future.exception() is not None:
+                logging.error(f"Extraction failed: {future.exception()}")
+        self._pending = []
+
+    def submit(self, zip_path: str, data: Optional[bytes] = None) -> Future:
+        """Queue one archive for extraction on the open pool.
+        With `data` the archive is extracted from memory and `zip_path` only names it in the ledger.
+        The returned future resolves once the archive is recorded in the ledger and fails if it could not be extracted.
+        """
+        if self._executor is None:
+            raise RuntimeError("Unzipper.submit needs the Unzipper to be used as a context manager")
+        if data is None:
+            future = self._executor.submit(extract_archive, zip_path, self.output_folder, self.ledger.get(zip_path))
+        else:
+            future = self._executor.submit(
+                extract_archive_bytes, data, zip_path, self.output_folder, self.ledger.get(zip_path)
+            )
+        extracted: Future = Future()
+        future.add_done_callback(lambda done: self._on_extracted(zip_path, done, extracted))
+        self._pending.append(future)
+        return extracted
 
     def unzip_files(self):
-        for file_name in os.listdir(self.zip_folder):
-            if file_name.endswith(".zip"):
-                zip_path = os.path.join(self.zip_folder, file_name)
+        zip_paths = [
+            os.path.join(self.zip_folder, file_name)
+            for file_name in sorted(os.listdir(self.zip_folder))
+            if file_name.endswith(".zip")
+        ]
+        if self.num_workers <= 1:
+            for zip_path in zip_paths:
                 self._unzip_file(zip_path)
+            return
+
+        with self._create_executor() as executor:
+            futures = {
+                executor.submit(extract_archive, zip_path, self.output_folder, self.ledger.get(zip_path)): zip_path
+                for zip_path in zip_paths
+            }
+            for future in as_completed(futures):
+                self._record(futures[future], future.result())
+
+    def _on_extracted(self, zip_path: str, future: Future, extracted: Future):
+        if future.cancelled():
+            extracted.cancel()
+            return
+        error = future.exception()
+        if error is None:
+            result = future.result()
+            self._record(zip_path, result)
+            if result[0] is None:
+                error = RuntimeError(f"{zip_path} could not be extracted")
+        if error is None:
+            extracted.set_result(result)
+        else:
+            extracted.set_exception(error)
+
+    def _create_executor(self) -> Executor:
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=self.num_workers)
+        return ThreadPoolExecutor(max_workers=self.num_workers)
 
     def _unzip_file(self, zip_path: str):
+        self._record(zip_path, extract_archive(zip_path, self.output_folder, self.ledger.get(zip_path)))
+
+    def _record(self, zip_path: str, result: ExtractResult):
+        entry, extracted, seconds = result
+        if self.metrics is not None:
+            self.metrics.observe("katunog_extraction_seconds", seconds, extracted=str(bool(extracted)).lower())
+        if entry is None:
+            return
+        with self._ledger_lock:
+            changed = self.ledger.get(zip_path) != entry
+            self.ledger[zip_path] = entry
+            if changed:
+                self._save_ledger()
+        if extracted:
+            logging.info(f"Extracted {extracted} member(s) of {zip_path} to {self.output_folder}")
+        else:
+            logging.info(f"{zip_path} is already extracted in {self.output_folder}")
+
+    def _load_ledger(self) -> Dict[str, LedgerEntry]:
+        if not os.path.exists(self.ledger_path):
+            return {}
         try:
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                zip_ref.extractall(self.output_folder)
-                logging.info(f"Extracted {zip_path} to {self.output_folder}")
-        except zipfile.BadZipFile:
-            logging.error(f"Bad zip file: {zip_path}")
-        except Exception as e:
-            logging.error(f"Failed to unzip {zip_path}: {e}")
+            with open(self.ledger_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable unzip ledger {self.ledger_path}: {e}")
+            return {}
+
+    def _save_ledger(self):
+        tmp_path = f"{self.ledger_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.ledger, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.ledger_path)
+
+
+def extract_archive(zip_path: str, output_folder: str, previous: Optional[LedgerEntry] = None) -> ExtractResult:
+    """Extract the members of `zip_path` that are new or changed since `previous` into its `archive_folder`.
+    Module level so it can run in a process pool.
+    """
+    started = time.perf_counter()
+    try:
+        stat = os.stat(zip_path)
+        previous = _previous(zip_path, previous)
+        members: Dict[str, int] = previous.get("members", {})
+        if (
+            previous.get("size") == stat.st_size
+            and previous.get("mtime_ns") == stat.st_mtime_ns
+            and _members_present(output_folder, members)
+        ):
+            return previous, 0, time.perf_counter() - started
+
+        with open(zip_path, "rb") as f:
+            sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+        entry: LedgerEntry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        return (
+            *_extract_members(zip_path, output_folder, archive_folder(zip_path), entry, previous),
+            time.perf_counter() - started,
+        )
+    except zipfile.BadZipFile:
+        logging.error(f"Bad zip file: {zip_path}")
+    except Exception as e:
+        logging.error(f"Failed to unzip {zip_path}: {e}")
+    return None, 0, time.perf_counter() - started
+
+
+def extract_archive_bytes(
+    data: bytes, zip_path: str, output_folder: str, previous: Optional[LedgerEntry] = None
+) -> ExtractResult:
+    """Same as `extract_archive` for an archive held in memory, the zip never touches the disk.
+    `zip_path` only names the archive and with it the folder it is extracted into.
+    """
+    started = time.perf_counter()
+    try:
+        entry: LedgerEntry = {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+        folder = archive_folder(zip_path)
+        return (
+            *_extract_members(io.BytesIO(data), output_folder, folder, entry, _previous(zip_path, previous)),
+            time.perf_counter() - started,
+        )
+    except zipfile.BadZipFile:
+        logging.error("Bad zip file received in memory")
+    except Exception as e:
+        logging.error(f"Failed to unzip archive from memory: {e}")
+    return None, 0, time.perf_counter() - started
+
+
+def archive_folder(zip_path: str) -> str:
+    """Folder of `output_folder` an archive is extracted into, its name without `.zip`."""
+    name = os.path.basename(zip_path)
+    return name[:-4] if name.lower().endswith(".zip") else name
+
+
+def extracted_members(output_folder: str) -> Iterator[Tuple[str, str, int]]:
+    """(instrument localName, member path, CRC) of every member recorded in the ledger of `output_folder`.
+    Member paths are relative to `output_folder`, inside the archive's folder. The localName is the archive's name
+    without the `.<download ID>.<file type>.zip` ending of `download_files`.
+    """
+    ledger_path = os.path.join(output_folder, Unzipper.LEDGER_FILE_NAME)
+    if not os.path.exists(ledger_path):
+        return
+    try:
+        with open(ledger_path, "r") as f:
+            ledger: Dict[str, LedgerEntry] = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"Ignoring unreadable unzip ledger {ledger_path}: {e}")
+        return
+    for zip_path, entry in sorted(ledger.items()):
+        archive_name = ARCHIVE_NAME.sub("", os.path.basename(zip_path))
+        for member, crc in sorted((entry.get("members") or {}).items()):
+            yield archive_name, member, crc
+
+
+def _previous(zip_path: str, previous: Optional[LedgerEntry]) -> LedgerEntry:
+    """The ledger entry to compare against, none when it was extracted elsewhere, e.g. before archives had folders."""
+    previous = previous or {}
+    return previous if previous.get("folder") == archive_folder(zip_path) else {}
+
+
+def _extract_members(
+    source: Union[str, IO[bytes]], output_folder: str, folder: str, entry: LedgerEntry, previous: LedgerEntry
+) -> Tuple[LedgerEntry, int]:
+    entry = {**entry, "folder": folder}
+    members: Dict[str, int] = previous.get("members", {})
+    if entry["sha256"] == previous.get("sha256") and _members_present(output_folder, members):
+        return {**entry, "members": members}, 0
+
+    # Member paths are recorded relative to `output_folder`, so readers of the ledger need not know the folders
+    archive_output = os.path.join(output_folder, folder)
+    extracted = 0
+    with zipfile.ZipFile(source, "r") as zip_ref:
+        infos = [info for info in zip_ref.infolist() if not info.is_dir()]
+        for info in infos:
+            target = os.path.join(archive_output, info.filename)
+            if members.get(f"{folder}/{info.filename}") == info.CRC and _has_size(target, info.file_size):
+                continue
+            zip_ref.extract(info, archive_output)
+            extracted += 1
+    return {**entry, "members": {f"{folder}/{info.filename}": info.CRC for info in infos}}, extracted
+
+
+def _members_present(output_folder: str, members: Dict[str, int]) -> bool:
+    return all(os.path.exists(os.path.join(output_folder, name)) for name in members)
+
+
+def _has_size(path: str, size: int) -> bool:
+    try:
+        return os.path.getsize(path) == size
+    except OSError:
+        return False
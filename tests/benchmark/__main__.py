@@ -0,0 +1,5 @@
+import sys
+
+from tests.benchmark.harness import main
+
+sys.exit(main())
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+from dataclasses import asdict
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import tomllib
+
+from src.katunog.api import InstrumentList, InstrumentLocation, InstrumentMediaFiles, KatunogAPI
+from src.katunog.client import KatunogClient
+from src.katunog.throttle import RetryPolicy
+from src.utils.unzipper import Unzipper
+from tests.benchmark.server import MockKatunogServer, MockServerConfig, build_archive, page_responses
+
+Result = Dict[str, float]
+API = TypeVar("API", bound=KatunogAPI)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def point_at(api: API, server: MockKatunogServer) -> API:
+    """Send an endpoint's requests and downloads to the mock server instead of Katunog."""
+    api.BASE_URL = server.base_url
+    api.API_URL = f"{server.base_url}/api/"
+    return api
+
+
+async def bench_list_endpoints(config: MockServerConfig, limit: int = 50, window: int = 4) -> Result:
+    """Pages per second for each list endpoint, walking the whole catalog."""
+    results: Result = {}
+    async with MockKatunogServer(config) as server:
+        async with KatunogClient(ssl=False, retry=RetryPolicy(base_delay=0)) as client:
+            for endpoint in (InstrumentList, InstrumentLocation, InstrumentMediaFiles):
+                api = point_at(endpoint(ssl=False, client=client), server)
+                pages = 0
+                started = time.perf_counter()
+                async for _ in api.iter_pages(limit=limit, window=window):
+                    pages += 1
+                results[f"{endpoint.__name__}_pages_per_second"] = pages / (time.perf_counter() - started)
+        results["server_errors"] = server.errors
+    return results
+
+
+async def bench_download_files(config: MockServerConfig, num_threads: int = 5) -> Result:
+    """End-to-end `download_files` throughput, from the listing query to archives on disk."""
+    async with MockKatunogServer(config) as server:
+        with tempfile.TemporaryDirectory() as folder:
+            async with KatunogClient(ssl=False, retry=RetryPolicy(base_delay=0)) as client:
+                api = point_at(InstrumentMediaFiles(ssl=False, client=client), server)
+                started = time.perf_counter()
+                await api.download_files(page=1, limit=config.instruments, folder=folder, num_threads=num_threads)
+                seconds = time.perf_counter() - started
+            archives = [name for name in os.listdir(folder) if name.endswith(".zip")]
+            downloaded = sum(os.path.getsize(os.path.join(folder, name)) for name in archives)
+        return {
+            "archives": len(archives),
+            "archives_per_second": len(archives) / seconds,
+            "bytes_per_second": downloaded / seconds,
+            "server_errors": server.errors,
+        }
+
+
+async def bench_to_dataframe(config: MockServerConfig, limit: int = 100) -> Result:
+    """Time to convert a full catalog's worth of page responses into a dataframe."""
+    server = MockKatunogServer(config)
+    pages = page_responses(server, max(1, -(-config.instruments // limit)), limit)
+    started = time.perf_counter()
+    df = InstrumentList().to_dataframe(pages)
+    seconds = time.perf_counter() - started
+    return {"rows": len(df), "seconds": seconds, "rows_per_second": len(df) / seconds}
+
+
+async def bench_unzipper(config: MockServerConfig, archives: int = 50, num_workers: int = 4) -> Result:
+    """Extraction rate of `Unzipper` over a folder of freshly downloaded archives."""
+    data = build_archive(config.archive_size, config.files_per_archive)
+    with tempfile.TemporaryDirectory() as zip_folder, tempfile.TemporaryDirectory() as output_folder:
+        for number in range(archives):
+            with open(os.path.join(zip_folder, f"archive_{number}.zip"), "wb") as f:
+                f.write(data)
+        started = time.perf_counter()
+        await asyncio.to_thread(Unzipper(zip_folder, output_folder, num_workers=num_workers).unzip_files)
+        seconds = time.perf_counter() - started
+    return {
+        "archives_per_second": archives / seconds,
+        "bytes_per_second": archives * len(data) / seconds,
+    }
+
+
+BENCHMARKS: Dict[str, Callable[[MockServerConfig], Awaitable[Result]]] = {
+    "list_endpoints": bench_list_endpoints,
+    "download_files": bench_download_files,
+    "to_dataframe": bench_to_dataframe,
+    "unzipper": bench_unzipper,
+}
+
+
+async def run_benchmarks(config: MockServerConfig, names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Run the selected benchmarks one after the other, recording wall time and peak traced memory of each."""
+    results: Dict[str, Result] = {}
+    for name in names or list(BENCHMARKS):
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            result = await BENCHMARKS[name](config)
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results[name] = {**result, "wall_seconds": time.perf_counter() - started, "peak_memory_bytes": peak}
+        logging.info(f"{name}: {results[name]}")
+    return {
+        "version": _project_version(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": asdict(config),
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.1) -> List[str]:
+    """Describe every metric that got worse than `baseline` by more than `tolerance`.
+    Rates (`*_per_second`) regress when they drop, times and memory (`*_seconds`, `*_bytes`) when they grow.
+    """
+    regressions = []
+    for name, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            before = baseline.get("results", {}).get(name, {}).get(metric)
+            if not before:
+                continue
+            if metric.endswith("_per_second"):
+                change = (before - value) / before
+            elif metric.endswith(("_seconds", "_bytes")):
+                change = (value - before) / before
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(f"{name}.{metric}: {before:.6g} -> {value:.6g} ({change:+.1%} worse)")
+    return regressions
+
+
+def _project_version() -> str:
+    with open(os.path.join(PROJECT_ROOT, "pyproject.toml"), "rb") as f:
+        return tomllib.load(f)["tool"]["poetry"]["version"]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark katunog against a local mock Katunog server")
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run out of {', '.join(BENCHMARKS)}, default all")
+    parser.add_argument("--output", default="reports/benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results to compare against, exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown, default 0.1")
+    parser.add_argument("--instruments", type=int, default=MockServerConfig.instruments)
+    parser.add_argument("--latency", type=float, default=MockServerConfig.latency, help="seconds per request")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second per response")
+    parser.add_argument("--archive-size", type=int, default=MockServerConfig.archive_size)
+    parser.add_argument("--error-rate", type=float, default=MockServerConfig.error_rate)
+    parser.add_argument("--seed", type=int, default=MockServerConfig.seed)
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING)
+    config = MockServerConfig(
+        instruments=args.instruments,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        archive_size=args.archive_size,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    report = asyncio.run(run_benchmarks(config, args.benchmarks or None))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(report["results"], indent=2, sort_keys=True))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
@@ -0,0 +1,165 @@
+import asyncio
+from dataclasses import dataclass
+import io
+import random
+import re
+from typing import Any, Dict, List, Optional
+import zipfile
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+@dataclass
+class MockServerConfig:
+    """Knobs for the stand-in Katunog server.
+    `bandwidth` is in bytes per second per response (None for unthrottled), `error_rate` is the share of requests
+    answered with `error_status` instead, drawn from a generator seeded with `seed` so runs are repeatable.
+    """
+
+    instruments: int = 500
+    latency: float = 0.0
+    bandwidth: Optional[float] = None
+    archive_size: int = 256 * 1024
+    files_per_archive: int = 4
+    error_rate: float = 0.0
+    error_status: int = 503
+    chunk_size: int = 64 * 1024
+    seed: int = 0
+
+
+class MockKatunogServer:
+    """Local aiohttp stand-in for the GraphQL endpoint and `/instruments/download_all_files`.
+    Serves a synthetic catalog of `config.instruments` instruments, each with one archive to download.
+    """
+
+    PAGE_PATTERN = re.compile(r"page:\s*(\d+)")
+    LIMIT_PATTERN = re.compile(r"limit:\s*(\d+)")
+
+    def __init__(self, config: Optional[MockServerConfig] = None):
+        self.config = config or MockServerConfig()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._random = random.Random(self.config.seed)
+        self._archive = build_archive(self.config.archive_size, self.config.files_per_archive)
+        app = web.Application()
+        app.router.add_post("/api/", self._graphql)
+        app.router.add_get("/instruments/download_all_files", self._download)
+        self._server = TestServer(app)
+
+    async def __aenter__(self) -> "MockKatunogServer":
+        await self._server.start_server()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._server.close()
+
+    @property
+    def base_url(self) -> str:
+        return str(self._server.make_url("")).rstrip("/")
+
+    @property
+    def archive_bytes(self) -> int:
+        return len(self._archive)
+
+    def instrument(self, index: int) -> Dict[str, Any]:
+        return {
+            "id": str(index),
+            "controlNumber": f"PIISD0{index:05d}",
+            "localName": f"Instrument {index}",
+            "englishName": f"Instrument {index % 37}",
+            "alternateName": "",
+            "province": {"name": f"Province {index % 81}", "region": {"name": f"Region {index % 17}"}},
+            "city": {"name": f"City {index % 250}"},
+            "ethnolinguistic": {"name": f"Group {index % 110}"},
+            "hornbostel": {"name": ("Idiophone", "Membranophone", "Chordophone", "Aerophone")[index % 4]},
+            "english": {"generalDescription": "Lorem ipsum " * 20, "materialAndMake": f"Material {index % 12}"},
+            "lastUpdated": "2024-06-01T00:00:00+00:00",
+            "mediaUploadOngoing": False,
+            "fileSet": {"edges": [{"node": {"path": f"files/PIISD0{index}/sample.wav", "fileType": "audio"}}]},
+        }
+
+    async def _graphql(self, request: web.Request) -> web.StreamResponse:
+        error = await self._begin()
+        if error is not None:
+            return error
+        body = await request.json()
+        variables = body.get("variables") or {}
+        page = int(variables.get("page") or _search(self.PAGE_PATTERN, body["query"], 1))
+        limit = int(variables.get("limit") or _search(self.LIMIT_PATTERN, body["query"], 10))
+        start = (page - 1) * limit
+        objects = [self.instrument(index) for index in range(start, min(start + limit, self.config.instruments))]
+        pages = max(1, -(-self.config.instruments // limit))
+        response = {
+            "data": {
+                "instruments": {
+                    "page": page,
+                    "pages": pages,
+                    "hasNext": page < pages,
+                    "hasPrev": page > 1,
+                    "objects": objects,
+                }
+            }
+        }
+        return web.json_response(response)
+
+    async def _download(self, request: web.Request) -> web.StreamResponse:
+        error = await self._begin()
+        if error is not None:
+            return error
+        response = web.StreamResponse(headers={"Content-Type": "application/zip", "ETag": '"mock"'})
+        response.content_length = len(self._archive)
+        await response.prepare(request)
+        starts = range(0, len(self._archive), self.config.chunk_size)
+        for start, end in zip(starts, [*starts[1:], len(self._archive)]):
+            chunk = self._archive[start:end]
+            await response.write(chunk)
+            self.bytes_sent += len(chunk)
+            if self.config.bandwidth:
+                await asyncio.sleep(len(chunk) / self.config.bandwidth)
+        await response.write_eof()
+        return response
+
+    async def _begin(self) -> Optional[web.Response]:
+        self.requests += 1
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        if self.config.error_rate and self._random.random() < self.config.error_rate:
+            self.errors += 1
+            return web.Response(status=self.config.error_status, headers={"Retry-After": "0"})
+        return None
+
+
+def build_archive(size: int, files: int) -> bytes:
+    """A zip of `files` stored members adding up to about `size` bytes of incompressible data."""
+    generator = random.Random(size)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for number in range(max(1, files)):
+            archive.writestr(f"sample_{number}.wav", generator.randbytes(max(1, size // max(1, files))))
+    return buffer.getvalue()
+
+
+def _search(pattern: "re.Pattern[str]", text: str, default: Any) -> Any:
+    match = pattern.search(text)
+    return match.group(1) if match else default
+
+
+def page_responses(server: MockKatunogServer, pages: int, limit: int) -> List[Dict[str, Any]]:
+    """Page responses shaped like the list endpoints', built without going through HTTP."""
+    total = server.config.instruments
+    return [
+        {
+            "data": {
+                "instruments": {
+                    "page": page,
+                    "pages": pages,
+                    "objects": [
+                        server.instrument(index) for index in range((page - 1) * limit, min(page * limit, total))
+                    ],
+                }
+            }
+        }
+        for page in range(1, pages + 1)
+    ]
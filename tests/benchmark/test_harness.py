@@ -0,0 +1,27 @@
+import unittest
+
+from tests.benchmark.harness import compare, run_benchmarks
+from tests.benchmark.server import MockServerConfig
+
+
+class TestBenchmarkHarness(unittest.IsolatedAsyncioTestCase):
+    async def test_benchmarks_run_against_mock_server_with_injected_errors(self):
+        config = MockServerConfig(instruments=6, archive_size=4096, error_rate=0.2, seed=1)
+
+        report = await run_benchmarks(config)
+
+        results = report["results"]
+        self.assertEqual(set(results), {"list_endpoints", "download_files", "to_dataframe", "unzipper"})
+        self.assertEqual(results["download_files"]["archives"], 6)
+        self.assertEqual(results["to_dataframe"]["rows"], 6)
+        self.assertGreater(results["list_endpoints"]["server_errors"] + results["download_files"]["server_errors"], 0)
+        self.assertTrue(all(result["peak_memory_bytes"] > 0 for result in results.values()))
+
+    def test_compare_flags_slower_rates_and_longer_times(self):
+        baseline = {"results": {"to_dataframe": {"rows_per_second": 100.0, "seconds": 1.0, "rows": 10}}}
+        current = {"results": {"to_dataframe": {"rows_per_second": 50.0, "seconds": 1.05, "rows": 20}}}
+
+        regressions = compare(baseline, current, tolerance=0.1)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("to_dataframe.rows_per_second"))
@@ -1,227 +1,530 @@
+import asyncio
+from concurrent.futures import Future
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+import zipfile
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
 from src.katunog.api import (
+    BatchQuery,
     InstrumentById,
     InstrumentDescriptions,
     InstrumentList,
     InstrumentLocation,
     InstrumentMediaFiles,
+    InstrumentResolver,
+    InstrumentVersions,
     KatunogAPI,
+    PaginatedAPI,
     ProvinceList,
     RegionAndIslandList,
 )
+from src.katunog.manifest import DownloadManifest, file_sha256
+from src.katunog.scheduler import DownloadJob, DownloadProgress
 from tests.unit.abstract_function_test_case import AbstractFunctionTestCase
 
 
 class TestInstrumentAPIBase(AbstractFunctionTestCase):
-    async def assert_get_data(self, api_instance: KatunogAPI, query: str, *args, **kwargs):
+    async def assert_get_data(
+        self, api_instance: KatunogAPI, query: str, variables: Optional[Dict[str, Any]], *args, **kwargs
+    ):
         await api_instance.get_data(*args, **kwargs)
+        payload: Dict[str, Any] = {"query": query}
+        if variables:
+            payload["variables"] = variables
         self.mock_post.assert_called_once_with(
             api_instance.API_URL,
             headers=api_instance.HEADERS,
-            json={"query": query},
+            json=payload,
             ssl=api_instance.ssl,
         )
 
 
+class TestPaginatedAPI(AbstractFunctionTestCase):
+    async def test_iter_all_fetches_every_page_within_window(self):
+        in_flight = max_in_flight = 0
+
+        async def get_data(page: int = 1, limit: int = 10):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01 * (page % 3))
+            in_flight -= 1
+            return {"data": {"instruments": {"page": page, "pages": 7, "objects": [{"id": f"{page}-{limit}"}]}}}
+
+        api = InstrumentList()
+        with patch.object(api, "get_data", side_effect=get_data):
+            ids = [instrument["id"] async for instrument in api.iter_all(limit=2, window=3)]
+
+        self.assertEqual(sorted(ids), sorted(f"{page}-2" for page in range(1, 8)))
+        self.assertLessEqual(max_in_flight, 3)
+
+    async def test_iter_pages_single_page(self):
+        api = InstrumentLocation()
+        response = {"data": {"instruments": {"page": 1, "pages": 1, "objects": []}}}
+        with patch.object(api, "get_data", return_value=response) as mock_get_data:
+            pages = [page async for page in api.iter_pages(limit=5)]
+
+        self.assertEqual(pages, [response])
+        mock_get_data.assert_called_once_with(page=1, limit=5)
+        self.assertIsInstance(api, PaginatedAPI)
+
+
 class TestInstrumentList(TestInstrumentAPIBase):
     async def test_get_data(self):
-        page = limit = 1
-        filter = "katunog"
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}, filter: "{filter}") {{
-                page, pages, hasNext, hasPrev, objects {{
-                    id,
-                    controlNumber,
-                    localName,
-                    englishName,
-                    alternateName,
-                    thumbnail,
-                    province {{ name }},
-                    city {{ name }},
-                    ethnolinguistic {{ name }},
-                    hornbostel {{ name }},
-                    length,
-                    width,
-                    height,
-                    dimensionUnit,
-                    diameter,
-                    diameterUnit,
-                    english {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }},
-                    filipino {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }},
-                    lastUpdated,
-                    mediaUploadOngoing,
-                    isReported,
-                    fileSet {{
-                        edges {{
-                            node {{
-                                name,
-                                size,
-                                caption,
-                                fileType,
-                                isPublic,
-                                uploadDone,
-                                path,
-                                isBackground,
-                                number
-                            }}
-                        }}
-                    }}
-                }}
-            }}
-        }}
-        """
-        await self.assert_get_data(InstrumentList(), query, page=page, limit=limit, filter=filter)
+        query = (
+            "query InstrumentList($page: Int!, $limit: Int!, $filter: String!) { "
+            "instruments(page: $page, limit: $limit, filter: $filter) { page, pages, hasNext, hasPrev, objects { "
+            "id, controlNumber, localName, englishName, alternateName, thumbnail, province { name }, city { name }, "
+            "ethnolinguistic { name }, hornbostel { name }, length, width, height, dimensionUnit, diameter, "
+            "diameterUnit, english { generalDescription, materialAndMake, playingParts, otherDetails }, "
+            "filipino { generalDescription, materialAndMake, playingParts, otherDetails }, lastUpdated, "
+            "mediaUploadOngoing, isReported, fileSet { edges { node { name, size, caption, fileType, isPublic, "
+            "uploadDone, path, isBackground, number } } } } } }"
+        )
+        variables = {"page": 1, "limit": 1, "filter": "katunog"}
+        await self.assert_get_data(InstrumentList(), query, variables, page=1, limit=1, filter="katunog")
+
+    async def test_get_data_selects_only_requested_fields(self):
+        query = (
+            "query InstrumentList($page: Int!, $limit: Int!, $filter: String!) { "
+            "instruments(page: $page, limit: $limit, filter: $filter) { page, pages, hasNext, hasPrev, objects { "
+            "localName, province { name } } } }"
+        )
+        variables = {"page": 2, "limit": 5, "filter": "katunog"}
+        await self.assert_get_data(
+            InstrumentList(), query, variables, page=2, limit=5, fields=["localName", "province.name"]
+        )
+
+    def test_compiled_query_is_reused(self):
+        api = InstrumentList()
+        self.assertIs(api.compile(api.query_part(fields=("id",))), api.compile(api.query_part(fields=["id"])))
+        with self.assertRaises(ValueError):
+            api.compile(api.query_part(fields=["id } }"]))
+
+
+class TestInstrumentListDataFrame(AbstractFunctionTestCase):
+    PAGE = {
+        "data": {
+            "instruments": {
+                "objects": [
+                    {
+                        "id": "1",
+                        "localName": "Kulintang",
+                        "englishName": "Gong chime",
+                        "city": {"name": "Cotabato City"},
+                        "province": {"name": "Maguindanao"},
+                        "ethnolinguistic": {"name": "Maguindanaon"},
+                        "hornbostel": {"name": "Idiophone"},
+                        "english": {"materialAndMake": "Bronze"},
+                    },
+                    {"id": "2", "localName": "Kudyapi", "city": None, "province": None, "hornbostel": None},
+                ]
+            }
+        }
+    }
+
+    def test_to_dataframe_fills_hornbostel_and_uses_categoricals(self):
+        df = InstrumentList().to_dataframe(self.PAGE)
+
+        self.assertEqual(list(df.columns), list(InstrumentList.DEFAULT_COLUMNS))
+        self.assertEqual(df["Hornbostel"].tolist(), ["Idiophone", ""])
+        self.assertEqual(df["Location"].tolist(), ["Cotabato City, Maguindanao", ", "])
+        self.assertEqual(df["Hornbostel"].dtype, "category")
+
+    def test_to_dataframe_projects_columns_across_pages(self):
+        df = InstrumentList().to_dataframe([self.PAGE, self.PAGE], columns=["ID", "Province"])
+
+        self.assertEqual(list(df.columns), ["ID", "Province"])
+        self.assertEqual(df["ID"].tolist(), ["1", "2", "1", "2"])
+        with self.assertRaises(ValueError):
+            InstrumentList().to_dataframe(self.PAGE, columns=["Horbostel"])
+
+    async def test_fetch_dataframe_consumes_streamed_pages(self):
+        api = InstrumentList()
+        with patch.object(api, "get_data", return_value={**self.PAGE}) as mock_get_data:
+            df = await api.fetch_dataframe(limit=2, columns=["Instrument", "Location"])
+
+        self.assertEqual(df["Instrument"].tolist(), ["Kulintang", "Kudyapi"])
+        mock_get_data.assert_called_once_with(page=1, limit=2, fields=("localName", "city.name", "province.name"))
 
 
 class TestInstrumentLocation(TestInstrumentAPIBase):
     async def test_get_data(self):
-        page = limit = 1
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}) {{
-                page,
-                pages,
-                hasNext,
-                hasPrev,
-                objects {{
-                    id,
-                    province {{
-                        name,
-                        region {{
-                            name,
-                            island {{ name }}
-                        }}
-                    }}
-                }}
-            }}
-        }}
-        """
-        await self.assert_get_data(InstrumentLocation(), query, page=page, limit=limit)
+        query = (
+            "query InstrumentLocation($page: Int!, $limit: Int!) { instruments(page: $page, limit: $limit) { "
+            "page, pages, hasNext, hasPrev, objects { id, province { name, region { name, island { name } } } } } }"
+        )
+        await self.assert_get_data(InstrumentLocation(), query, {"page": 1, "limit": 1}, page=1, limit=1)
 
 
 class TestInstrumentDescriptions(TestInstrumentAPIBase):
     async def test_get_data(self):
-        page = limit = 1
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}) {{
-                page,
-                pages,
-                hasNext,
-                hasPrev,
-                objects {{
-                    id,
-                    english {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }},
-                    filipino {{
-                        generalDescription,
-                        materialAndMake,
-                        playingParts,
-                        otherDetails
-                    }}
-                }}
-            }}
-        }}
-        """
-        await self.assert_get_data(InstrumentDescriptions(), query, page=page, limit=limit)
+        query = (
+            "query InstrumentDescriptions($page: Int!, $limit: Int!) { instruments(page: $page, limit: $limit) { "
+            "page, pages, hasNext, hasPrev, objects { id, "
+            "english { generalDescription, materialAndMake, playingParts, otherDetails }, "
+            "filipino { generalDescription, materialAndMake, playingParts, otherDetails } } } }"
+        )
+        await self.assert_get_data(InstrumentDescriptions(), query, {"page": 1, "limit": 1}, page=1, limit=1)
 
 
 class TestInstrumentMediaFiles(TestInstrumentAPIBase):
     async def test_get_data(self):
-        page = limit = 1
-        query = f"""
-        {{
-            instruments(page: {page}, limit: {limit}) {{
-                page,
-                pages,
-                hasNext,
-                hasPrev,
-                objects {{
-                    id,
-                    localName,
-                    fileSet {{
-                        edges {{
-                            node {{
-                                name,
-                                size,
-                                caption,
-                                fileType,
-                                isPublic,
-                                uploadDone,
-                                path,
-                                isBackground,
-                                number
-                            }}
-                        }}
-                    }}
-                }}
-            }}
-        }}
-        """
-        await self.assert_get_data(InstrumentMediaFiles(), query, page=page, limit=limit)
+        query = (
+            "query InstrumentMediaFiles($page: Int!, $limit: Int!) { instruments(page: $page, limit: $limit) { "
+            "page, pages, hasNext, hasPrev, objects { id, localName, fileSet { edges { node { name, size, caption, "
+            "fileType, isPublic, uploadDone, path, isBackground, number } } } } } }"
+        )
+        await self.assert_get_data(InstrumentMediaFiles(), query, {"page": 1, "limit": 1}, page=1, limit=1)
 
 
 class TestInstrumentById(TestInstrumentAPIBase):
     async def test_get_data(self):
         instrument_id = "SW5zdHJ1bWVudFR5cGU6MjY1MA=="
-        query = f"""
-        {{
-            instrument(id: "{instrument_id}") {{
-                controlNumber,
-                localName,
-                englishName,
-                alternateName,
-                fileSet {{
-                    edges {{
-                        node {{
-                            name,
-                            path
-                        }}
-                    }}
-                }}
-            }}
-        }}
-        """
-        await self.assert_get_data(InstrumentById(), query, instrument_id=instrument_id)
+        query = (
+            "query InstrumentById($id: ID!) { instrument(id: $id) { controlNumber, localName, englishName, "
+            "alternateName, fileSet { edges { node { name, path } } } } }"
+        )
+        await self.assert_get_data(InstrumentById(), query, {"id": instrument_id}, instrument_id=instrument_id)
 
 
 class TestRegionAndIslandList(TestInstrumentAPIBase):
     async def test_get_data(self):
-        query = """
-        {
-            regions {
-                name
-                island {
-                    name
-                }
-            }
-        }
-        """
-        await self.assert_get_data(RegionAndIslandList(), query)
+        query = "query RegionAndIslandList { regions { name, island { name } } }"
+        await self.assert_get_data(RegionAndIslandList(), query, None)
 
 
 class TestProvinceList(TestInstrumentAPIBase):
     async def test_get_data(self):
-        query = """
-        {
-            provinces {
-                id,
-                name
-            }
+        query = "query ProvinceList { provinces { id, name } }"
+        await self.assert_get_data(ProvinceList(), query, None)
+
+
+class TestInstrumentResolver(AbstractFunctionTestCase):
+    async def test_resolve_batches_and_memoizes(self):
+        async def post_request(query: str, variables: Dict[str, str]):
+            return {"data": {alias: {"localName": alias} for alias in variables}}
+
+        resolver = InstrumentResolver(batch_size=2)
+        with patch.object(resolver, "_post_request", side_effect=post_request) as mock_post_request:
+            first = await resolver.resolve(["a", "b", "c", "a"])
+            second = await resolver.resolve(["b", "c"])
+
+        self.assertEqual(mock_post_request.call_count, 2)
+        self.assertEqual(list(first), ["a", "b", "c"])
+        self.assertEqual(first["c"], {"localName": "i0"})
+        self.assertEqual(second, {"b": first["b"], "c": first["c"]})
+
+    def test_build_query_aliases_each_id(self):
+        query = InstrumentResolver().build_query(2)
+        self.assertTrue(query.startswith("query InstrumentResolver($i0: ID!, $i1: ID!) {"))
+        self.assertIn("i0: instrument(id: $i0) { controlNumber, localName, englishName, alternateName }", query)
+        self.assertIn("i1: instrument(id: $i1)", query)
+
+
+class TestBatchQuery(AbstractFunctionTestCase):
+    async def test_overlapping_pages_share_one_alias_and_results_are_split(self):
+        instrument = {
+            "id": "1",
+            "localName": "Kulintang",
+            "province": {"name": "Maguindanao", "region": {"name": "BARMM", "island": {"name": "Mindanao"}}},
+            "english": {"generalDescription": "Gong chime"},
         }
-        """
-        await self.assert_get_data(ProvinceList(), query)
+        response: Dict[str, Any] = {
+            "data": {
+                "q0": {"page": 1, "pages": 3, "hasNext": True, "hasPrev": False, "objects": [instrument]},
+                "q1": [{"id": "5", "name": "Maguindanao"}],
+            },
+            "errors": [{"message": "Boom", "path": ["q1", 0, "name"]}],
+        }
+        batch = BatchQuery()
+        batch.add(InstrumentLocation(), page=1, limit=1)
+        batch.add(InstrumentDescriptions(), page=1, limit=1, fields=["english.generalDescription"])
+        batch.add(ProvinceList())
+
+        query, variables, aliases = batch.build_query()
+        with patch.object(batch, "_post_request", return_value=response) as mock_post_request:
+            location, descriptions, provinces = await batch.get_data()
+
+        mock_post_request.assert_called_once_with(query, {"q0_page": 1, "q0_limit": 1})
+        self.assertEqual(aliases, ["q0", "q0", "q1"])
+        self.assertTrue(query.startswith("query BatchQuery($q0_page: Int!, $q0_limit: Int!) { "))
+        self.assertIn("q0: instruments(page: $q0_page, limit: $q0_limit) { page, pages, hasNext, hasPrev", query)
+        self.assertIn("english { generalDescription }", query)
+        self.assertIn("q1: provinces { id, name }", query)
+        self.assertEqual(
+            location["data"]["instruments"]["objects"],
+            [{"id": "1", "province": instrument["province"]}],
+        )
+        self.assertEqual(
+            descriptions["data"]["instruments"]["objects"], [{"english": {"generalDescription": "Gong chime"}}]
+        )
+        self.assertEqual(provinces, {"data": {"provinces": response["data"]["q1"]}, "errors": response["errors"]})
+        self.assertNotIn("errors", location)
+
+    async def test_different_arguments_get_their_own_alias(self):
+        batch = BatchQuery()
+        batch.add(InstrumentList(), page=1, limit=1)
+        batch.add(InstrumentList(), page=2, limit=1)
+        batch.add(InstrumentById(), "SW5z")
+
+        _, variables, aliases = batch.build_query()
+
+        self.assertEqual(aliases, ["q0", "q1", "q2"])
+        self.assertEqual(variables["q1_page"], 2)
+        self.assertEqual(variables["q2_id"], "SW5z")
+        with self.assertRaises(TypeError):
+            batch.add(InstrumentResolver(), ["SW5z"])
+        with self.assertRaises(TypeError):
+            batch.add(BatchQuery())
+
+
+class TestBatchQueryPages(AbstractFunctionTestCase):
+    async def test_iter_pages_sends_one_request_per_page_for_all_endpoints(self):
+        async def post_request(query: str, variables: Dict[str, int]):
+            page = {"page": variables["q0_page"], "pages": 3, "objects": [{"id": str(variables["q0_page"])}]}
+            return {"data": {"q0": page}}
+
+        batch = BatchQuery()
+        with patch.object(BatchQuery, "_post_request", side_effect=post_request) as mock_post_request:
+            pages = [results async for results in batch.iter_pages([InstrumentLocation(), InstrumentVersions()])]
+
+        self.assertEqual(mock_post_request.call_count, 3)
+        self.assertEqual(sorted(results[1]["data"]["instruments"]["page"] for results in pages), [1, 2, 3])
+        self.assertTrue(all(len(results) == 2 for results in pages))
+
+
+class TestInstrumentMediaFilesDownload(AbstractFunctionTestCase):
+    async def test_download_instruments_queues_one_job_per_archive(self):
+        instruments = [
+            {"id": "a", "localName": "Kulintang", "fileSet": {"edges": [{"node": {"path": "x/PIISD01/1.wav"}}] * 2}},
+            {"id": "b", "localName": "Kudyapi", "fileSet": {"edges": [{"node": {"path": "x/PIISD02/1.wav"}}]}},
+            {"id": "c", "localName": "Gangsa", "fileSet": {"edges": [{"node": {"path": "x/PIISD03/1.wav"}}]}},
+        ]
+        api = InstrumentMediaFiles()
+        with tempfile.TemporaryDirectory() as folder:
+            with zipfile.ZipFile(os.path.join(folder, "Gangsa.3.audio.zip"), "w") as archive:
+                archive.writestr("gangsa.wav", b"RIFF")
+            with patch.object(api, "download_file") as mock_download_file:
+                await api.download_instruments(instruments, folder=folder, num_threads=2)
+
+        downloaded = sorted(call.args[3] for call in mock_download_file.call_args_list)
+        self.assertEqual(downloaded, ["Kudyapi", "Kulintang"])
+        self.assertIn("instrument_id=1&file_type=audio", mock_download_file.call_args_list[0].args[1])
+
+    async def test_downloads_that_do_not_complete_are_reported_as_failed(self):
+        instruments = [{"id": "a", "localName": "Kulintang", "fileSet": {"edges": [{"node": {"path": "x/PIISD01/f"}}]}}]
+        events: List[DownloadProgress] = []
+        downloaded: List[DownloadJob] = []
+        api = InstrumentMediaFiles()
+        with tempfile.TemporaryDirectory() as folder:
+            with patch.object(api, "download_file", return_value=False):
+                await api.download_instruments(
+                    instruments,
+                    folder=folder,
+                    on_progress=events.append,
+                    on_downloaded=lambda job, _: downloaded.append(job),
+                )
+
+        self.assertIsInstance(events[-1].error, RuntimeError)
+        self.assertEqual(downloaded, [])
+
+    async def test_several_file_types_are_queued_in_one_pass_and_absent_types_skipped(self):
+        def node(number: int, file_type: str, size: int):
+            return {"node": {"path": f"x/PIISD0{number}/f", "fileType": file_type.upper(), "size": size}}
+
+        instruments = [
+            {
+                "id": "a",
+                "localName": "Kulintang",
+                "fileSet": {"edges": [node(1, "audio", 900), node(1, "video", 9000)]},
+            },
+            {"id": "b", "localName": "Kudyapi", "fileSet": {"edges": [node(2, "image", 90), node(2, "image", 90)]}},
+        ]
+        api = InstrumentMediaFiles()
+        with tempfile.TemporaryDirectory() as folder:
+            with patch.object(api, "download_file") as mock_download_file:
+                await api.download_instruments(
+                    instruments, folder=folder, file_type=("audio", "image", "video"), num_threads=1
+                )
+
+        downloaded = [os.path.basename(call.args[2]) for call in mock_download_file.call_args_list]
+        self.assertEqual(sorted(downloaded), ["Kudyapi.2.image.zip", "Kulintang.1.audio.zip", "Kulintang.1.video.zip"])
+        self.assertIn(
+            "instrument_id=2&file_type=image",
+            mock_download_file.call_args_list[downloaded.index("Kudyapi.2.image.zip")].args[1],
+        )
+
+    async def test_archives_of_a_list_start_smallest_first(self):
+        sizes = {"Gangsa": 9000, "Kudyapi": 5000, "Kulintang": 700, "Agung": 300, "Kubing": 40}
+        instruments = [
+            {"id": name, "localName": name, "fileSet": {"edges": [{"node": {"path": f"x/PIISD0{i}/f", "size": size}}]}}
+            for i, (name, size) in enumerate(sizes.items(), 1)
+        ]
+        api = InstrumentMediaFiles()
+        with tempfile.TemporaryDirectory() as folder:
+            with patch.object(api, "download_file") as mock_download_file:
+                await api.download_instruments(instruments, folder=folder, num_threads=1)
+
+        started = [call.args[3] for call in mock_download_file.call_args_list]
+        self.assertEqual(started, ["Kubing", "Agung", "Kulintang", "Kudyapi", "Gangsa"])
+
+    async def test_download_instruments_consumes_a_stream_and_resolves_names_at_its_end(self):
+        async def instruments():
+            yield {"id": "a", "localName": "Kulintang", "fileSet": {"edges": [{"node": {"path": "x/PIISD01/1.wav"}}]}}
+            yield {"id": "b", "localName": None, "fileSet": {"edges": [{"node": {"path": "x/PIISD02/1.wav"}}]}}
+            yield {"localName": None, "fileSet": {"edges": [{"node": {"path": "x/PIISD03/1.wav"}}]}}
+
+        api = InstrumentMediaFiles()
+        with tempfile.TemporaryDirectory() as folder:
+            with (
+                patch.object(api, "download_file") as mock_download_file,
+                patch.object(api.resolver, "resolve", return_value={"b": {"localName": "Kudyapi"}}) as mock_resolve,
+            ):
+                await api.download_instruments(instruments(), folder=folder, num_threads=2)
+
+        mock_resolve.assert_called_once_with(["b"])
+        self.assertEqual(sorted(call.args[3] for call in mock_download_file.call_args_list), ["Kudyapi", "Kulintang"])
+
+    async def test_a_stream_is_read_to_the_end_while_its_downloads_wait(self):
+        # The downloads wait for the stream's concurrency slot, which is only released once the stream has ended
+        listed = asyncio.Event()
+
+        async def instruments():
+            for i in range(1, 8):
+                yield {"id": str(i), "localName": f"I{i}", "fileSet": {"edges": [{"node": {"path": f"x/PIISD0{i}/"}}]}}
+            listed.set()
+
+        async def download_file(*args, **kwargs):
+            await listed.wait()
+            return True
+
+        api = InstrumentMediaFiles()
+        with tempfile.TemporaryDirectory() as folder:
+            with patch.object(api, "download_file", side_effect=download_file) as mock_download_file:
+                await asyncio.wait_for(api.download_instruments(instruments(), folder=folder, num_threads=1), 5)
+
+        self.assertEqual(mock_download_file.call_count, 7)
+
+
+class TestInstrumentMediaFilesDownloadFile(AbstractFunctionTestCase):
+    ARCHIVE = bytes(range(256)) * 64
+
+    async def asyncSetUp(self):
+        self.range_headers: List[Optional[str]] = []
+
+        async def handler(request: web.Request):
+            self.range_headers.append(request.headers.get("Range"))
+            start = int(request.headers["Range"][6:-1]) if "Range" in request.headers else 0
+            status = 206 if start else 200
+            return web.Response(body=self.ARCHIVE[start:], status=status, headers={"ETag": '"v1"'})
+
+        app = web.Application()
+        app.router.add_get("/archive", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.tmp.cleanup()
+
+    async def test_partial_download_is_resumed_and_recorded(self):
+        file_path = os.path.join(self.tmp.name, "Kulintang.zip")
+        with open(f"{file_path}.part", "wb") as f:
+            f.write(self.ARCHIVE[:1000])
+        manifest = DownloadManifest(self.tmp.name)
+        manifest.record("Kulintang.zip", 1000, None, etag='"v1"', complete=False)
+
+        async with aiohttp.ClientSession() as session:
+            await InstrumentMediaFiles().download_file(
+                session, str(self.server.make_url("/archive")), file_path, "Kulintang", manifest=manifest
+            )
+
+        self.assertEqual(self.range_headers, ["bytes=1000-"])
+        self.assertFalse(os.path.exists(f"{file_path}.part"))
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), self.ARCHIVE)
+        entry = manifest.get("Kulintang.zip")
+        assert entry is not None
+        self.assertEqual((entry["size"], entry["etag"], entry["complete"]), (len(self.ARCHIVE), '"v1"', True))
+        self.assertEqual(entry["sha256"], file_sha256(file_path))
+
+    async def test_part_file_left_preallocated_is_downloaded_again(self):
+        file_path = os.path.join(self.tmp.name, "Kulintang.zip")
+        with open(f"{file_path}.part", "wb") as f:
+            f.write(bytes(len(self.ARCHIVE)))
+        manifest = DownloadManifest(self.tmp.name)
+        manifest.record("Kulintang.zip", 0, None, etag='"v1"', complete=False, preallocated=True)
+
+        async with aiohttp.ClientSession() as session:
+            downloaded = await InstrumentMediaFiles().download_file(
+                session, str(self.server.make_url("/archive")), file_path, "Kulintang", manifest=manifest
+            )
+
+        self.assertTrue(downloaded)
+        self.assertEqual(self.range_headers, [None])
+        self.assertTrue(manifest.verify("Kulintang.zip"))
+
+    async def test_part_file_left_preallocated_resumes_from_recorded_progress(self):
+        file_path = os.path.join(self.tmp.name, "Kulintang.zip")
+        with open(f"{file_path}.part", "wb") as f:
+            f.write(self.ARCHIVE[:1000] + bytes(len(self.ARCHIVE) - 1000))
+        manifest = DownloadManifest(self.tmp.name)
+        manifest.record("Kulintang.zip", 1000, None, etag='"v1"', complete=False, preallocated=True)
+
+        async with aiohttp.ClientSession() as session:
+            downloaded = await InstrumentMediaFiles().download_file(
+                session, str(self.server.make_url("/archive")), file_path, "Kulintang", manifest=manifest
+            )
+
+        self.assertTrue(downloaded)
+        self.assertEqual(self.range_headers, ["bytes=1000-"])
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), self.ARCHIVE)
+        self.assertTrue(manifest.verify("Kulintang.zip"))
+
+    async def test_downloaded_archives_are_handed_over_from_memory(self):
+        instruments = [{"id": "a", "localName": "Kulintang", "fileSet": {"edges": [{"node": {"path": "x/PIISD01/"}}]}}]
+        handed_over = []
+        api = InstrumentMediaFiles()
+        download_to_buffer = api.download_to_buffer
+
+        async def from_test_server(session, url, *args, **kwargs):
+            return await download_to_buffer(session, str(self.server.make_url("/archive")), *args, **kwargs)
+
+        with patch.object(api, "download_to_buffer", side_effect=from_test_server):
+            await api.download_instruments(
+                instruments,
+                folder=self.tmp.name,
+                on_downloaded=lambda job, data: handed_over.append((job.instrument_name, data)),
+                keep_archives=False,
+            )
+
+        self.assertEqual(handed_over, [("Kulintang", self.ARCHIVE)])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "Kulintang.1.audio.zip")))
+        self.assertTrue(DownloadManifest(self.tmp.name).is_complete("Kulintang.1.audio.zip"))
+
+    async def test_archives_from_memory_are_complete_only_once_consumed(self):
+        instruments = [{"id": "a", "localName": "Kulintang", "fileSet": {"edges": [{"node": {"path": "x/PIISD01/"}}]}}]
+        extraction: Future = Future()
+        api = InstrumentMediaFiles()
+        download_to_buffer = api.download_to_buffer
+
+        async def from_test_server(session, url, *args, **kwargs):
+            return await download_to_buffer(session, str(self.server.make_url("/archive")), *args, **kwargs)
+
+        with patch.object(api, "download_to_buffer", side_effect=from_test_server):
+            await api.download_instruments(
+                instruments, folder=self.tmp.name, on_downloaded=lambda job, data: extraction, keep_archives=False
+            )
+
+        self.assertFalse(DownloadManifest(self.tmp.name).is_complete("Kulintang.1.audio.zip"))
+        extraction.set_exception(RuntimeError("Bad zip file"))
+        self.assertFalse(DownloadManifest(self.tmp.name).is_complete("Kulintang.1.audio.zip"))
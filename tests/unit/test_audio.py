@@ -0,0 +1,120 @@
+import math
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import wave
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from src.utils.audio import AudioAnalyzer, analyze_file, decode_pcm
+from src.utils.unzipper import Unzipper
+
+
+def wav_bytes(path: str, frequency: float, seconds: float, sample_rate: int = 8000, channels: int = 1) -> bytes:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    signal = (0.5 * np.sin(2 * np.pi * frequency * t) * 32767).astype("<i2")
+    with wave.open(path, "wb") as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(sample_rate)
+        writer.writeframes(np.repeat(signal, channels).tobytes())
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class TestAnalyzeFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_features_of_a_stereo_tone(self):
+        path = os.path.join(self.tmp.name, "tone.wav")
+        wav_bytes(path, 440.0, 1.5, channels=2)
+
+        features, _ = analyze_file(path, block_frames=3000)
+
+        assert features is not None
+        self.assertEqual(features["sample_rate"], 8000)
+        self.assertEqual(features["channels"], 2)
+        self.assertAlmostEqual(features["duration"], 1.5)
+        self.assertAlmostEqual(features["rms"], 0.5 / math.sqrt(2), places=3)
+        self.assertAlmostEqual(features["rms_dbfs"], -9.03, places=1)
+        self.assertAlmostEqual(features["spectral_centroid"], 440.0, delta=15.0)
+        self.assertAlmostEqual(features["pitch"], 440.0, delta=2.0)
+
+    def test_silence_has_no_pitch_and_unreadable_files_are_skipped(self):
+        path = os.path.join(self.tmp.name, "silence.wav")
+        with wave.open(path, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(8000)
+            writer.writeframes(b"\x00\x00" * 100)
+        broken = os.path.join(self.tmp.name, "broken.wav")
+        with open(broken, "wb") as f:
+            f.write(b"not a wave")
+
+        features, _ = analyze_file(path)
+
+        assert features is not None
+        self.assertEqual(features["rms"], 0.0)
+        self.assertIsNone(features["pitch"])
+        self.assertIsNone(analyze_file(broken)[0])
+
+    def test_decode_pcm_widths(self):
+        np.testing.assert_allclose(decode_pcm(bytes([0, 128, 255]), 1, 1), [-1.0, 0.0, 127 / 128])
+        np.testing.assert_allclose(decode_pcm(b"\x00\x00\x80\xff\xff\x7f", 3, 1), [-1.0, 8388607 / 8388608])
+        np.testing.assert_allclose(decode_pcm(np.array([16384, -16384], "<i2").tobytes(), 2, 2), [0.0])
+
+
+class TestAudioAnalyzer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_folder = os.path.join(self.tmp.name, "samples")
+        self.output_folder = os.path.join(self.tmp.name, "unzipped")
+        os.makedirs(self.zip_folder)
+        self.write_archive("Kulintang", {"Kulintang/1.wav": 220.0, "Kulintang/2.wav": 330.0})
+        self.write_archive("Kudyapi", {"Kudyapi/1.wav": 440.0})
+        self.ids = {"Kulintang": "SW5zdHJ1bWVudFR5cGU6MQ==", "Kudyapi": "SW5zdHJ1bWVudFR5cGU6Mg=="}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_archive(self, name: str, members: dict):
+        with zipfile.ZipFile(os.path.join(self.zip_folder, f"{name}.zip"), "w") as archive:
+            for member, frequency in members.items():
+                archive.writestr(member, wav_bytes(os.path.join(self.tmp.name, "tmp.wav"), frequency, 0.5))
+        Unzipper(self.zip_folder, self.output_folder).unzip_files()
+
+    def test_table_is_joined_to_instruments_and_written_as_parquet(self):
+        path = os.path.join(self.tmp.name, "features.parquet")
+
+        table = AudioAnalyzer(self.output_folder, num_workers=2, instrument_ids=self.ids).analyze(path)
+
+        self.assertEqual(
+            list(table["file"]), ["Kudyapi/Kudyapi/1.wav", "Kulintang/Kulintang/1.wav", "Kulintang/Kulintang/2.wav"]
+        )
+        self.assertEqual(list(table["instrument_id"]), [self.ids["Kudyapi"], *[self.ids["Kulintang"]] * 2])
+        self.assertEqual(list(table["local_name"]), ["Kudyapi", "Kulintang", "Kulintang"])
+        np.testing.assert_allclose(table["pitch"], [440.0, 220.0, 330.0], atol=2.0)
+        pd.testing.assert_frame_equal(pd.read_parquet(path), table)
+
+    def test_parquet_output_requires_pyarrow(self):
+        with patch("src.utils.audio.pa", None), self.assertRaises(ImportError):
+            AudioAnalyzer(self.output_folder).analyze(os.path.join(self.tmp.name, "features.parquet"))
+
+    def test_rerun_only_analyzes_changed_recordings(self):
+        AudioAnalyzer(self.output_folder, num_workers=1).analyze()
+        self.write_archive("Kulintang", {"Kulintang/1.wav": 220.0, "Kulintang/2.wav": 660.0})
+
+        with patch("src.utils.audio.analyze_file", wraps=analyze_file) as mock_analyze:
+            table = AudioAnalyzer(self.output_folder, num_workers=1).analyze()
+
+        analyzed = [os.path.relpath(call.args[0], self.output_folder) for call in mock_analyze.call_args_list]
+        self.assertEqual(analyzed, [os.path.join("Kulintang", "Kulintang", "2.wav")])
+        self.assertAlmostEqual(table["pitch"].iloc[2], 660.0, delta=3.0)
+        self.assertEqual(len(AudioAnalyzer(self.output_folder).cache), 3)
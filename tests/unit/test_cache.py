@@ -0,0 +1,94 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.katunog.api import InstrumentVersions, ProvinceList
+from src.katunog.cache import RecentResponses, ResponseCache, normalize_query
+from src.katunog.client import KatunogClient
+from tests.unit.abstract_function_test_case import AbstractFunctionTestCase
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    def test_whitespace_is_collapsed_outside_string_literals(self):
+        query = """
+        {
+            instruments(page: 1, filter: "two  words") {
+                id,
+                localName
+            }
+        }
+        """
+        self.assertEqual(normalize_query(query), '{instruments(page:1,filter:"two  words"){id,localName}}')
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.tmp.name, "cache.sqlite"), default_ttl=60)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_round_trip_ignores_formatting(self):
+        self.cache.set("InstrumentList", "{ a { b } }", {"data": {"a": {"b": 1}}})
+        self.assertEqual(self.cache.get("InstrumentList", "{a{\n  b\n}}"), {"data": {"a": {"b": 1}}})
+        self.assertIsNone(self.cache.get("InstrumentList", "{a{c}}"))
+
+    def test_entries_expire_per_endpoint_ttl(self):
+        self.cache.set("InstrumentList", "{a}", {"data": 1})
+        self.cache.set("ProvinceList", "{provinces}", {"data": 2})
+        with patch("src.katunog.cache.time.time", return_value=time.time() + 3600):
+            self.assertIsNone(self.cache.get("InstrumentList", "{a}"))
+            self.assertEqual(self.cache.get("ProvinceList", "{provinces}"), {"data": 2})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.set("InstrumentList", "{a}", {"data": "a" * 100})
+        self.cache.max_bytes = self.cache.size
+        self.cache.set("InstrumentList", "{b}", {"data": "b" * 100})
+        self.assertIsNone(self.cache.get("InstrumentList", "{a}"))
+        self.assertEqual(self.cache.get("InstrumentList", "{b}"), {"data": "b" * 100})
+
+
+class TestCachedPostRequest(AbstractFunctionTestCase):
+    async def test_second_call_is_served_from_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResponseCache(os.path.join(folder, "cache.sqlite"))
+            response = self.post.__aenter__.return_value
+            with patch.object(response, "json", AsyncMock(return_value={"data": {"provinces": []}})):
+                async with KatunogClient(cache=cache) as client:
+                    first = await ProvinceList(client=client).get_data()
+                    second = await ProvinceList(client=client).get_data()
+            cache.close()
+
+        self.assertEqual(first, second)
+        self.mock_post.assert_called_once()
+
+    async def test_instrument_versions_are_always_fetched(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResponseCache(os.path.join(folder, "cache.sqlite"))
+            response = self.post.__aenter__.return_value
+            with patch.object(response, "json", AsyncMock(return_value={"data": {"instruments": {"objects": []}}})):
+                async with KatunogClient(cache=cache, recent=None) as client:
+                    await InstrumentVersions(client=client).get_data()
+                    await InstrumentVersions(client=client).get_data()
+            self.assertEqual(cache.size, 0)
+            cache.close()
+
+        self.assertEqual(self.mock_post.call_count, 2)
+
+
+class TestRecentResponses(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted_and_stale_ones_expire(self):
+        recent = RecentResponses(max_entries=2, ttl=10)
+        with patch("src.katunog.cache.time.monotonic", return_value=100.0):
+            recent.set("a", {"data": 1})
+            recent.set("b", {"data": 2})
+            recent.get("a")
+            recent.set("c", {"data": 3})
+            self.assertEqual((recent.get("a"), recent.get("b"), len(recent)), ({"data": 1}, None, 2))
+        with patch("src.katunog.cache.time.monotonic", return_value=110.0):
+            self.assertIsNone(recent.get("c"))
+        self.assertEqual(len(recent), 1)
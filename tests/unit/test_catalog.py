@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.katunog.catalog import InstrumentCatalog
+
+
+def instrument(instrument_id, province, region, island, hornbostel, file_types=("audio",), updated="2024-01-01"):
+    return {
+        "id": instrument_id,
+        "localName": f"Instrument {instrument_id}",
+        "lastUpdated": updated,
+        "province": {"name": province, "region": {"name": region, "island": {"name": island} if island else None}},
+        "ethnolinguistic": {"name": "Maguindanaon"},
+        "hornbostel": {"name": hornbostel},
+        "fileSet": {"edges": [{"node": {"fileType": file_type}} for file_type in file_types]},
+    }
+
+
+def page(*objects):
+    return {"data": {"instruments": {"page": 1, "pages": 1, "objects": list(objects)}}}
+
+
+INSTRUMENTS = [
+    instrument("1", "Maguindanao", "BARMM", "Mindanao", "Idiophone", ("audio", "image")),
+    instrument("2", "Sulu", "BARMM", None, "Chordophone"),
+    instrument("3", "Ifugao", "CAR", "Luzon", "Idiophone", ("video",)),
+]
+
+
+class TestInstrumentCatalog(unittest.IsolatedAsyncioTestCase):
+    async def load(self) -> InstrumentCatalog:
+        regions = {"data": {"regions": [{"name": "BARMM", "island": {"name": "Mindanao"}}]}}
+        provinces = {"data": {"provinces": [{"id": "p", "name": "Sulu"}]}}
+        with patch("src.katunog.catalog.BatchQuery.get_data", AsyncMock(return_value=[regions, provinces])), patch(
+            "src.katunog.catalog.InstrumentLocation.get_data", AsyncMock(return_value=page(*INSTRUMENTS))
+        ) as mock_get_data:
+            catalog = await InstrumentCatalog().load()
+        self.assertEqual(mock_get_data.call_args.kwargs["fields"], InstrumentCatalog.FIELDS)
+        return catalog
+
+    async def test_filtered_queries_join_locations(self):
+        catalog = await self.load()
+
+        self.assertEqual(catalog.ids(island="Mindanao"), ["1", "2"])
+        self.assertEqual(catalog.ids(island="Mindanao", hornbostel="Idiophone"), ["1"])
+        self.assertEqual(catalog.count(file_type=["image", "video"]), 2)
+        self.assertEqual(catalog.group_by("hornbostel", region="BARMM"), {"Chordophone": 1, "Idiophone": 1})
+        first, second = catalog.get("1"), catalog.get("2")
+        assert first is not None and second is not None
+        self.assertEqual(first["file_type"], ["audio", "image"])
+        self.assertEqual(second["island"], "Mindanao")
+        self.assertEqual(catalog.provinces, ["Sulu"])
+        with self.assertRaises(ValueError):
+            catalog.find(hornbostle="Idiophone")
+
+    async def test_refresh_only_refetches_changed_instruments(self):
+        catalog = await self.load()
+        versions = page({"id": "1", "lastUpdated": "2024-01-01"}, {"id": "2", "lastUpdated": "2024-05-01"})
+        updated = {"2": {k: v for k, v in instrument("2", "Ifugao", "CAR", "Luzon", "Aerophone").items() if k != "id"}}
+
+        with patch("src.katunog.catalog.InstrumentVersions.get_data", AsyncMock(return_value=versions)), patch(
+            "src.katunog.catalog.InstrumentResolver.resolve", AsyncMock(return_value=updated)
+        ) as mock_resolve:
+            stale, removed = await catalog.refresh()
+
+        mock_resolve.assert_called_once_with(["2"])
+        self.assertEqual((stale, removed), (["2"], ["3"]))
+        self.assertEqual(len(catalog), 2)
+        self.assertEqual(catalog.ids(island="Luzon"), ["2"])
+        self.assertEqual(catalog.values("hornbostel"), ["Aerophone", "Idiophone"])
+
+    async def test_save_and_open_round_trip(self):
+        catalog = await self.load()
+        catalog.remove("3")
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "catalog.json")
+            catalog.save(path)
+            reopened = InstrumentCatalog.open(path)
+
+        self.assertEqual(reopened.find(), catalog.find())
+        self.assertEqual(reopened.regions, {"BARMM": "Mindanao"})
+        self.assertNotIn("3", reopened)
@@ -0,0 +1,139 @@
+import asyncio
+from typing import Dict, List
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.katunog.api import InstrumentById, InstrumentList, ProvinceList
+from src.katunog.cache import RecentResponses
+from src.katunog.client import KatunogClient
+from src.katunog.metrics import MetricsRegistry
+from src.katunog.throttle import AdaptiveConcurrency, RetryPolicy
+from tests.unit.abstract_function_test_case import AbstractFunctionTestCase
+
+
+class TestKatunogClient(AbstractFunctionTestCase):
+    async def test_session_requires_open_client(self):
+        client = KatunogClient()
+        with self.assertRaises(RuntimeError):
+            client.session
+
+    async def test_context_manager_opens_and_closes_pool(self):
+        async with KatunogClient(limit=10, limit_per_host=2) as client:
+            connector = client.session.connector
+            assert connector is not None
+            self.assertEqual(connector.limit, 10)
+            self.assertEqual(connector.limit_per_host, 2)
+        self.assertTrue(client.closed)
+
+    async def test_endpoints_share_one_session(self):
+        async with KatunogClient(ssl=False) as client:
+            with patch("src.katunog.api.KatunogClient.open", new_callable=AsyncMock) as mock_open:
+                await InstrumentList(ssl=False, client=client).get_data()
+                await ProvinceList(ssl=False, client=client).get_data()
+                mock_open.assert_not_called()
+        self.assertEqual(self.mock_post.call_count, 2)
+
+
+class TestKatunogClientRetries(AbstractFunctionTestCase):
+    async def asyncSetUp(self):
+        self.statuses = [503, 429, 200]
+
+        async def handler(request: web.Request):
+            status = self.statuses.pop(0)
+            return web.json_response({"status": status}, status=status, headers={"Retry-After": "0"})
+
+        async def slow(request: web.Request):
+            await asyncio.sleep(10)
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_get("/", handler)
+        app.router.add_get("/slow", slow)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_throttled_responses_are_retried(self):
+        concurrency = AdaptiveConcurrency(initial=4)
+        async with KatunogClient(concurrency=concurrency, retry=RetryPolicy(base_delay=0)) as client:
+            async with client.request("get", str(self.server.make_url("/"))) as response:
+                body = await response.json()
+
+        self.assertEqual(body, {"status": 200})
+        self.assertEqual(concurrency.in_flight, 0)
+        self.assertLess(concurrency.limit, 4)
+
+    async def test_last_response_is_returned_when_attempts_run_out(self):
+        async with KatunogClient(retry=RetryPolicy(max_attempts=2, base_delay=0)) as client:
+            async with client.request("get", str(self.server.make_url("/"))) as response:
+                self.assertEqual(response.status, 429)
+
+    async def test_cancelled_requests_release_their_slot(self):
+        concurrency = AdaptiveConcurrency(initial=2, maximum=2)
+
+        async def get(client: KatunogClient):
+            async with client.request("get", str(self.server.make_url("/slow"))):
+                pass
+
+        async with KatunogClient(concurrency=concurrency) as client:
+            tasks = [asyncio.ensure_future(get(client)) for _ in range(2)]
+            await asyncio.sleep(0.1)
+            self.assertEqual(concurrency.in_flight, 2)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            self.assertEqual(concurrency.in_flight, 0)
+            await asyncio.wait_for(concurrency.acquire(), 1)
+
+
+class TestKatunogClientCoalescing(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests: List[Dict[str, str]] = []
+
+        async def handler(request: web.Request):
+            body = await request.json()
+            self.requests.append(body["variables"])
+            await asyncio.sleep(0.05)
+            instrument_id = body["variables"]["id"]
+            if instrument_id == "missing":
+                return web.json_response({"data": {"instrument": None}, "errors": [{"message": "Not found"}]})
+            return web.json_response({"data": {"instrument": {"id": instrument_id}}})
+
+        app = web.Application()
+        app.router.add_post("/api/", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.patch_url = patch.object(InstrumentById, "API_URL", str(self.server.make_url("/api/")))
+        self.patch_url.start()
+
+    async def asyncTearDown(self):
+        self.patch_url.stop()
+        await self.server.close()
+
+    async def test_concurrent_identical_queries_share_one_request(self):
+        metrics = MetricsRegistry()
+        async with KatunogClient(metrics=metrics) as client:
+            results = await asyncio.gather(
+                *(InstrumentById(client=client).get_data(instrument_id) for instrument_id in ["a", "a", "b", "a"])
+            )
+            await InstrumentById(client=client).get_data("a")
+
+        self.assertEqual([result["data"]["instrument"]["id"] for result in results], ["a", "a", "b", "a"])
+        self.assertEqual(self.requests, [{"id": "a"}, {"id": "b"}, {"id": "a"}])
+        self.assertIn("katunog_coalesced_requests_total 2", metrics.to_prometheus())
+
+    async def test_recent_responses_are_answered_from_memory_until_they_expire(self):
+        recent = RecentResponses(ttl=0.3)
+        async with KatunogClient(recent=recent) as client:
+            for instrument_id in ["a", "a", "missing", "missing"]:
+                await InstrumentById(client=client).get_data(instrument_id)
+            await asyncio.sleep(0.3)
+            await InstrumentById(client=client).get_data("a")
+
+        self.assertEqual(self.requests, [{"id": "a"}, {"id": "missing"}, {"id": "missing"}, {"id": "a"}])
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.katunog.export import CatalogExporter, pa
+
+LIST_PAGE = {
+    "data": {
+        "instruments": {
+            "page": 1,
+            "pages": 1,
+            "objects": [
+                {
+                    "id": "1",
+                    "localName": "Kulintang",
+                    "province": {"name": "Maguindanao"},
+                    "hornbostel": {"name": "Idiophone"},
+                    "length": "120.5",
+                    "english": {"generalDescription": "A row of gongs"},
+                    "lastUpdated": "2024-02-01T10:00:00+00:00",
+                    "mediaUploadOngoing": False,
+                    "fileSet": {
+                        "edges": [
+                            {"node": {"name": "a.wav", "size": 2048, "fileType": "audio", "number": 1}},
+                            {"node": {"name": "a.jpg", "size": "512", "fileType": "image", "number": 2}},
+                        ]
+                    },
+                },
+                {"id": "2", "localName": "Kalaleng", "province": {"name": "Kalinga"}, "fileSet": None},
+            ],
+        }
+    }
+}
+LOCATION_PAGE = {
+    "data": {
+        "instruments": {
+            "page": 1,
+            "pages": 1,
+            "objects": [
+                {"id": "1", "province": {"region": {"name": "BARMM", "island": {"name": "Mindanao"}}}},
+                {"id": "2", "province": {"region": {"name": "CAR", "island": {"name": "Luzon"}}}},
+            ],
+        }
+    }
+}
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed")
+class TestCatalogExporter(unittest.IsolatedAsyncioTestCase):
+    async def test_export_writes_typed_partitioned_datasets(self):
+        import pyarrow.dataset as ds
+
+        with tempfile.TemporaryDirectory() as folder, patch(
+            "src.katunog.export.InstrumentList.get_data", return_value=LIST_PAGE
+        ), patch("src.katunog.export.InstrumentLocation.get_data", return_value=LOCATION_PAGE):
+            paths = await CatalogExporter().export(folder)
+
+            self.assertEqual(sorted(os.listdir(paths["instruments"])), ["region=BARMM", "region=CAR"])
+            instruments = ds.dataset(paths["instruments"], partitioning="hive")
+            mindanao = instruments.to_table(filter=ds.field("island") == "Mindanao").to_pylist()
+            media = ds.dataset(paths["media_files"], partitioning="hive").to_table().to_pylist()
+
+        self.assertEqual(len(mindanao), 1)
+        self.assertEqual((mindanao[0]["local_name"], mindanao[0]["length"]), ("Kulintang", 120.5))
+        self.assertEqual((mindanao[0]["file_count"], mindanao[0]["english_general_description"]), (2, "A row of gongs"))
+        self.assertEqual(mindanao[0]["last_updated"].year, 2024)
+        self.assertEqual(sorted((row["name"], row["size"]) for row in media), [("a.jpg", 512), ("a.wav", 2048)])
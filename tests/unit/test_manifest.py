@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from src.katunog.manifest import DownloadManifest, file_sha256
+
+
+class TestDownloadManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_record_round_trips_through_disk(self):
+        path = os.path.join(self.folder, "Kulintang.zip")
+        with open(path, "wb") as f:
+            f.write(b"data")
+        DownloadManifest(self.folder).record("Kulintang.zip", 4, file_sha256(path), "Mon, 01 Jan 2024", '"abc"')
+
+        manifest = DownloadManifest(self.folder)
+        entry = manifest.get("Kulintang.zip")
+        assert entry is not None
+        self.assertEqual(entry["etag"], '"abc"')
+        self.assertTrue(manifest.verify("Kulintang.zip"))
+
+        with open(path, "ab") as f:
+            f.write(b"!")
+        self.assertFalse(manifest.is_complete("Kulintang.zip"))
+
+    def test_partial_entry_is_not_complete(self):
+        open(os.path.join(self.folder, "Kudyapi.zip"), "wb").close()
+        manifest = DownloadManifest(self.folder)
+        manifest.record("Kudyapi.zip", 0, None, complete=False)
+        self.assertFalse(manifest.is_complete("Kudyapi.zip"))
+
+    def test_legacy_archives_are_adopted_only_when_valid(self):
+        with zipfile.ZipFile(os.path.join(self.folder, "Gangsa.zip"), "w") as archive:
+            archive.writestr("gangsa.wav", b"RIFF")
+        with open(os.path.join(self.folder, "Truncated.zip"), "wb") as f:
+            f.write(b"PK\x03\x04partial")
+
+        manifest = DownloadManifest(self.folder)
+        self.assertTrue(manifest.is_complete("Gangsa.zip"))
+        entry = manifest.get("Gangsa.zip")
+        assert entry is not None
+        self.assertIsNotNone(entry["sha256"])
+        self.assertFalse(manifest.is_complete("Truncated.zip"))
+        self.assertFalse(manifest.is_complete("Missing.zip"))
@@ -0,0 +1,92 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import zipfile
+
+from src.katunog.api import InstrumentMediaFiles
+from src.katunog.media import MediaStore
+from tests.unit.abstract_function_test_case import AbstractFunctionTestCase
+
+
+def archive_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+class TestMediaStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = MediaStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_identical_files_are_stored_once_and_hardlinked_into_each_view(self):
+        added = self.store.add_archive("Kulintang.1", archive_bytes({"gong.wav": b"gong", "drum.wav": b"drum"}))
+        path = os.path.join(self.tmp.name, "Gangsa.zip")
+        with open(path, "wb") as f:
+            f.write(archive_bytes({"Gangsa/gong.wav": b"gong"}))
+        shared = self.store.add_archive("Gangsa.2", path)
+
+        self.assertEqual((added, shared), (2, 0))
+        first = os.path.join(self.store.view_path("Kulintang.1"), "gong.wav")
+        second = os.path.join(self.store.view_path("Gangsa.2"), "gong.wav")
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertEqual(sum(len(files) for *_, files in os.walk(self.store.objects_folder)), 2)
+        self.assertEqual(MediaStore(self.tmp.name).lookup("gong.wav", 4), self.store.views["Gangsa.2"]["gong.wav"])
+
+    def test_views_are_materialized_only_from_known_files(self):
+        self.store.add_archive("Kulintang.1", archive_bytes({"gong.wav": b"gong"}))
+
+        self.assertFalse(self.store.materialize("Gangsa.2", [{"name": "gong.wav", "size": 5}]))
+        self.assertFalse(os.path.exists(self.store.view_path("Gangsa.2")))
+        self.assertTrue(self.store.materialize("Gangsa.2", [{"name": "files/gong.wav", "size": 4}]))
+        with open(os.path.join(self.store.view_path("Gangsa.2"), "gong.wav"), "rb") as f:
+            self.assertEqual(f.read(), b"gong")
+
+
+class TestDownloadIntoMediaStore(AbstractFunctionTestCase):
+    async def test_same_named_instruments_are_kept_apart_and_known_files_are_not_downloaded(self):
+        def node(number: int, name: str = "gong.wav", size: int = 4):
+            return {"node": {"path": f"x/PIISD0{number}/{name}", "name": name, "size": size, "fileType": "audio"}}
+
+        instruments = [
+            {"id": "a", "localName": "Kulintang", "fileSet": {"edges": [node(1)]}},
+            {"id": "b", "localName": "Kulintang", "fileSet": {"edges": [node(2, "drum.wav")]}},
+        ]
+        archives = {"1": {"gong.wav": b"gong"}, "2": {"drum.wav": b"drum"}}
+
+        async def download_file(session, url, file_path, *args, **kwargs):
+            with open(file_path, "wb") as f:
+                f.write(archive_bytes(archives[url.split("instrument_id=")[1].split("&")[0]]))
+            return True
+
+        api = InstrumentMediaFiles()
+        with tempfile.TemporaryDirectory() as folder:
+            store = MediaStore(os.path.join(folder, "media"))
+            with patch.object(api, "download_file", side_effect=download_file) as mock_download_file:
+                await api.download_instruments(instruments, folder=folder, media_store=store)
+                await api.download_instruments(
+                    [{"id": "c", "localName": "Gangsa", "fileSet": {"edges": [node(3)]}}],
+                    folder=folder,
+                    media_store=store,
+                )
+
+            self.assertEqual(
+                sorted(os.path.basename(call.args[2]) for call in mock_download_file.call_args_list),
+                ["Kulintang.1.audio.zip", "Kulintang.2.audio.zip"],
+            )
+            self.assertEqual(
+                sorted(os.listdir(store.views_folder)), ["Gangsa.3.audio", "Kulintang.1.audio", "Kulintang.2.audio"]
+            )
+            self.assertTrue(
+                os.path.samefile(
+                    os.path.join(store.view_path("Gangsa.3.audio"), "gong.wav"),
+                    os.path.join(store.view_path("Kulintang.1.audio"), "gong.wav"),
+                )
+            )
@@ -0,0 +1,64 @@
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.katunog.api import ProvinceList
+from src.katunog.client import KatunogClient
+from src.katunog.metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_prometheus_export(self):
+        metrics = MetricsRegistry(buckets={"katunog_request_seconds": (0.1, 1)})
+        metrics.observe("katunog_request_seconds", 0.05, endpoint="ProvinceList")
+        metrics.observe("katunog_request_seconds", 0.5, endpoint="ProvinceList")
+        metrics.increment("katunog_retries_total", reason="503")
+        metrics.set_gauge("katunog_download_queue_depth", 3)
+
+        text = metrics.to_prometheus()
+
+        self.assertIn('katunog_retries_total{reason="503"} 1', text)
+        self.assertIn("katunog_download_queue_depth 3", text)
+        self.assertIn('katunog_request_seconds_bucket{endpoint="ProvinceList",le="0.1"} 1', text)
+        self.assertIn('katunog_request_seconds_bucket{endpoint="ProvinceList",le="+Inf"} 2', text)
+        self.assertIn('katunog_request_seconds_count{endpoint="ProvinceList"} 2', text)
+
+    def test_hooks_and_json_export(self):
+        events = []
+        metrics = MetricsRegistry()
+        metrics.add_hook(lambda kind, name, value, labels: events.append((kind, name, value, labels)))
+        metrics.increment("katunog_downloads_total", outcome="completed")
+
+        self.assertEqual(events, [("counter", "katunog_downloads_total", 1, {"outcome": "completed"})])
+        self.assertEqual(
+            metrics.to_json()["counters"]["katunog_downloads_total"], [{"labels": {"outcome": "completed"}, "value": 1}]
+        )
+
+
+class TestClientInstrumentation(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def handler(request: web.Request):
+            return web.json_response({"data": {"provinces": []}})
+
+        app = web.Application()
+        app.router.add_post("/api/", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_endpoint_latency_and_connection_reuse_are_recorded(self):
+        metrics = MetricsRegistry()
+        async with KatunogClient(metrics=metrics) as client:
+            api = ProvinceList(client=client)
+            api.API_URL = str(self.server.make_url("/api/"))
+            for _ in range(3):
+                await api.get_data()
+
+        snapshot = metrics.to_json()
+        latency = snapshot["histograms"]["katunog_request_seconds"][0]
+        self.assertEqual((latency["labels"], latency["count"]), ({"endpoint": "ProvinceList"}, 3))
+        self.assertEqual(snapshot["counters"]["katunog_connections_created_total"][0]["value"], 1)
+        self.assertEqual(snapshot["counters"]["katunog_connections_reused_total"][0]["value"], 2)
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import wave
+import zipfile
+
+import numpy as np
+
+from src.utils.sample_store import SampleStore
+from src.utils.unzipper import Unzipper
+
+
+def wav_bytes(path: str, frames: np.ndarray, width: int = 2, sample_rate: int = 8000) -> bytes:
+    with wave.open(path, "wb") as writer:
+        writer.setnchannels(frames.shape[1])
+        writer.setsampwidth(width)
+        writer.setframerate(sample_rate)
+        writer.writeframes(frames.tobytes())
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class TestSampleStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_folder = os.path.join(self.tmp.name, "samples")
+        self.output_folder = os.path.join(self.tmp.name, "unzipped")
+        self.store_folder = os.path.join(self.tmp.name, "packed")
+        os.makedirs(self.zip_folder)
+        scratch = os.path.join(self.tmp.name, "scratch.wav")
+        self.stereo = np.arange(2000, dtype="<i2").reshape(-1, 2)
+        self.mono = (np.arange(3000, dtype="<i4") * 1000).reshape(-1, 1)
+        with zipfile.ZipFile(os.path.join(self.zip_folder, "Kulintang.zip"), "w") as archive:
+            archive.writestr("Kulintang/1.wav", wav_bytes(scratch, self.stereo))
+            archive.writestr("Kulintang/cover.jpg", b"jpeg bytes")
+        with zipfile.ZipFile(os.path.join(self.zip_folder, "Kudyapi.zip"), "w") as archive:
+            archive.writestr("Kudyapi/1.wav", wav_bytes(scratch, self.mono, width=4))
+        Unzipper(self.zip_folder, self.output_folder).unzip_files()
+        self.ids = {"Kulintang": "SW5zdHJ1bWVudFR5cGU6MQ==", "Kudyapi": "SW5zdHJ1bWVudFR5cGU6Mg=="}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_samples_are_viewed_from_page_aligned_segments(self):
+        with SampleStore.pack(self.output_folder, self.store_folder, self.ids) as store:
+            self.assertEqual(len(store), 3)
+            self.assertEqual(
+                store.files(self.ids["Kulintang"]), ["Kulintang/Kulintang/1.wav", "Kulintang/Kulintang/cover.jpg"]
+            )
+            np.testing.assert_array_equal(store.samples("Kulintang/Kulintang/1.wav"), self.stereo)
+            np.testing.assert_array_equal(store.samples("Kudyapi/Kudyapi/1.wav"), self.mono)
+            self.assertEqual(bytes(store.view("Kulintang/Kulintang/cover.jpg")), b"jpeg bytes")
+            self.assertFalse(store.samples("Kudyapi/Kudyapi/1.wav").flags.writeable)
+
+            entry = store.entry("Kulintang/Kulintang/1.wav")
+            self.assertEqual(entry["offset"] % SampleStore.ALIGNMENT, 0)
+            self.assertEqual((entry["sample_rate"], entry["channels"], entry["width"]), (8000, 2, 2))
+            with self.assertRaises(ValueError):
+                store.samples("Kulintang/Kulintang/cover.jpg")
+            with self.assertRaises(KeyError):
+                store.view("Gangsa/Gangsa/1.wav")
+
+    def test_small_segments_roll_over_and_repacking_drops_stale_ones(self):
+        SampleStore.pack(self.output_folder, self.store_folder, segment_size=1000).close()
+        with SampleStore.pack(self.output_folder, self.store_folder, segment_size=1 << 20) as store:
+            self.assertEqual(store.segments, ["segment-00000.bin"])
+            np.testing.assert_array_equal(store.samples("Kudyapi/Kudyapi/1.wav"), self.mono)
+
+        self.assertEqual(sorted(os.listdir(self.store_folder)), ["index.json", "segment-00000.bin"])
+        with SampleStore.pack(self.output_folder, self.store_folder, segment_size=1000) as small:
+            self.assertEqual(len(small.segments), 3)
+            self.assertEqual({small.entry(file)["segment"] for file in small}, {0, 1, 2})
+
+    def test_update_repacks_only_when_the_ledger_changed(self):
+        SampleStore.update(self.output_folder, self.store_folder, self.ids).close()
+        with patch.object(SampleStore, "pack") as mock_pack:
+            SampleStore.update(self.output_folder, self.store_folder, self.ids).close()
+        mock_pack.assert_not_called()
+
+        with zipfile.ZipFile(os.path.join(self.zip_folder, "Gangsa.zip"), "w") as archive:
+            archive.writestr("Gangsa/cover.jpg", b"gangsa")
+        Unzipper(self.zip_folder, self.output_folder).unzip_files()
+        with SampleStore.update(self.output_folder, self.store_folder, self.ids) as store:
+            self.assertEqual(bytes(store.view("Gangsa/Gangsa/cover.jpg")), b"gangsa")
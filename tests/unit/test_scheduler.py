@@ -0,0 +1,54 @@
+import asyncio
+from typing import List
+import unittest
+
+from src.katunog.scheduler import DownloadJob, DownloadProgress, DownloadScheduler
+
+
+class TestDownloadScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_free_slot_starts_next_job_without_waiting_for_slow_one(self):
+        finished: List[str] = []
+
+        async def download(job: DownloadJob, progress):
+            await asyncio.sleep(0.2 if job.instrument_name == "slow" else 0.01)
+            progress(1, 1)
+            finished.append(job.instrument_name)
+
+        async with DownloadScheduler(download, num_workers=2) as scheduler:
+            for name in ["slow", "a", "b", "c"]:
+                await scheduler.submit(DownloadJob(f"http://test/{name}", f"{name}.zip", name))
+
+        self.assertEqual(finished[-1], "slow")
+        self.assertEqual(sorted(finished[:-1]), ["a", "b", "c"])
+        self.assertEqual(scheduler.completed, 4)
+
+    async def test_failed_job_is_reported_and_worker_keeps_going(self):
+        events: List[DownloadProgress] = []
+
+        async def download(job: DownloadJob, progress):
+            if job.instrument_name == "bad":
+                raise ValueError("boom")
+            progress(10, 10)
+
+        async with DownloadScheduler(download, num_workers=1, on_progress=events.append) as scheduler:
+            await scheduler.submit(DownloadJob("http://test/bad", "bad.zip", "bad"))
+            await scheduler.submit(DownloadJob("http://test/good", "good.zip", "good"))
+
+        self.assertEqual((scheduler.completed, scheduler.failed), (1, 1))
+        finals = [event for event in events if event.done]
+        self.assertIsInstance(finals[0].error, ValueError)
+        self.assertEqual((finals[1].bytes_done, finals[1].error), (10, None))
+
+    async def test_queued_jobs_start_smallest_first(self):
+        started: List[str] = []
+
+        async def download(job: DownloadJob, progress):
+            started.append(job.instrument_name)
+
+        scheduler = DownloadScheduler(download, num_workers=1, queue_size=10)
+        for name, size in [("video", 5_000_000), ("unknown", None), ("audio", 40_000), ("image", 900), ("later", None)]:
+            await scheduler.submit(DownloadJob(f"http://test/{name}", f"{name}.zip", name, size=size))
+        async with scheduler:
+            pass
+
+        self.assertEqual(started, ["image", "audio", "video", "unknown", "later"])
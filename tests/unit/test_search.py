@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.katunog.search import MappedSearchIndex, SearchIndex, analyze_english, analyze_filipino
+
+INSTRUMENTS = [
+    {
+        "id": "1",
+        "localName": "Kulintang",
+        "englishName": "Gong chime",
+        "english": {"generalDescription": "A row of small gongs played with sticks.", "materialAndMake": "Bronze"},
+        "filipino": {"generalDescription": "Hanay ng maliliit na gong na tinatamaan ng patpat."},
+    },
+    {
+        "id": "2",
+        "localName": "Kudyápi",
+        "englishName": "Boat lute",
+        "english": {"generalDescription": "A two-stringed lute carved from wood."},
+        "filipino": {"materialAndMake": "Kahoy at tanso"},
+    },
+    {
+        "id": "3",
+        "localName": "Agung",
+        "english": {"generalDescription": "A large hanging gong.", "playingParts": "Boss"},
+        "filipino": {"generalDescription": "Malaking gong na nakabitin."},
+    },
+]
+
+
+class TestSearchIndex(unittest.IsolatedAsyncioTestCase):
+    def build(self) -> SearchIndex:
+        index = SearchIndex()
+        for instrument in INSTRUMENTS:
+            index.add(instrument)
+        return index
+
+    def test_analyzers_are_language_aware(self):
+        self.assertEqual(analyze_english("The gongs, playing strings"), ["gong", "play", "string"])
+        self.assertEqual(analyze_filipino("Ang mga kahoy na Kudyápi"), ["kahoy", "kudyapi"])
+
+    def test_bm25_ranks_names_and_both_languages(self):
+        index = self.build()
+
+        self.assertEqual(index.search("kudyapi")[0][0], "2")
+        self.assertEqual([instrument_id for instrument_id, _ in index.search("gongs")], ["1", "3"])
+        self.assertEqual([instrument_id for instrument_id, _ in index.search("tanso")], ["2"])
+        self.assertEqual(index.search("violin"), [])
+
+    def test_updates_replace_and_remove_documents(self):
+        index = self.build()
+        index.add({"id": "2", "localName": "Hegalong", "english": {"generalDescription": "A two-stringed lute."}})
+        index.remove("3")
+
+        self.assertEqual(index.search("tanso"), [])
+        self.assertEqual([instrument_id for instrument_id, _ in index.search("gong")], ["1"])
+        self.assertEqual(len(index), 2)
+
+    def test_saved_index_is_searched_through_mmap_and_can_be_updated(self):
+        index = self.build()
+        index.remove("3")
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "search.idx")
+            index.save(path)
+            with MappedSearchIndex(path) as mapped:
+                self.assertEqual(mapped.search("gong bronze"), index.search("gong bronze"))
+                self.assertEqual(len(mapped), 2)
+
+            reopened = SearchIndex.open(path)
+        self.assertEqual(reopened.search("lute"), index.search("lute"))
+        reopened.add(INSTRUMENTS[2])
+        self.assertEqual(reopened.search("nakabitin")[0][0], "3")
+
+    async def test_refresh_reindexes_synced_instruments(self):
+        index = self.build()
+        resolved = {"1": {"localName": "Kulintang a tiniok"}, "3": None}
+        with patch("src.katunog.search.InstrumentResolver.resolve", AsyncMock(return_value=resolved)):
+            await index.refresh(["1", "3"])
+
+        self.assertEqual(index.search("tiniok")[0][0], "1")
+        self.assertNotIn("3", index)
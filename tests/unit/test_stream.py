@@ -0,0 +1,76 @@
+import json
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.katunog.api import InstrumentList, InstrumentMediaFiles
+from src.katunog.client import KatunogClient
+from src.katunog.stream import ObjectStream
+
+
+def page(number: int, pages: int, ids) -> dict:
+    objects = [
+        {"id": str(i), "localName": 'Ku"lin]tang{', "fileSet": {"edges": [{"node": {"path": "x"}}]}} for i in ids
+    ]
+    return {"data": {"instruments": {"page": number, "pages": pages, "objects": objects, "hasNext": number < pages}}}
+
+
+class TestObjectStream(unittest.TestCase):
+    def test_elements_are_yielded_across_any_chunking(self):
+        document = {**page(1, 2, range(3)), "errors": [{"message": "partial", "path": ["instruments"]}]}
+        raw = json.dumps(document).encode()
+        for size in (1, 5, len(raw)):
+            stream = ObjectStream()
+            elements = []
+            starts = range(0, len(raw), size)
+            for start, end in zip(starts, [*starts[1:], len(raw)]):
+                elements.extend(stream.feed(raw[start:end]))
+            envelope = stream.close()
+
+            self.assertEqual(elements, document["data"]["instruments"]["objects"])
+            self.assertEqual(envelope["data"]["instruments"]["objects"], [])
+            self.assertEqual(envelope["data"]["instruments"]["pages"], 2)
+            self.assertEqual(envelope["errors"], document["errors"])
+
+    def test_only_the_pending_element_is_buffered(self):
+        stream = ObjectStream()
+        raw = json.dumps(page(1, 1, range(1000))).encode()
+        half = raw.index(b'{"id": "500"') + 3
+        stream.feed(raw[:half])
+        self.assertLess(len(stream._buffer), 100)
+
+
+class TestStreamingEndpoints(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def handler(request: web.Request):
+            variables = (await request.json())["variables"]
+            number, limit = variables["page"], variables["limit"]
+            return web.json_response(page(number, 3, range((number - 1) * limit, number * limit)))
+
+        app = web.Application()
+        app.router.add_post("/api/", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_iter_all_streams_every_page(self):
+        async with KatunogClient() as client:
+            api = InstrumentList(client=client)
+            api.API_URL = str(self.server.make_url("/api/"))
+            ids = [instrument["id"] async for instrument in api.iter_all(limit=2, window=2, stream=True)]
+
+        self.assertEqual(sorted(ids, key=int), [str(i) for i in range(6)])
+
+    async def test_stream_data_exposes_the_envelope(self):
+        stream = ObjectStream()
+        async with KatunogClient() as client:
+            api = InstrumentMediaFiles(client=client)
+            api.API_URL = str(self.server.make_url("/api/"))
+            instruments = [instrument async for instrument in api.stream_data(page=2, limit=2, stream=stream)]
+
+        self.assertEqual([instrument["id"] for instrument in instruments], ["2", "3"])
+        assert stream.envelope is not None
+        self.assertEqual(stream.envelope["data"]["instruments"]["page"], 2)
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+import zipfile
+
+from src.katunog.sync import DeltaSync, SyncState
+
+
+def versions_page(*instruments):
+    objects = [{"id": i, "lastUpdated": updated, "mediaUploadOngoing": ongoing} for i, updated, ongoing in instruments]
+    return {"data": {"instruments": {"page": 1, "pages": 1, "objects": objects}}}
+
+
+class TestDeltaSync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state = SyncState(os.path.join(self.tmp.name, "sync.sqlite"))
+        self.state.update({"same": ("2024-01-01", False), "edited": ("2024-01-01", False), "uploading": (None, True)})
+        self.state.update({"gone": ("2024-01-01", False)})
+
+    def tearDown(self):
+        self.state.close()
+        self.tmp.cleanup()
+
+    async def test_only_new_changed_and_uploading_instruments_are_refetched(self):
+        page = versions_page(
+            ("same", "2024-01-01", False),
+            ("edited", "2024-02-01", False),
+            ("uploading", "2024-02-01", False),
+            ("fresh", "2024-02-01", False),
+        )
+        resolved = {i: {"localName": i, "fileSet": {"edges": []}} for i in ["edited", "uploading", "fresh"]}
+
+        with patch("src.katunog.sync.InstrumentVersions.get_data", AsyncMock(return_value=page)), patch(
+            "src.katunog.sync.InstrumentResolver.resolve", AsyncMock(return_value=resolved)
+        ) as mock_resolve, patch(
+            "src.katunog.sync.InstrumentMediaFiles.download_instruments", AsyncMock()
+        ) as mock_download:
+            result = await DeltaSync(self.state, folder=self.tmp.name).run()
+
+        self.assertEqual(result.new, ["fresh"])
+        self.assertEqual(sorted(result.changed), ["edited", "uploading"])
+        self.assertEqual(result.removed, ["gone"])
+        self.assertEqual(sorted(mock_resolve.call_args.args[0]), ["edited", "fresh", "uploading"])
+        self.assertEqual(sorted(i["id"] for i in mock_download.call_args.args[0]), ["edited", "fresh", "uploading"])
+        self.assertTrue(mock_download.call_args.kwargs["refresh"])
+        self.assertEqual(self.state.versions()["edited"], ("2024-02-01", False))
+        self.assertNotIn("gone", self.state.versions())
+
+    async def sync_audio(self, download_file: AsyncMock):
+        page = versions_page(("edited", "2024-02-01", False))
+        node = {"node": {"path": "x/PIISD0123/gong.wav", "fileType": "audio"}}
+        resolved = {"edited": {"localName": "Edited", "fileSet": {"edges": [node]}}}
+        # The archive of the previous version is still complete
+        with zipfile.ZipFile(os.path.join(self.tmp.name, "Edited.123.audio.zip"), "w") as archive:
+            archive.writestr("Edited/gong.wav", b"old gong")
+
+        with patch("src.katunog.sync.InstrumentVersions.get_data", AsyncMock(return_value=page)), patch(
+            "src.katunog.sync.InstrumentResolver.resolve", AsyncMock(return_value=resolved)
+        ), patch("src.katunog.sync.InstrumentMediaFiles.download_file", download_file):
+            await DeltaSync(self.state, folder=self.tmp.name).run()
+
+    async def test_failed_archive_is_retried_next_run(self):
+        await self.sync_audio(AsyncMock(return_value=False))
+
+        self.assertEqual(self.state.versions()["edited"], ("2024-01-01", False))
+
+    async def test_downloaded_archive_keeps_the_version(self):
+        await self.sync_audio(AsyncMock(return_value=True))
+
+        self.assertEqual(self.state.versions()["edited"], ("2024-02-01", False))
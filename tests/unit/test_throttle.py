@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import time
+import unittest
+
+from src.katunog.throttle import AdaptiveConcurrency, RetryPolicy, TokenBucket, parse_retry_after
+
+
+class TestTokenBucket(unittest.IsolatedAsyncioTestCase):
+    async def test_requests_beyond_burst_are_spaced_by_rate(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        started = time.monotonic()
+        for _ in range(7):
+            await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class TestAdaptiveConcurrency(unittest.IsolatedAsyncioTestCase):
+    async def test_limit_grows_on_success_and_halves_on_failure(self):
+        concurrency = AdaptiveConcurrency(initial=4, maximum=5, target_latency=1)
+        for _ in range(8):
+            await concurrency.acquire()
+            await concurrency.release(latency=0.1)
+        self.assertGreater(concurrency.limit, 5 - 1)
+
+        await concurrency.acquire()
+        await concurrency.release(latency=0.1, failed=True)
+        self.assertLess(concurrency.limit, 3)
+
+        await concurrency.acquire()
+        await concurrency.release(latency=5)
+        self.assertLess(concurrency.limit, 1.5)
+
+    async def test_failures_of_requests_in_flight_together_halve_once(self):
+        concurrency = AdaptiveConcurrency(initial=8)
+        generations = [await concurrency.acquire() for _ in range(8)]
+        for generation in generations:
+            await concurrency.release(latency=0.1, failed=True, generation=generation)
+        self.assertEqual(concurrency.limit, 4)
+
+        generation = await concurrency.acquire()
+        await concurrency.release(latency=0.1, failed=True, generation=generation)
+        self.assertEqual(concurrency.limit, 2)
+
+    async def test_acquire_waits_for_a_free_slot(self):
+        concurrency = AdaptiveConcurrency(initial=1)
+        await concurrency.acquire()
+        waiter = asyncio.ensure_future(concurrency.acquire())
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        await concurrency.release(latency=0.1)
+        await asyncio.wait_for(waiter, 1)
+        self.assertEqual(concurrency.in_flight, 1)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_retry_after_is_honored_and_capped(self):
+        policy = RetryPolicy(max_delay=10)
+        self.assertEqual(policy.delay(1, "3"), 3)
+        self.assertEqual(policy.delay(1, "120"), 10)
+
+    def test_backoff_is_jittered_exponential(self):
+        policy = RetryPolicy(base_delay=1, max_delay=30)
+        for attempt in range(1, 8):
+            self.assertLessEqual(policy.delay(attempt), min(30, 2 ** (attempt - 1)))
+
+    def test_parse_retry_after_http_date(self):
+        later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+        delay = parse_retry_after(later)
+        assert delay is not None
+        self.assertAlmostEqual(delay, 60, delta=2)
+        self.assertIsNone(parse_retry_after("soon"))
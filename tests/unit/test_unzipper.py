@@ -0,0 +1,105 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import zipfile
+
+from src.utils.unzipper import Unzipper, extracted_members
+
+
+class TestUnzipper(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_folder = os.path.join(self.tmp.name, "samples")
+        self.output_folder = os.path.join(self.tmp.name, "unzipped")
+        os.makedirs(self.zip_folder)
+        for name in ["Kulintang", "Kudyapi", "Gangsa"]:
+            self.write_archive(name, {f"{name}/1.wav": b"one", f"{name}/2.wav": b"two"})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_archive(self, name: str, members: dict):
+        with zipfile.ZipFile(os.path.join(self.zip_folder, f"{name}.zip"), "w") as archive:
+            for member, data in members.items():
+                archive.writestr(member, data)
+
+    def test_parallel_extraction_writes_every_member(self):
+        Unzipper(self.zip_folder, self.output_folder, num_workers=3).unzip_files()
+
+        for name in ["Kulintang", "Kudyapi", "Gangsa"]:
+            with open(os.path.join(self.output_folder, name, name, "2.wav"), "rb") as f:
+                self.assertEqual(f.read(), b"two")
+
+    def test_rerun_skips_unchanged_archives_and_rewrites_changed_members(self):
+        Unzipper(self.zip_folder, self.output_folder).unzip_files()
+        self.write_archive("Gangsa", {"Gangsa/1.wav": b"one", "Gangsa/2.wav": b"new take"})
+
+        with patch("src.utils.unzipper.zipfile.ZipFile.extract", autospec=True) as mock_extract:
+            Unzipper(self.zip_folder, self.output_folder, num_workers=2).unzip_files()
+
+        extracted = [call.args[1].filename for call in mock_extract.call_args_list]
+        self.assertEqual(extracted, ["Gangsa/2.wav"])
+
+    def test_archives_of_one_instrument_are_extracted_side_by_side(self):
+        self.write_archive("Kulintang.1.audio", {"Kulintang/1.wav": b"first"})
+        self.write_archive("Kulintang.2.audio", {"Kulintang/1.wav": b"second"})
+
+        Unzipper(self.zip_folder, self.output_folder).unzip_files()
+
+        for archive, data in [("Kulintang.1.audio", b"first"), ("Kulintang.2.audio", b"second")]:
+            with open(os.path.join(self.output_folder, archive, "Kulintang", "1.wav"), "rb") as f:
+                self.assertEqual(f.read(), data)
+        members = [(name, member) for name, member, _ in extracted_members(self.output_folder)]
+        self.assertIn(("Kulintang", "Kulintang.1.audio/Kulintang/1.wav"), members)
+        self.assertIn(("Kulintang", "Kulintang.2.audio/Kulintang/1.wav"), members)
+
+    def test_bad_archive_is_not_recorded(self):
+        with open(os.path.join(self.zip_folder, "Broken.zip"), "wb") as f:
+            f.write(b"not a zip")
+
+        unzipper = Unzipper(self.zip_folder, self.output_folder)
+        unzipper.unzip_files()
+
+        self.assertNotIn(os.path.join(self.zip_folder, "Broken.zip"), unzipper.ledger)
+        self.assertEqual(len(unzipper.ledger), 3)
+
+
+class TestUnzipperPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_folder = os.path.join(self.tmp.name, "samples")
+        self.output_folder = os.path.join(self.tmp.name, "unzipped")
+        os.makedirs(self.zip_folder)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_submitted_archives_and_buffers_are_extracted(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("Kudyapi/1.wav", b"from memory")
+        zip_path = os.path.join(self.zip_folder, "Kulintang.zip")
+        with zipfile.ZipFile(zip_path, "w") as archive:
+            archive.writestr("Kulintang/1.wav", b"from disk")
+
+        with Unzipper(self.zip_folder, self.output_folder, num_workers=2) as unzipper:
+            unzipper.submit(zip_path)
+            unzipper.submit(os.path.join(self.zip_folder, "Kudyapi.zip"), buffer.getvalue())
+
+        self.assertFalse(os.path.exists(os.path.join(self.zip_folder, "Kudyapi.zip")))
+        with open(os.path.join(self.output_folder, "Kudyapi", "Kudyapi", "1.wav"), "rb") as f:
+            self.assertEqual(f.read(), b"from memory")
+        self.assertEqual(len(Unzipper(self.zip_folder, self.output_folder).ledger), 2)
+
+    def test_submitted_future_fails_when_the_archive_cannot_be_extracted(self):
+        with Unzipper(self.zip_folder, self.output_folder) as unzipper:
+            extracted = unzipper.submit(os.path.join(self.zip_folder, "Broken.zip"), b"not a zip")
+
+        self.assertIsInstance(extracted.exception(), RuntimeError)
+        self.assertEqual(Unzipper(self.zip_folder, self.output_folder).ledger, {})
+
+    def test_submit_requires_context_manager(self):
+        with self.assertRaises(RuntimeError):
+            Unzipper(self.zip_folder, self.output_folder).submit("missing.zip")
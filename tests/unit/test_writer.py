@@ -0,0 +1,53 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.katunog.writer import AsyncFileWriter
+
+
+class TestAsyncFileWriter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "archive.zip.part")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_small_chunks_are_coalesced_and_hashed(self):
+        digest = hashlib.sha256()
+        with patch.object(AsyncFileWriter, "_write", autospec=True, side_effect=AsyncFileWriter._write) as mock_write:
+            async with AsyncFileWriter(self.path, buffer_size=4096, digest=digest) as writer:
+                for _ in range(100):
+                    await writer.write(b"x" * 1024)
+
+        self.assertLessEqual(mock_write.call_count, 26)
+        self.assertEqual(writer.bytes_written, 100 * 1024)
+        self.assertEqual(digest.hexdigest(), hashlib.sha256(b"x" * 100 * 1024).hexdigest())
+        self.assertEqual(os.path.getsize(self.path), 100 * 1024)
+
+    async def test_append_writes_after_existing_bytes_and_trims_preallocation(self):
+        with open(self.path, "wb") as f:
+            f.write(b"head")
+
+        with self.assertRaises(ConnectionError):
+            async with AsyncFileWriter(self.path, append=True, buffer_size=1, preallocate=1000) as writer:
+                await writer.write(b"-tail")
+                raise ConnectionError("dropped")
+
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"head-tail")
+
+    async def test_flushed_progress_is_reported_once_on_disk(self):
+        flushed = []
+
+        def on_flushed(written: int):
+            with open(self.path, "rb") as f:
+                flushed.append((written, len(f.read())))
+
+        async with AsyncFileWriter(self.path, buffer_size=4, on_flushed=on_flushed) as writer:
+            await writer.write(b"abcd")
+            await writer.write(b"ef")
+
+        self.assertEqual(flushed, [(4, 4), (6, 6)])